@@ -25,9 +25,12 @@ from mobly import logger as mobly_logger
 from mobly import runtime_test_info
 from mobly import utils
 from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import device_tracker
 from mobly.controllers.android_device_lib import errors
 from mobly.controllers.android_device_lib import fastboot
 from mobly.controllers.android_device_lib import service_manager
+from mobly.controllers.android_device_lib import state_cache
+from mobly.controllers.android_device_lib.services import adb_metrics_service
 from mobly.controllers.android_device_lib.services import logcat
 from mobly.controllers.android_device_lib.services import snippet_management_service
 
@@ -62,6 +65,14 @@ CACHED_SYSTEM_PROPS = [
     'ro.hardware',
 ]
 
+# Seconds to cache facts about the state of a device for. Facts are dropped
+# from the cache when the device is rebooted, disconnected or switched to
+# root through `AndroidDevice`, so the TTLs only bound how long changes made
+# by other means can go unnoticed.
+_IS_BOOTLOADER_CACHE_TTL_SEC = 5
+_IS_ADB_ROOT_CACHE_TTL_SEC = 60
+_IS_ROOTABLE_CACHE_TTL_SEC = 60
+
 # Keys for attributes in configs that alternate the controller module behavior.
 # If this is False for a device, errors from that device will be ignored
 # during `create`. Default is True.
@@ -72,6 +83,7 @@ DEFAULT_VALUE_DEVICE_REQUIRED = True
 KEY_SKIP_LOGCAT = 'skip_logcat'
 DEFAULT_VALUE_SKIP_LOGCAT = False
 SERVICE_NAME_LOGCAT = 'logcat'
+SERVICE_NAME_ADB_METRICS = 'adb_metrics'
 
 # Default name for bug reports taken without a specified test name.
 DEFAULT_BUG_REPORT_NAME = 'bugreport'
@@ -79,6 +91,15 @@ DEFAULT_BUG_REPORT_NAME = 'bugreport'
 # Default Timeout to wait for boot completion
 DEFAULT_TIMEOUT_BOOT_COMPLETION_SECOND = 15 * 60
 
+# Interval of the checks of `sys.boot_completed` while waiting for boot
+# completion.
+_BOOT_COMPLETION_POLL_INTERVAL_SEC = 5
+
+# Whether to follow the devices of the adb server with a single
+# `host:track-devices` stream, see `device_tracker`. Device lookups and waits
+# for devices then read the tracked states instead of running adb.
+USE_DEVICE_TRACKER = False
+
 # Timeout for the adb command for taking a screenshot
 TAKE_SCREENSHOT_TIMEOUT_SECOND = 10
 
@@ -132,6 +153,7 @@ def destroy(ads):
   for ad in ads:
     try:
       ad.services.stop_all()
+      ad.adb.close_shell_session()
     except Exception:
       ad.log.exception('Failed to clean up properly.')
 
@@ -166,6 +188,11 @@ def _validate_device_existence(serials):
     serials: list of strings, the serials of all the devices that are expected
       to exist.
   """
+  tracker = _get_device_tracker()
+  if tracker is not None and all(
+      tracker.get_state(serial) == 'device' for serial in serials
+  ):
+    return
   valid_ad_identifiers = (
       list_adb_devices()
       + list_adb_devices_by_usb_id()
@@ -191,6 +218,7 @@ def _start_services_on_ads(ads):
   for ad in ads:
     start_logcat = not getattr(ad, KEY_SKIP_LOGCAT, DEFAULT_VALUE_SKIP_LOGCAT)
     try:
+      ad.services.adb_metrics.start()
       if start_logcat:
         ad.services.logcat.start()
     except Exception:
@@ -236,6 +264,19 @@ def parse_device_list(device_list_str, key=None):
   return results
 
 
+def _get_device_tracker():
+  """Returns the tracker of the adb devices if enabled and up to date.
+
+  Returns:
+    The DeviceTracker, or None if `USE_DEVICE_TRACKER` is False or the
+    tracker can not reach the adb server.
+  """
+  if not USE_DEVICE_TRACKER:
+    return None
+  tracker = device_tracker.get_tracker()
+  return tracker if tracker.is_tracking else None
+
+
 def list_adb_devices():
   """List all android devices connected to the computer that are detected by
   adb.
@@ -243,6 +284,11 @@ def list_adb_devices():
   Returns:
     A list of android device serials. Empty if there's none.
   """
+  tracker = _get_device_tracker()
+  if tracker is not None:
+    return [
+        serial for serial, state in tracker.devices.items() if state == 'device'
+    ]
   out = adb.AdbProxy().devices()
   return parse_device_list(out, 'device')
 
@@ -535,6 +581,7 @@ class AndroidDevice:
     )
     self._build_info = None
     self._is_rebooting = False
+    self._state_cache = state_cache.StateCache()
     self.adb = adb.AdbProxy(serial)
     self.fastboot = fastboot.FastbootProxy(serial)
     if self.is_rootable:
@@ -546,6 +593,11 @@ class AndroidDevice:
     self.services.register(
         'snippets', snippet_management_service.SnippetManagementService
     )
+    self.services.register(
+        SERVICE_NAME_ADB_METRICS,
+        adb_metrics_service.AdbMetricsService,
+        start_service=False,
+    )
     # Device info cache.
     self._user_added_device_info = {}
 
@@ -628,7 +680,7 @@ class AndroidDevice:
   def has_active_service(self):
     """True if any service is running on the device.
 
-    A service can be a snippet or logcat collection.
+    A service can be a snippet, logcat collection or adb metrics recording.
     """
     return self.services.is_any_alive
 
@@ -703,6 +755,7 @@ class AndroidDevice:
     self._serial = new_serial
     self.adb.serial = new_serial
     self.fastboot.serial = new_serial
+    self._invalidate_state_cache()
 
   @contextlib.contextmanager
   def handle_reboot(self):
@@ -717,6 +770,7 @@ class AndroidDevice:
     """
     live_service_names = self.services.list_live_services()
     self.services.stop_all()
+    self._invalidate_state_cache()
     # On rooted devices, system properties may change on reboot, so disable
     # the `build_info` cache by setting `_is_rebooting` to True and
     # repopulate it after reboot.
@@ -741,6 +795,7 @@ class AndroidDevice:
       # `build_info` cache is only minimizes adb commands.
       self._build_info = None
       self._is_rebooting = False
+      self._invalidate_state_cache()
       if self.is_rootable:
         self.root_adb()
     self.services.start_services(live_service_names)
@@ -794,11 +849,28 @@ class AndroidDevice:
     """
     live_service_names = self.services.list_live_services()
     self.services.pause_all()
+    self._invalidate_state_cache()
     try:
       yield
     finally:
+      self._invalidate_state_cache()
       self.services.resume_services(live_service_names)
 
+  def _get_cached_state(self, key, load, ttl_sec):
+    """Returns a cached fact about the state of the device.
+
+    Like the `build_info` cache, the cache is bypassed while the device is
+    rebooting.
+    """
+    if self._is_rebooting:
+      return load()
+    return self._state_cache.get(key, load, ttl_sec)
+
+  def _invalidate_state_cache(self):
+    """Drops all the cached facts about the state of the device."""
+    self._state_cache.invalidate()
+    self.adb.clear_state_cache()
+
   @property
   def build_info(self):
     """Gets the build info of this Android device, including build id and type.
@@ -825,12 +897,28 @@ class AndroidDevice:
 
   @property
   def is_bootloader(self):
-    """True if the device is in bootloader mode."""
-    return self.serial in list_fastboot_devices()
+    """True if the device is in bootloader mode.
+
+    The result is cached for a few seconds.
+    """
+    return self._get_cached_state(
+        'is_bootloader',
+        lambda: self.serial in list_fastboot_devices(),
+        _IS_BOOTLOADER_CACHE_TTL_SEC,
+    )
 
   @property
   def is_adb_root(self):
-    """True if adb is running as root for this device."""
+    """True if adb is running as root for this device.
+
+    The result is cached until adb is switched to root with `root_adb`, the
+    device is rebooted or disconnected, or for a minute at most.
+    """
+    return self._get_cached_state(
+        'is_adb_root', self._load_is_adb_root, _IS_ADB_ROOT_CACHE_TTL_SEC
+    )
+
+  def _load_is_adb_root(self):
     try:
       return '0' == self.adb.shell('id -u').decode('utf-8').strip()
     except adb.AdbError:
@@ -840,7 +928,16 @@ class AndroidDevice:
 
   @property
   def is_rootable(self):
-    return self.is_adb_detectable() and self.build_info['debuggable'] == '1'
+    """True if adb can be switched to root on this device.
+
+    The result is cached like `is_adb_root`.
+    """
+    return self._get_cached_state(
+        'is_rootable',
+        lambda: self.is_adb_detectable()
+        and self.build_info['debuggable'] == '1',
+        _IS_ROOTABLE_CACHE_TTL_SEC,
+    )
 
   @functools.cached_property
   def model(self):
@@ -912,10 +1009,14 @@ class AndroidDevice:
     If executed on a production build, adb will not be switched to root
     mode per security restrictions.
     """
-    self.adb.root()
-    # `root` causes the device to temporarily disappear from adb.
-    # So we need to wait for the device to come back before proceeding.
-    self.adb.wait_for_device(timeout=DEFAULT_TIMEOUT_BOOT_COMPLETION_SECOND)
+    self._invalidate_state_cache()
+    try:
+      self.adb.root()
+      # `root` causes the device to temporarily disappear from adb.
+      # So we need to wait for the device to come back before proceeding.
+      self._wait_for_device(DEFAULT_TIMEOUT_BOOT_COMPLETION_SECOND)
+    finally:
+      self._invalidate_state_cache()
 
   def load_snippet(self, name, package, config=None):
     """Starts the snippet apk with the given package name and connects.
@@ -1142,7 +1243,7 @@ class AndroidDevice:
     """
     deadline = time.perf_counter() + timeout
 
-    self.adb.wait_for_device(timeout=timeout)
+    self._wait_for_device(timeout)
     while time.perf_counter() < deadline:
       try:
         if self.is_boot_completed():
@@ -1151,9 +1252,41 @@ class AndroidDevice:
         # adb shell calls may fail during certain period of booting
         # process, which is normal. Ignoring these errors.
         pass
-      time.sleep(5)
+      tracker = _get_device_tracker()
+      if tracker is None:
+        time.sleep(_BOOT_COMPLETION_POLL_INTERVAL_SEC)
+        continue
+      remaining = max(deadline - time.perf_counter(), 0)
+      if tracker.get_state(self.serial) != 'device':
+        # No need to check while the device is offline.
+        tracker.wait_for_state(self.serial, timeout=remaining)
+      else:
+        # Checks right away if the device drops off in the meantime.
+        tracker.wait_for_change(
+            self.serial, min(_BOOT_COMPLETION_POLL_INTERVAL_SEC, remaining)
+        )
     raise DeviceError(self, 'Booting process timed out')
 
+  def _wait_for_device(self, timeout):
+    """Waits for the device to be online, like `adb wait-for-device`.
+
+    Args:
+      timeout: float, the number of seconds to wait before timing out.
+
+    Raises:
+      AdbTimeoutError: The device did not come online in time.
+    """
+    tracker = _get_device_tracker()
+    if tracker is None:
+      self.adb.wait_for_device(timeout=timeout)
+      return
+    if not tracker.wait_for_state(self.serial, timeout=timeout):
+      raise adb.AdbTimeoutError(
+          cmd=[adb.ADB, '-s', self.serial, 'wait-for-device'],
+          timeout=timeout,
+          serial=self.serial,
+      )
+
   def is_boot_completed(self):
     """Checks if device boot is completed by verifying system property."""
     completed = self.adb.getprop('sys.boot_completed')
@@ -12,13 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import dataclasses
+import io
 import logging
+import os
 import re
+import shlex
 import subprocess
 import threading
 import time
+import uuid
 
 from mobly import utils
+from mobly.controllers.android_device_lib import adb_metrics
+from mobly.controllers.android_device_lib import adb_shell_session
+from mobly.controllers.android_device_lib import adb_socket
+from mobly.controllers.android_device_lib import state_cache
 
 # Command to use for running ADB commands.
 ADB = 'adb'
@@ -44,6 +53,37 @@ DEFAULT_GETPROP_TIMEOUT_SEC = 10
 DEFAULT_GETPROPS_ATTEMPTS = 3
 DEFAULT_GETPROPS_RETRY_SLEEP_SEC = 1
 
+# Whether `AdbProxy` objects talk to the adb server directly over its socket
+# protocol by default, instead of running the adb binary for every command.
+# See `AdbProxy` for the commands supported.
+USE_SERVER_PROTOCOL = False
+
+# Whether `AdbProxy` objects run short shell commands in a long-lived shell
+# session per device by default, instead of one `adb shell` per command.
+USE_SHELL_SESSION = False
+
+# Shell commands longer than this are not run in the shell session.
+_SHELL_SESSION_MAX_COMMAND_LENGTH = 1024
+
+# Shell commands that stream output or run for long are not run in the shell
+# session, as they would hold up the commands queued behind them.
+_SHELL_SESSION_EXCLUDED_PREFIXES = (
+    'am instrument',
+    'logcat',
+    'monkey',
+    'screenrecord',
+    'top',
+    'uiautomator',
+)
+
+# Seconds to wait after a shell session failed to start before starting a new
+# one, so that an unreachable device does not double the cost of commands.
+_SHELL_SESSION_RETRY_INTERVAL_SEC = 10
+
+# Seconds to cache the current user ID of a device for. Users are rarely
+# switched during a test.
+_CURRENT_USER_ID_CACHE_TTL_SEC = 30
+
 # The regex pattern indicating the `adb connect` command did not fail.
 PATTERN_ADB_CONNECT_SUCCESS = re.compile(
     r'^connected to .*|^already connected to .*'
@@ -84,6 +124,22 @@ class AdbError(Error):
     )
 
 
+@dataclasses.dataclass(frozen=True)
+class ShellResult:
+  """The result of one command of `AdbProxy.shell_batch`.
+
+  Attributes:
+    stdout: byte string, the raw stdout of the command.
+    stderr: byte string, the raw stderr of the command. Empty on devices
+      without the shell protocol v2, where stderr is part of stdout.
+    ret_code: int, the exit code of the command.
+  """
+
+  stdout: bytes
+  stderr: bytes
+  ret_code: int
+
+
 class AdbTimeoutError(Error):
   """Raised when an command did not complete within expected time.
 
@@ -164,10 +220,51 @@ class AdbProxy:
   If you really want to run the command through the system shell, this is
   possible by supplying shell=True, but try to avoid this if possible:
   >> adb.shell('cat /foo > /tmp/file', shell=True)
+
+  With `use_server_protocol`, the `shell`, `exec-out`, `devices`,
+  `get-state`, `forward`, and single file `push` and `pull` commands are sent
+  to the adb server over its socket, which saves forking an adb process per
+  command. Other commands, commands run through the system shell, and all
+  commands while the adb server is not reachable, still run the adb binary.
+
+  With `use_shell_session`, short shell commands given as a list of args run
+  in a long-lived shell on the device, see `adb_shell_session`. If the
+  session can not be started or has ended, the commands run with the adb
+  binary. Commands that stream output or run for long, like `logcat`, and
+  commands run through the system shell never use the session.
   """
 
-  def __init__(self, serial=''):
+  # Set on the class too, as `__getattr__` handles any missing attribute.
+  _socket_client = None
+  _shell_session_enabled = False
+
+  def __init__(
+      self, serial='', use_server_protocol=None, use_shell_session=None
+  ):
+    """Initializes the proxy.
+
+    Args:
+      serial: string, the serial of the device, empty for commands that are
+        not specific to a device.
+      use_server_protocol: bool, whether to talk to the adb server over its
+        socket where possible. Defaults to `USE_SERVER_PROTOCOL`.
+      use_shell_session: bool, whether to run short shell commands in a
+        long-lived shell session. Defaults to `USE_SHELL_SESSION`.
+    """
     self.serial = serial
+    if use_server_protocol is None:
+      use_server_protocol = USE_SERVER_PROTOCOL
+    if use_server_protocol:
+      self._socket_client = adb_socket.AdbSocketClient()
+    if use_shell_session is None:
+      use_shell_session = USE_SHELL_SESSION
+    self._shell_session_enabled = bool(use_shell_session and serial)
+    self._shell_session = None
+    self._shell_session_serial = None
+    self._shell_session_lock = threading.Lock()
+    # Time of the last failure to start a shell session.
+    self._shell_session_failure_time = None
+    self._state_cache = state_cache.StateCache()
 
   def _exec_cmd(self, args, shell, timeout, stderr) -> bytes:
     """Executes adb commands.
@@ -192,10 +289,13 @@ class AdbProxy:
     """
     if timeout and timeout <= 0:
       raise ValueError('Timeout is not a positive value: %s' % timeout)
+    start_time = time.monotonic()
     try:
-      (ret, out, err) = utils.run_command(args, shell=shell, timeout=timeout)
+      ret, out, err = utils.run_command(args, shell=shell, timeout=timeout)
     except subprocess.TimeoutExpired:
+      self._record_cmd(args, start_time)
       raise AdbTimeoutError(cmd=args, timeout=timeout, serial=self.serial)
+    self._record_cmd(args, start_time, ret, len(out) + len(err))
 
     if stderr:
       stderr.write(err)
@@ -222,6 +322,7 @@ class AdbProxy:
     Raises:
       AdbError: The adb command exit code is not 0.
     """
+    start_time = time.monotonic()
     proc = subprocess.Popen(
         args,
         stdout=subprocess.PIPE,
@@ -230,24 +331,28 @@ class AdbProxy:
         bufsize=1,
     )
     out = '[elided, processed via handler]'
+    bytes_received = 0
     try:
       # Even if the process dies, stdout.readline still works
       # and will continue until it runs out of stdout to process.
       while True:
         line = proc.stdout.readline()
         if line:
+          bytes_received += len(line)
           handler(line)
         else:
           break
     finally:
       # Note, communicate will not contain any buffered output.
-      (unexpected_out, err) = proc.communicate()
+      unexpected_out, err = proc.communicate()
       if unexpected_out:
         out = '[unexpected stdout] %s' % unexpected_out
+        bytes_received += len(unexpected_out)
         for line in unexpected_out.splitlines():
           handler(line)
 
     ret = proc.returncode
+    self._record_cmd(args, start_time, ret, bytes_received + len(err))
     logging.debug(
         'cmd: %s, stdout: %s, stderr: %s, ret: %s',
         utils.cli_cmd_to_string(args),
@@ -260,6 +365,23 @@ class AdbProxy:
     else:
       raise AdbError(cmd=args, stdout=out, stderr=err, ret_code=ret)
 
+  def _record_cmd(self, args, start_time, ret_code=None, bytes_received=0):
+    """Records a call of an adb command in `adb_metrics`.
+
+    Args:
+      args: string or list of strings, the adb command run.
+      start_time: float, the `time.monotonic()` time the call started at.
+      ret_code: int, the exit code of the call, None if it timed out.
+      bytes_received: int, the number of bytes of stdout and stderr.
+    """
+    adb_metrics.get_metrics().record(
+        self.serial,
+        args,
+        time.monotonic() - start_time,
+        ret_code,
+        bytes_received,
+    )
+
   def _construct_adb_cmd(self, raw_name, args, shell):
     """Constructs an adb command with arguments for a subprocess call.
 
@@ -299,10 +421,249 @@ class AdbProxy:
     return adb_cmd
 
   def _exec_adb_cmd(self, name, args, shell, timeout, stderr) -> bytes:
+    if self._shell_session_enabled and name == 'shell' and not shell:
+      out = self._exec_session_cmd(args, timeout, stderr)
+      if out is not None:
+        return out
+    if self._socket_client is not None and not shell:
+      out = self._exec_socket_cmd(name, args, timeout, stderr)
+      if out is not None:
+        return out
     adb_cmd = self._construct_adb_cmd(name, args, shell=shell)
     out = self._exec_cmd(adb_cmd, shell=shell, timeout=timeout, stderr=stderr)
     return out
 
+  def _exec_socket_cmd(self, name, args, timeout, stderr):
+    """Executes an adb command by talking to the adb server directly.
+
+    Args:
+      name: string, the raw unsanitized name of the adb command.
+      args: string or list of strings, arguments to the adb command.
+      timeout: float, the number of seconds to wait before timing out.
+        If not specified, no timeout takes effect.
+      stderr: a Byte stream, like io.BytesIO, stderr of the command will
+        be written to this object if provided.
+
+    Returns:
+      The output of the adb command if its exit code is 0, or None if the
+      command is not supported over the socket or the adb server is not
+      reachable, in which case it has to be run with the adb binary.
+
+    Raises:
+      ValueError: timeout value is invalid.
+      AdbError: The adb command exit code is not 0.
+      AdbTimeoutError: The adb command timed out.
+    """
+    if timeout and timeout <= 0:
+      raise ValueError('Timeout is not a positive value: %s' % timeout)
+    request = self._socket_request(name.replace('_', '-'), args, timeout)
+    if request is None:
+      return None
+    adb_cmd = self._construct_adb_cmd(name, args, shell=False)
+    ret, out, err = 1, b'', b''
+    start_time = time.monotonic()
+    try:
+      result = request()
+    except adb_socket.ServerUnavailableError as e:
+      logging.debug('Running adb binary, %s', e)
+      return None
+    except TimeoutError:
+      self._record_cmd(adb_cmd, start_time)
+      raise AdbTimeoutError(cmd=adb_cmd, timeout=timeout, serial=self.serial)
+    except adb_socket.RequestFailedError as e:
+      result = 1, b'', ('error: %s\n' % e.message).encode('utf-8')
+    except (adb_socket.Error, OSError) as e:
+      result = None
+      err = ('error: %s\n' % e).encode('utf-8')
+    else:
+      if result is None:
+        logging.debug('Running adb binary, not supported over the socket.')
+        return None
+    if result is not None:
+      ret, out, err = result
+      logging.debug(
+          'cmd: %s, stdout: %s, stderr: %s, ret: %s',
+          utils.cli_cmd_to_string(adb_cmd),
+          out,
+          err,
+          ret,
+      )
+    self._record_cmd(adb_cmd, start_time, ret, len(out) + len(err))
+    if stderr:
+      stderr.write(err)
+    if ret == 0:
+      return out
+    raise AdbError(
+        cmd=adb_cmd, stdout=out, stderr=err, ret_code=ret, serial=self.serial
+    )
+
+  def _exec_session_cmd(self, args, timeout, stderr):
+    """Executes a shell command in the shell session of the device.
+
+    Args:
+      args: string or list of strings, arguments to `adb shell`.
+      timeout: float, the number of seconds to wait before timing out.
+        If not specified, no timeout takes effect.
+      stderr: a Byte stream, like io.BytesIO, stderr of the command will
+        be written to this object if provided.
+
+    Returns:
+      The output of the command if its exit code is 0, or None if the
+      command is not suited for the session or the session is not running,
+      in which case it has to be run with the adb binary.
+
+    Raises:
+      ValueError: timeout value is invalid.
+      AdbError: The command exit code is not 0, or the session ended before
+        the command completed.
+      AdbTimeoutError: The command timed out.
+    """
+    if timeout and timeout <= 0:
+      raise ValueError('Timeout is not a positive value: %s' % timeout)
+    if isinstance(args, str):
+      args = [args] if args else []
+    # Like the adb binary, arguments are joined without quoting.
+    command = ' '.join(str(arg) for arg in args or [])
+    if (
+        not command.strip()
+        or len(command) > _SHELL_SESSION_MAX_COMMAND_LENGTH
+        or command.lstrip().startswith(_SHELL_SESSION_EXCLUDED_PREFIXES)
+    ):
+      return None
+    session = self._get_shell_session()
+    if session is None:
+      return None
+    adb_cmd = self._construct_adb_cmd('shell', args, shell=False)
+    ret, out, err = 1, b'', b''
+    start_time = time.monotonic()
+    try:
+      ret, out, err = session.run(command, timeout)
+    except adb_shell_session.SessionUnavailableError as e:
+      logging.debug('Running adb binary, %s', e)
+      return None
+    except TimeoutError:
+      self._record_cmd(adb_cmd, start_time)
+      raise AdbTimeoutError(cmd=adb_cmd, timeout=timeout, serial=self.serial)
+    except adb_shell_session.SessionLostError as e:
+      # Like the adb binary when the connection to the device is lost.
+      ret, err = 255, ('error: %s\n' % e).encode('utf-8')
+    finally:
+      logging.debug(
+          'cmd: %s, stdout: %s, stderr: %s, ret: %s',
+          utils.cli_cmd_to_string(adb_cmd),
+          out,
+          err,
+          ret,
+      )
+    self._record_cmd(adb_cmd, start_time, ret, len(out) + len(err))
+    if stderr:
+      stderr.write(err)
+    if ret == 0:
+      return out
+    raise AdbError(
+        cmd=adb_cmd, stdout=out, stderr=err, ret_code=ret, serial=self.serial
+    )
+
+  def _get_shell_session(self):
+    """Returns the running shell session, starting one if needed.
+
+    Returns:
+      The shell session, or None if it could not be started.
+    """
+    with self._shell_session_lock:
+      session = self._shell_session
+      # The serial changes when a device is switched to a network connection.
+      if session is not None and session.is_alive:
+        if self._shell_session_serial == self.serial:
+          return session
+      self._shell_session = None
+      if session is not None:
+        session.close()
+      failure_time = self._shell_session_failure_time
+      if (
+          failure_time is not None
+          and time.monotonic() - failure_time
+          < _SHELL_SESSION_RETRY_INTERVAL_SEC
+      ):
+        return None
+      session = adb_shell_session.ShellSession(
+          self._construct_adb_cmd('shell', None, shell=False)
+      )
+      try:
+        session.start()
+      except (adb_shell_session.Error, TimeoutError, OSError) as e:
+        logging.debug(
+            'Failed to start a shell session on %s: %s', self.serial, e
+        )
+        self._shell_session_failure_time = time.monotonic()
+        return None
+      self._shell_session_failure_time = None
+      self._shell_session = session
+      self._shell_session_serial = self.serial
+      return session
+
+  def close_shell_session(self):
+    """Ends the shell session of the device, if one is running.
+
+    A new session is started by the next shell command run in one.
+    """
+    if not self._shell_session_enabled:
+      return
+    with self._shell_session_lock:
+      session, self._shell_session = self._shell_session, None
+      self._shell_session_failure_time = None
+    if session is not None:
+      session.close()
+
+  def _socket_request(self, name, args, timeout):
+    """Maps an adb command to a request of the adb socket client.
+
+    Returns:
+      A function returning the exit code, stdout and stderr of the command,
+      or None if the command is not supported over the socket. The function
+      returns None itself if the command turns out not to be supported once
+      sent, e.g. when pulling a directory.
+    """
+    client = self._socket_client
+    serial = self.serial
+    if isinstance(args, str):
+      args = [args] if args else []
+    args = [str(arg) for arg in args or []]
+
+    def output(func, *func_args):
+      return lambda: (0, func(*func_args), b'')
+
+    if name == 'shell' and args:
+      # Like the adb binary, arguments are joined without quoting.
+      return lambda: client.shell(serial, ' '.join(args), timeout)
+    if name == 'exec-out' and args:
+      return output(client.exec_out, serial, ' '.join(args), timeout)
+    if name == 'devices' and args in ([], ['-l']):
+      return output(client.devices, bool(args))
+    if name == 'get-state' and not args:
+      return output(client.get_state, serial)
+    if name == 'forward':
+      if args == ['--list']:
+        return output(client.list_forward, serial)
+      if args == ['--remove-all']:
+        return output(client.kill_forward, serial)
+      if len(args) == 2 and args[0] == '--remove':
+        return output(client.kill_forward, serial, args[1])
+      if len(args) == 3 and args[0] == '--no-rebind':
+        return output(client.forward, serial, args[1], args[2], True)
+      if len(args) == 2 and not args[0].startswith('-'):
+        return output(client.forward, serial, args[0], args[1])
+    if name == 'push' and len(args) == 2 and os.path.isfile(args[0]):
+      return output(client.push, serial, args[0], args[1], timeout)
+    if name == 'pull' and len(args) == 2 and not args[0].startswith('-'):
+
+      def pull():
+        out = client.pull(serial, args[0], args[1], timeout)
+        return None if out is None else (0, out, b'')
+
+      return pull
+    return None
+
   def _execute_adb_and_process_stdout(
       self, name, args, shell, handler
   ) -> bytes:
@@ -347,7 +708,16 @@ class AdbProxy:
     Note a "user" is not the same as an "account" in Android. See AOSP's
     documentation for details.
     https://source.android.com/devices/tech/admin/multi-user
+
+    The ID is cached for a short time, see `clear_state_cache`.
     """
+    return self._state_cache.get(
+        'current_user_id',
+        self._get_current_user_id,
+        _CURRENT_USER_ID_CACHE_TTL_SEC,
+    )
+
+  def _get_current_user_id(self) -> int:
     sdk_int = int(self.getprop('ro.build.version.sdk'))
     if sdk_int >= 24:
       return int(self.shell(['am', 'get-current-user']))
@@ -357,6 +727,13 @@ class AdbProxy:
     # Multi-user is not supported in SDK < 21, only user 0 exists.
     return 0
 
+  def clear_state_cache(self):
+    """Drops the cached facts about the device, like `current_user_id`.
+
+    Call this after switching the user of the device.
+    """
+    self._state_cache.invalidate()
+
   def connect(self, address) -> bytes:
     """Executes the `adb connect` command with proper status checking.
 
@@ -446,6 +823,78 @@ class AdbProxy:
       # an exit code > 1.
       return False
 
+  def shell_batch(self, commands, timeout=None) -> list[ShellResult]:
+    """Runs several shell commands in a single `adb shell` invocation.
+
+    The commands run one after the other, each in its own subshell, so a
+    failing command does not stop the next ones. The output of each command
+    is framed by a unique marker printed after it, with its exit code.
+
+    Example:
+
+    .. code-block:: python
+
+      results = ad.adb.shell_batch(['id -u', 'getprop ro.serialno'])
+      uid = int(results[0].stdout)
+
+    Args:
+      commands: list of strings, the shell commands.
+      timeout: float, the number of seconds to wait for all the commands.
+        If not specified, no timeout takes effect.
+
+    Returns:
+      A list of ShellResult, one per command, in order.
+
+    Raises:
+      AdbError: The adb command failed, or ended before all the commands
+        completed.
+      AdbTimeoutError: The commands did not complete in time.
+    """
+    if not commands:
+      return []
+    marker = 'mobly_batch_%s' % uuid.uuid4().hex
+    lines = []
+    for i, command in enumerate(commands):
+      lines.append(
+          f"(eval {shlex.quote(command)}) </dev/null; printf '%s %d %d\\n' "
+          f"{marker} {i} $?; printf '%s %d\\n' {marker} {i} >&2"
+      )
+    script = '\n'.join(lines)
+    err_stream = io.BytesIO()
+    out = self._exec_adb_cmd(
+        'shell', [script], shell=False, timeout=timeout, stderr=err_stream
+    )
+    err = err_stream.getvalue()
+    marker = re.escape(marker.encode('utf-8'))
+    err_pattern = re.compile(marker + rb' (\d+)\n')
+    # Without the shell protocol v2, the markers of stderr end up in stdout.
+    out = err_pattern.sub(b'', out)
+    stdouts, ret_codes = [], []
+    begin = 0
+    for match in re.finditer(marker + rb' (\d+) (\d+)\n', out):
+      stdouts.append(out[begin : match.start()])
+      ret_codes.append(int(match.group(2)))
+      begin = match.end()
+    stderrs = []
+    begin = 0
+    for match in err_pattern.finditer(err):
+      stderrs.append(err[begin : match.start()])
+      begin = match.end()
+    if len(stdouts) < len(commands):
+      # Like the adb binary when the connection to the device is lost.
+      raise AdbError(
+          cmd=self._construct_adb_cmd('shell', [script], shell=False),
+          stdout=out,
+          stderr=err,
+          ret_code=255,
+          serial=self.serial,
+      )
+    stderrs += [b''] * (len(commands) - len(stderrs))
+    return [
+        ShellResult(stdout=stdout, stderr=stderr, ret_code=ret_code)
+        for stdout, stderr, ret_code in zip(stdouts, stderrs, ret_codes)
+    ]
+
   def forward(self, args=None, shell=False) -> bytes:
     with ADB_PORT_LOCK:
       return self._exec_adb_cmd(
@@ -539,6 +988,9 @@ class AdbProxy:
       AdbError: If the command exit code is not 0.
       AdbTimeoutError: If the command timed out.
     """
+    # Restarting adbd as root ends the shell session, which would run
+    # commands as the previous user until then.
+    self.close_shell_session()
     retry_interval = ADB_ROOT_RETRY_ATTEMPT_INTERVAL_SEC
     for attempt in range(ADB_ROOT_RETRY_ATTEMPTS):
       try:
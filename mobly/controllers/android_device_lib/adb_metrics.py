@@ -0,0 +1,223 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Latency and failure counters of the adb commands run, per device.
+
+Every adb command run by `AdbProxy` or `AsyncAdbProxy` on a device whose
+recording is enabled, see `AdbMetricsService`, is recorded here, whether it
+ran with the adb binary, over the socket of the adb server or in a shell
+session. Commands are grouped by device and by name, e.g. `install` or
+`shell getprop`, so the time a test spent in adb can be broken down.
+"""
+
+import collections
+import dataclasses
+import shlex
+import threading
+from typing import Optional
+
+# adb commands whose name is followed by the program run on the device.
+_PROGRAM_COMMANDS = ('shell', 'exec-out')
+
+
+@dataclasses.dataclass
+class CommandStats:
+  """Counters of the calls of one adb command on one device.
+
+  Attributes:
+    calls: Number of calls, including failed ones.
+    errors: Number of calls that exited with a non-zero code.
+    timeouts: Number of calls that timed out.
+    total_sec: Total wall time of the calls, in seconds.
+    max_sec: Wall time of the slowest call, in seconds.
+    bytes_sent: Number of bytes of the command lines of the calls.
+    bytes_received: Number of bytes of stdout and stderr of the calls.
+    exit_codes: Number of calls per exit code, timeouts excluded.
+    latency_histogram: Number of calls per wall time. Keys are the lowest
+      number of milliseconds of each bucket, i.e. 0, 1, 2, 4, 8 and so on.
+  """
+
+  calls: int = 0
+  errors: int = 0
+  timeouts: int = 0
+  total_sec: float = 0.0
+  max_sec: float = 0.0
+  bytes_sent: int = 0
+  bytes_received: int = 0
+  exit_codes: dict[int, int] = dataclasses.field(default_factory=dict)
+  latency_histogram: dict[int, int] = dataclasses.field(default_factory=dict)
+
+
+class AdbMetrics:
+  """Thread-safe counters of adb commands, by device serial and name.
+
+  Only the commands of devices whose recording is enabled are counted, so
+  that no counters pile up for devices nobody reads them for.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats: dict[str, dict[str, CommandStats]] = collections.defaultdict(
+        dict
+    )
+    # Number of times the recording of each device was enabled and not yet
+    # disabled.
+    self._enabled: collections.Counter[str] = collections.Counter()
+
+  def enable(self, serial: str) -> None:
+    """Starts recording the commands of a device.
+
+    Recording stops once `disable` was called as many times as `enable`.
+    """
+    with self._lock:
+      self._enabled[serial] += 1
+
+  def disable(self, serial: str) -> None:
+    """Stops recording the commands of a device.
+
+    The counters recorded so far are kept until they are taken.
+    """
+    with self._lock:
+      self._enabled[serial] -= 1
+      if self._enabled[serial] <= 0:
+        del self._enabled[serial]
+
+  def is_enabled(self, serial: str) -> bool:
+    """Whether the commands of a device are recorded."""
+    with self._lock:
+      return serial in self._enabled
+
+  def record(
+      self,
+      serial: str,
+      args,
+      duration_sec: float,
+      ret_code: Optional[int] = None,
+      bytes_received: int = 0,
+  ) -> None:
+    """Records one call of an adb command, if its device is recorded.
+
+    Args:
+      serial: string, the serial of the device, empty for commands that are
+        not specific to a device.
+      args: string or list of strings, the adb command run, starting with
+        the adb binary.
+      duration_sec: float, the wall time of the call, in seconds.
+      ret_code: int, the exit code of the call, None if it timed out.
+      bytes_received: int, the number of bytes of stdout and stderr.
+    """
+    if serial not in self._enabled:
+      return
+    name = command_name(args)
+    bytes_sent = len(_args_to_string(args).encode('utf-8'))
+    milliseconds = int(duration_sec * 1000)
+    with self._lock:
+      if serial not in self._enabled:
+        return
+      stats = self._stats[serial].get(name)
+      if stats is None:
+        stats = self._stats[serial][name] = CommandStats()
+      stats.calls += 1
+      if ret_code is None:
+        stats.timeouts += 1
+      else:
+        stats.exit_codes[ret_code] = stats.exit_codes.get(ret_code, 0) + 1
+        if ret_code != 0:
+          stats.errors += 1
+      stats.total_sec += duration_sec
+      stats.max_sec = max(stats.max_sec, duration_sec)
+      stats.bytes_sent += bytes_sent
+      stats.bytes_received += bytes_received
+      bucket = _latency_bucket(milliseconds)
+      stats.latency_histogram[bucket] = (
+          stats.latency_histogram.get(bucket, 0) + 1
+      )
+
+  def snapshot(self, serial: str) -> dict[str, CommandStats]:
+    """Returns a copy of the counters of a device, by command name."""
+    with self._lock:
+      return {
+          name: _copy_stats(stats)
+          for name, stats in self._stats.get(serial, {}).items()
+      }
+
+  def take(self, serial: str) -> dict[str, CommandStats]:
+    """Returns the counters of a device, by command name, and resets them.
+
+    Taking the counters at the end of each test gives the commands run by
+    each test.
+    """
+    with self._lock:
+      return self._stats.pop(serial, {})
+
+  def reset(self) -> None:
+    """Resets the counters of all devices."""
+    with self._lock:
+      self._stats.clear()
+
+
+def command_name(args) -> str:
+  """Returns the name an adb command is recorded under.
+
+  The name is the adb command, e.g. `install`, followed by the program run
+  on the device for `shell` and `exec-out`, e.g. `shell getprop`.
+
+  Args:
+    args: string or list of strings, the adb command, starting with the adb
+      binary.
+  """
+  if isinstance(args, str):
+    try:
+      args = shlex.split(args)
+    except ValueError:
+      args = args.split()
+  args = [str(arg) for arg in args[1:]]
+  if args[:1] == ['-s']:
+    args = args[2:]
+  if not args:
+    return ''
+  name = args[0]
+  if name in _PROGRAM_COMMANDS and len(args) > 1:
+    program = args[1].split()
+    if program:
+      return '%s %s' % (name, program[0])
+  return name
+
+
+def _args_to_string(args) -> str:
+  if isinstance(args, str):
+    return args
+  return ' '.join(str(arg) for arg in args)
+
+
+def _latency_bucket(milliseconds: int) -> int:
+  """Returns the histogram bucket of a number of milliseconds."""
+  if milliseconds <= 0:
+    return 0
+  return 1 << (milliseconds.bit_length() - 1)
+
+
+def _copy_stats(stats: CommandStats) -> CommandStats:
+  return dataclasses.replace(
+      stats,
+      exit_codes=dict(stats.exit_codes),
+      latency_histogram=dict(stats.latency_histogram),
+  )
+
+
+_metrics = AdbMetrics()
+
+
+def get_metrics() -> AdbMetrics:
+  """Returns the counters of the adb commands run by the whole process."""
+  return _metrics
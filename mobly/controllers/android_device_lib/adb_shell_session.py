@@ -0,0 +1,292 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A long-lived adb shell that runs many commands, one after the other.
+
+Every `adb shell <command>` forks an adb process and opens a new connection
+to the device. A session instead keeps one `adb shell` running and writes
+commands to its stdin. Each command is followed by printing a unique
+sentinel, with the exit code, to stdout and to stderr, which frames its
+output::
+
+  (eval 'getprop ro.serialno') </dev/null
+  printf '%s %d\\n' <sentinel> $?; printf '%s\\n' <sentinel> >&2
+
+Commands run in a subshell without stdin, so they can not change the state
+of the session or consume the commands written after them. Commands can be
+written while earlier ones still run, their results are returned in order.
+"""
+
+import collections
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from typing import Optional, Sequence
+
+# Size of the reads of the output of the shell.
+_READ_SIZE = 64 * 1024
+
+# Longest time to wait for a new session to answer.
+_START_TIMEOUT_SEC = 10
+
+# Longest time to wait for an idle session to exit when closed.
+_EXIT_TIMEOUT_SEC = 1
+
+
+class Error(Exception):
+  """Base error type for shell sessions."""
+
+
+class SessionUnavailableError(Error):
+  """Raised when a command could not be sent, because the session ended.
+
+  The command did not run, so it can safely be run by other means.
+  """
+
+
+class SessionLostError(Error):
+  """Raised when the session ended before a command sent to it completed.
+
+  Whether the command ran, and how far, is unknown.
+  """
+
+
+def _sentinel() -> bytes:
+  return b'__mobly_%s__' % uuid.uuid4().hex.encode('ascii')
+
+
+class ShellSession:
+  """Runs shell commands on a device through one long-lived `adb shell`.
+
+  The session can be shared between threads. Timeouts raise `TimeoutError`
+  and end the session, as the shell is left busy with the command.
+
+  On devices without the shell protocol v2, adb merges stderr into stdout.
+  The session detects this when started, then reports the stderr of
+  commands as part of their stdout, like the adb binary does.
+  """
+
+  def __init__(self, cmd: Sequence[str]):
+    """Initializes the session.
+
+    Args:
+      cmd: list of strings, the command starting the shell, e.g.
+        `['adb', '-s', <serial>, 'shell']`.
+    """
+    self._cmd = list(cmd)
+    self._proc: Optional[subprocess.Popen] = None
+    self._closed = False
+    self._merged_stderr = False
+    self._stdout = bytearray()
+    self._stderr = bytearray()
+    # Sentinels of the commands sent and not yet returned, in order.
+    self._pending: collections.deque[bytes] = collections.deque()
+    # Held while writing to the shell, so that the order of `_pending` is the
+    # order of the commands in the shell.
+    self._write_lock = threading.Lock()
+    self._condition = threading.Condition()
+
+  @property
+  def is_alive(self) -> bool:
+    """True if the session is started and can run commands."""
+    return (
+        self._proc is not None
+        and not self._closed
+        and self._proc.poll() is None
+    )
+
+  def start(self, timeout: float = _START_TIMEOUT_SEC) -> None:
+    """Starts the shell and waits for it to answer.
+
+    Raises:
+      OSError: The adb binary could not be run.
+      SessionUnavailableError: The shell exited right away, e.g. because the
+        device is not connected.
+      TimeoutError: The shell did not answer in time.
+    """
+    self._proc = subprocess.Popen(
+        self._cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    for stream, buffer in (
+        (self._proc.stdout, self._stdout),
+        (self._proc.stderr, self._stderr),
+    ):
+      threading.Thread(
+          target=self._read, args=(stream, buffer), daemon=True
+      ).start()
+    # Finds out which stream the stderr of commands arrives on.
+    sentinel = _sentinel()
+    line = b"printf '%%s\\n' %s >&2\n" % sentinel
+    try:
+      self._write(line)
+    except (OSError, ValueError) as e:
+      self.close()
+      raise SessionUnavailableError(f'Failed to start {self._cmd}: {e}') from e
+    marker = sentinel + b'\n'
+    with self._condition:
+      answered = self._condition.wait_for(
+          lambda: self._closed
+          or marker in self._stdout
+          or marker in self._stderr,
+          timeout,
+      )
+      if answered and not self._closed:
+        self._merged_stderr = marker in self._stdout
+        buffer = self._stdout if self._merged_stderr else self._stderr
+        del buffer[: buffer.find(marker) + len(marker)]
+        return
+    self.close()
+    if not answered:
+      raise TimeoutError(f'{self._cmd} did not answer in {timeout}s.')
+    raise SessionUnavailableError(f'{self._cmd} exited right away.')
+
+  def _write(self, data: bytes) -> None:
+    self._proc.stdin.write(data)
+    self._proc.stdin.flush()
+
+  def _read(self, stream, buffer: bytearray) -> None:
+    """Appends the output of a stream of the shell to a buffer until EOF.
+
+    The session ends with its stdout. Its stderr may be closed earlier.
+    """
+    while True:
+      try:
+        data = os.read(stream.fileno(), _READ_SIZE)
+      except OSError:
+        data = b''
+      with self._condition:
+        if not data:
+          stream.close()
+          if stream is self._proc.stdout:
+            self._closed = True
+          self._condition.notify_all()
+          return
+        buffer += data
+        self._condition.notify_all()
+
+  def run(
+      self, command: str, timeout: Optional[float] = None
+  ) -> tuple[int, bytes, bytes]:
+    """Runs a shell command in the session.
+
+    Args:
+      command: string, the shell command.
+      timeout: float, the number of seconds to wait for the command, not
+        counting the time spent waiting for earlier commands. If not
+        specified, no timeout takes effect.
+
+    Returns:
+      The exit code, the stdout and the stderr of the command.
+
+    Raises:
+      SessionUnavailableError: The session ended before the command was sent.
+      SessionLostError: The session ended before the command completed.
+      TimeoutError: The command did not complete in time.
+    """
+    sentinel = _sentinel()
+    line = b"(eval %s) </dev/null; printf '%%s %%d\\n' %s $?; " % (
+        shlex.quote(command).encode('utf-8'),
+        sentinel,
+    )
+    line += b"printf '%%s\\n' %s >&2\n" % sentinel
+    with self._write_lock:
+      if not self.is_alive:
+        raise SessionUnavailableError('The shell session is not running.')
+      with self._condition:
+        self._pending.append(sentinel)
+      try:
+        self._write(line)
+      except (OSError, ValueError) as e:
+        with self._condition:
+          self._pending.remove(sentinel)
+        self.close()
+        raise SessionUnavailableError(f'The shell session ended: {e}') from e
+
+    exit_pattern = re.compile(re.escape(sentinel) + rb' (\d+)\n')
+    err_marker = sentinel + b'\n'
+    with self._condition:
+      # Earlier commands have to take their output first, the output of this
+      # one starts where theirs ends.
+      while self._pending[0] != sentinel:
+        self._condition.wait()
+      deadline = None if timeout is None else time.monotonic() + timeout
+      match = None
+      err_end = -1
+      while self._pending[0] == sentinel:
+        match = exit_pattern.search(self._stdout)
+        if match:
+          # With stderr merged, the sentinel printed to stderr follows the
+          # exit line in stdout, and has to be removed with the output.
+          if self._merged_stderr:
+            err_end = self._stdout.find(err_marker, match.end())
+          else:
+            err_end = self._stderr.find(err_marker)
+          if err_end >= 0:
+            break
+        match = None
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if self._closed or (remaining is not None and remaining <= 0):
+          break
+        self._condition.wait(remaining)
+      if match is None:
+        self._pending.remove(sentinel)
+        self._condition.notify_all()
+        closed = self._closed
+      else:
+        ret = int(match.group(1))
+        out = bytes(self._stdout[: match.start()])
+        err = b''
+        if self._merged_stderr:
+          del self._stdout[: err_end + len(err_marker)]
+        else:
+          del self._stdout[: match.end()]
+          err = bytes(self._stderr[:err_end])
+          del self._stderr[: err_end + len(err_marker)]
+        self._pending.popleft()
+        self._condition.notify_all()
+        return ret, out, err
+    if closed:
+      raise SessionLostError(f'The shell session ended while running {command}')
+    # The shell is busy with the command, it can not be closed gracefully.
+    self._proc.kill()
+    self.close()
+    raise TimeoutError(f'Timed out after {timeout}s running {command}')
+
+  def close(self) -> None:
+    """Ends the session. Commands still running are reported as lost."""
+    with self._condition:
+      self._closed = True
+      self._condition.notify_all()
+    proc = self._proc
+    if proc is None:
+      return
+    try:
+      proc.stdin.close()
+    except OSError:
+      pass
+    if proc.poll() is None:
+      try:
+        # An idle shell exits once its stdin is closed.
+        proc.wait(timeout=_EXIT_TIMEOUT_SEC)
+      except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    # The output streams are closed by their readers at EOF, closing them
+    # here could free their descriptors for reuse while still being read.
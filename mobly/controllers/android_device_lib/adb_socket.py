@@ -0,0 +1,501 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Client of the smart-socket protocol of the adb server.
+
+The adb binary is a client of the adb server, which it talks to over TCP,
+port 5037 by default. Every request is a string prefixed with its length as
+four hex digits, and is answered with ``OKAY``, or with ``FAIL`` followed by
+a length-prefixed error message::
+
+  client: 000chost:devices
+  server: OKAY0017emulator-5554\tdevice\n
+
+Requests starting with ``host:`` or ``host-serial:<serial>:`` are served by
+the server itself. Other services, like ``shell:`` or ``sync:``, run on a
+device selected first with ``host:transport:<serial>``, and stream their
+output over the connection until it is closed.
+
+Talking to the server directly saves forking an adb process per command.
+"""
+
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5037
+
+# Size of the reads of the output of services.
+_READ_SIZE = 64 * 1024
+
+# Largest chunk of file data in one packet of the sync protocol.
+_SYNC_DATA_MAX = 64 * 1024
+
+# Packets of the shell protocol v2 start with an id and the payload length.
+_SHELL_PACKET_HEADER = struct.Struct('<BI')
+_SHELL_ID_STDOUT = 1
+_SHELL_ID_STDERR = 2
+_SHELL_ID_EXIT = 3
+
+# Packets of the sync protocol start with an id and a length or a value.
+_SYNC_HEADER = struct.Struct('<4sI')
+# Reply to a STAT request: id, mode, size and modification time.
+_SYNC_STAT = struct.Struct('<4sIII')
+
+# Device feature of the shell protocol v2, which reports exit codes.
+_FEATURE_SHELL_V2 = 'shell_v2'
+
+
+class Error(Exception):
+  """Base error type for the adb socket client."""
+
+
+class ServerUnavailableError(Error):
+  """Raised when the adb server can not be connected to."""
+
+
+class RequestFailedError(Error):
+  """Raised when the adb server or a device rejects a request.
+
+  Attributes:
+    message: string, the reason given for the failure.
+  """
+
+  def __init__(self, message):
+    super().__init__(message)
+    self.message = message
+
+
+def server_address() -> tuple[str, int]:
+  """Returns the address of the adb server, like the adb binary finds it.
+
+  The `ANDROID_ADB_SERVER_ADDRESS` and `ANDROID_ADB_SERVER_PORT` environment
+  variables override the default address.
+  """
+  host = os.environ.get('ANDROID_ADB_SERVER_ADDRESS') or DEFAULT_HOST
+  try:
+    port = int(os.environ.get('ANDROID_ADB_SERVER_PORT', DEFAULT_PORT))
+  except ValueError:
+    port = DEFAULT_PORT
+  return host, port
+
+
+def _encode_request(request: str) -> bytes:
+  data = request.encode('utf-8')
+  return b'%04x' % len(data) + data
+
+
+class _Connection:
+  """A connection to the adb server with a deadline for all its reads."""
+
+  def __init__(self, address: tuple[str, int], timeout: Optional[float]):
+    self._deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+      self._sock = socket.create_connection(address, timeout=timeout)
+    except OSError as e:
+      raise ServerUnavailableError(
+          f'Failed to connect to the adb server at {address}: {e}'
+      ) from e
+
+  def _set_timeout(self) -> None:
+    if self._deadline is not None:
+      remaining = self._deadline - time.monotonic()
+      if remaining <= 0:
+        raise TimeoutError('Timed out talking to the adb server.')
+      self._sock.settimeout(remaining)
+
+  def send(self, data: bytes) -> None:
+    self._set_timeout()
+    self._sock.sendall(data)
+
+  def recv(self, size: int = _READ_SIZE) -> bytes:
+    self._set_timeout()
+    return self._sock.recv(size)
+
+  def read_exact(self, size: int) -> bytes:
+    """Reads exactly `size` bytes.
+
+    Raises:
+      Error: The connection was closed before.
+    """
+    parts = []
+    while size > 0:
+      data = self.recv(min(size, _READ_SIZE))
+      if not data:
+        raise Error('The adb server closed the connection unexpectedly.')
+      parts.append(data)
+      size -= len(data)
+    return b''.join(parts)
+
+  def read_all(self) -> bytes:
+    """Reads until the connection is closed."""
+    parts = []
+    while True:
+      data = self.recv()
+      if not data:
+        return b''.join(parts)
+      parts.append(data)
+
+  def read_string(self) -> bytes:
+    """Reads a string prefixed with its length as four hex digits."""
+    length = self.read_exact(4)
+    try:
+      size = int(length, 16)
+    except ValueError:
+      raise Error(f'Invalid length from the adb server: {length!r}') from None
+    return self.read_exact(size)
+
+  def read_status(self) -> None:
+    """Reads the status of a request.
+
+    Raises:
+      RequestFailedError: The request was rejected.
+    """
+    status = self.read_exact(4)
+    if status == b'OKAY':
+      return
+    if status == b'FAIL':
+      raise RequestFailedError(
+          self.read_string().decode('utf-8', errors='replace')
+      )
+    raise Error(f'Unexpected status from the adb server: {status!r}')
+
+  def request(self, request: str) -> None:
+    """Sends a request and reads its status."""
+    self.send(_encode_request(request))
+    self.read_status()
+
+  def close(self) -> None:
+    try:
+      # Unblocks reads in progress in other threads, which closing alone
+      # does not do.
+      self._sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self._sock.close()
+
+  def __enter__(self) -> '_Connection':
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    self.close()
+
+
+def _parse_device_listing(listing: bytes) -> dict[str, str]:
+  """Parses a listing of devices into their states by serial."""
+  states = {}
+  for line in listing.decode('utf-8', errors='replace').splitlines():
+    serial, _, state = line.partition('\t')
+    if serial and state:
+      states[serial] = state.split()[0]
+  return states
+
+
+class DeviceListStream:
+  """The devices known to the adb server, sent again on every change.
+
+  See `AdbSocketClient.track_devices`.
+  """
+
+  def __init__(self, conn: _Connection):
+    self._conn = conn
+
+  def read(self) -> dict[str, str]:
+    """Waits for the next list of devices.
+
+    The first list is sent right away, the next ones when a device is
+    connected, disconnected or changes state.
+
+    Returns:
+      The state of every device, like `device` or `offline`, by serial.
+
+    Raises:
+      Error: The stream was closed, e.g. because the adb server was killed.
+    """
+    return _parse_device_listing(self._conn.read_string())
+
+  def close(self) -> None:
+    """Closes the stream. Reads in progress in other threads raise."""
+    self._conn.close()
+
+  def __enter__(self) -> 'DeviceListStream':
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    self.close()
+
+
+class AdbSocketClient:
+  """Runs adb commands by talking to the adb server over its socket.
+
+  Every call opens its own connection, like the adb binary does, so the
+  client can be shared between threads.
+
+  Timeouts raise `TimeoutError`. Requests rejected by the server or the device
+  raise `RequestFailedError`, and `ServerUnavailableError` is raised if the
+  server can not be connected to, e.g. because it is not running yet.
+  """
+
+  def __init__(self, address: Optional[tuple[str, int]] = None):
+    self._address = address or server_address()
+    self._features: dict[str, frozenset[str]] = {}
+    self._features_lock = threading.Lock()
+
+  def _connect(self, timeout: Optional[float]) -> _Connection:
+    return _Connection(self._address, timeout)
+
+  def _host_prefix(self, serial: str) -> str:
+    return f'host-serial:{serial}:' if serial else 'host:'
+
+  def host_query(self, request: str, timeout: Optional[float] = None) -> bytes:
+    """Sends a request served by the adb server and returns its reply."""
+    with self._connect(timeout) as conn:
+      conn.request(request)
+      return conn.read_string()
+
+  def _open_service(
+      self, serial: str, service: str, timeout: Optional[float]
+  ) -> _Connection:
+    """Connects to a service on a device."""
+    conn = self._connect(timeout)
+    try:
+      conn.request(
+          f'host:transport:{serial}' if serial else 'host:transport-any'
+      )
+      conn.request(service)
+    except BaseException:
+      conn.close()
+      raise
+    return conn
+
+  def devices(self, long: bool = False) -> bytes:
+    """Returns the devices, as listed by `adb devices`."""
+    listing = self.host_query('host:devices-l' if long else 'host:devices')
+    return b'List of devices attached\n' + listing + b'\n'
+
+  def track_devices(self) -> DeviceListStream:
+    """Opens a stream of the devices, like `adb track-devices`."""
+    conn = self._connect(None)
+    try:
+      conn.request('host:track-devices')
+    except BaseException:
+      conn.close()
+      raise
+    return DeviceListStream(conn)
+
+  def get_state(self, serial: str) -> bytes:
+    """Returns the state of a device, as printed by `adb get-state`."""
+    return self.host_query(f'{self._host_prefix(serial)}get-state') + b'\n'
+
+  def features(
+      self, serial: str, timeout: Optional[float] = None
+  ) -> frozenset[str]:
+    """Returns the features supported by a device and the adb server."""
+    with self._features_lock:
+      cached = self._features.get(serial)
+    if cached is not None:
+      return cached
+    features = frozenset(
+        self.host_query(f'{self._host_prefix(serial)}features', timeout)
+        .decode('utf-8')
+        .strip()
+        .split(',')
+    )
+    with self._features_lock:
+      self._features[serial] = features
+    return features
+
+  def shell(
+      self, serial: str, command: str, timeout: Optional[float] = None
+  ) -> tuple[int, bytes, bytes]:
+    """Runs a shell command on a device.
+
+    Devices without the shell protocol v2 do not report exit codes nor
+    separate stderr, like with the adb binary.
+
+    Returns:
+      The exit code, the stdout and the stderr of the command.
+    """
+    if _FEATURE_SHELL_V2 not in self.features(serial, timeout):
+      with self._open_service(serial, f'shell:{command}', timeout) as conn:
+        return 0, conn.read_all(), b''
+    with self._open_service(serial, f'shell,v2,raw:{command}', timeout) as conn:
+      stdout, stderr = [], []
+      while True:
+        header = conn.recv(_SHELL_PACKET_HEADER.size)
+        if not header:
+          raise Error('The shell of the device closed without an exit code.')
+        if len(header) < _SHELL_PACKET_HEADER.size:
+          header += conn.read_exact(_SHELL_PACKET_HEADER.size - len(header))
+        packet_id, size = _SHELL_PACKET_HEADER.unpack(header)
+        payload = conn.read_exact(size)
+        if packet_id == _SHELL_ID_STDOUT:
+          stdout.append(payload)
+        elif packet_id == _SHELL_ID_STDERR:
+          stderr.append(payload)
+        elif packet_id == _SHELL_ID_EXIT:
+          return payload[0], b''.join(stdout), b''.join(stderr)
+
+  def exec_out(
+      self, serial: str, command: str, timeout: Optional[float] = None
+  ) -> bytes:
+    """Runs a command on a device and returns its raw, binary-safe stdout."""
+    with self._open_service(serial, f'exec:{command}', timeout) as conn:
+      return conn.read_all()
+
+  def forward(
+      self, serial: str, local: str, remote: str, no_rebind: bool = False
+  ) -> bytes:
+    """Forwards a host socket to a device, like `adb forward`.
+
+    Returns:
+      The host port allocated for `tcp:0`, with a line feed, as printed by
+      `adb forward`. Empty for other local sockets.
+    """
+    kind = 'forward:norebind:' if no_rebind else 'forward:'
+    with self._connect(None) as conn:
+      conn.request(f'{self._host_prefix(serial)}{kind}{local};{remote}')
+      # The server acknowledges the request once more when the forward is
+      # set up, followed by the allocated port for `tcp:0`.
+      reply = conn.read_all()
+    if reply.startswith(b'FAIL'):
+      raise RequestFailedError(reply[8:].decode('utf-8', errors='replace'))
+    port = reply.removeprefix(b'OKAY')[4:]
+    return port + b'\n' if port else b''
+
+  def list_forward(self, serial: str) -> bytes:
+    """Returns the forwarded sockets, as listed by `adb forward --list`."""
+    return self.host_query(f'{self._host_prefix(serial)}list-forward')
+
+  def kill_forward(self, serial: str, local: Optional[str] = None) -> bytes:
+    """Removes a forwarded socket, or all of them if `local` is None."""
+    prefix = self._host_prefix(serial)
+    request = (
+        f'{prefix}killforward-all'
+        if local is None
+        else f'{prefix}killforward:{local}'
+    )
+    with self._connect(None) as conn:
+      conn.request(request)
+      conn.read_all()
+    return b''
+
+  def push(
+      self,
+      serial: str,
+      local_path: str,
+      remote_path: str,
+      timeout: Optional[float] = None,
+  ) -> bytes:
+    """Copies a local file to a device with the sync protocol.
+
+    Like `adb push`, the file is copied into `remote_path` if it is a
+    directory.
+
+    Returns:
+      A summary of the copy.
+    """
+    local_stat = os.stat(local_path)
+    mode = stat.S_IMODE(local_stat.st_mode)
+    with self._open_service(serial, 'sync:', timeout) as conn:
+      if stat.S_ISDIR(self._sync_stat(conn, remote_path)):
+        remote_path = (
+            remote_path.rstrip('/') + '/' + os.path.basename(local_path)
+        )
+      self._sync_send(conn, b'SEND', f'{remote_path},{mode}'.encode('utf-8'))
+      size = 0
+      with open(local_path, 'rb') as f:
+        while data := f.read(_SYNC_DATA_MAX):
+          conn.send(_SYNC_HEADER.pack(b'DATA', len(data)) + data)
+          size += len(data)
+      # Like `adb push`, the copy keeps the modification time of the file.
+      conn.send(_SYNC_HEADER.pack(b'DONE', int(local_stat.st_mtime)))
+      self._sync_read_okay(conn)
+      conn.send(_SYNC_HEADER.pack(b'QUIT', 0))
+    return f'{local_path}: 1 file pushed. ({size} bytes)\n'.encode('utf-8')
+
+  def pull(
+      self,
+      serial: str,
+      remote_path: str,
+      local_path: str,
+      timeout: Optional[float] = None,
+  ) -> Optional[bytes]:
+    """Copies a file from a device with the sync protocol.
+
+    Like `adb pull`, the file is copied into `local_path` if it is a
+    directory. The local file is only replaced once the copy is complete.
+
+    Returns:
+      A summary of the copy, or None if `remote_path` is a directory, which
+      is not supported.
+    """
+    if os.path.isdir(local_path):
+      local_path = os.path.join(local_path, os.path.basename(remote_path))
+    size = 0
+    with self._open_service(serial, 'sync:', timeout) as conn:
+      if stat.S_ISDIR(self._sync_stat(conn, remote_path)):
+        conn.send(_SYNC_HEADER.pack(b'QUIT', 0))
+        return None
+      self._sync_send(conn, b'RECV', remote_path.encode('utf-8'))
+      fd, tmp_path = tempfile.mkstemp(
+          dir=os.path.dirname(os.path.abspath(local_path)), prefix='.pull_'
+      )
+      try:
+        with os.fdopen(fd, 'wb') as f:
+          while True:
+            packet_id, length = _SYNC_HEADER.unpack(
+                conn.read_exact(_SYNC_HEADER.size)
+            )
+            if packet_id == b'DONE':
+              break
+            if packet_id == b'FAIL':
+              raise RequestFailedError(
+                  conn.read_exact(length).decode('utf-8', errors='replace')
+              )
+            if packet_id != b'DATA':
+              raise Error(f'Unexpected sync packet {packet_id!r}.')
+            f.write(conn.read_exact(length))
+            size += length
+        os.replace(tmp_path, local_path)
+      except BaseException:
+        os.remove(tmp_path)
+        raise
+      conn.send(_SYNC_HEADER.pack(b'QUIT', 0))
+    return f'{remote_path}: 1 file pulled. ({size} bytes)\n'.encode('utf-8')
+
+  def _sync_send(self, conn: _Connection, packet_id: bytes, data: bytes):
+    conn.send(_SYNC_HEADER.pack(packet_id, len(data)) + data)
+
+  def _sync_stat(self, conn: _Connection, path: str) -> int:
+    """Returns the mode of a file on the device, 0 if it does not exist."""
+    self._sync_send(conn, b'STAT', path.encode('utf-8'))
+    packet_id, mode, _, _ = _SYNC_STAT.unpack(conn.read_exact(_SYNC_STAT.size))
+    if packet_id != b'STAT':
+      raise Error(f'Unexpected sync packet {packet_id!r}.')
+    return mode
+
+  def _sync_read_okay(self, conn: _Connection) -> None:
+    packet_id, length = _SYNC_HEADER.unpack(conn.read_exact(_SYNC_HEADER.size))
+    if packet_id == b'FAIL':
+      raise RequestFailedError(
+          conn.read_exact(length).decode('utf-8', errors='replace')
+      )
+    if packet_id != b'OKAY':
+      raise Error(f'Unexpected sync packet {packet_id!r}.')
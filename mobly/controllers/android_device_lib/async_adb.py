@@ -0,0 +1,214 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An asyncio variant of `AdbProxy`, to drive many devices from one thread.
+
+Example:
+
+.. code-block:: python
+
+  async def get_serial_numbers(serials):
+    proxies = [async_adb.AsyncAdbProxy(serial) for serial in serials]
+    return await asyncio.gather(
+        *(proxy.getprop('ro.serialno') for proxy in proxies)
+    )
+
+  asyncio.run(get_serial_numbers(['serial1', 'serial2']))
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+
+from mobly import utils
+from mobly.controllers.android_device_lib import adb
+
+# Interval at which to check again whether `adb.ADB_PORT_LOCK` was released.
+_PORT_LOCK_POLL_INTERVAL_SEC = 0.01
+
+
+@contextlib.asynccontextmanager
+async def _port_lock():
+  """Holds `adb.ADB_PORT_LOCK` without blocking the event loop.
+
+  The lock is shared with `AdbProxy` objects used from other threads.
+  """
+  while not adb.ADB_PORT_LOCK.acquire(blocking=False):
+    await asyncio.sleep(_PORT_LOCK_POLL_INTERVAL_SEC)
+  try:
+    yield
+  finally:
+    adb.ADB_PORT_LOCK.release()
+
+
+class AsyncAdbProxy:
+  """Proxy class for ADB, with coroutines instead of blocking calls.
+
+  Mirrors `AdbProxy`: any adb command can be awaited as a method, with the
+  '-' in its name replaced with '_', and the same arguments:
+
+  >> adb = AsyncAdbProxy(<serial>)
+  >> await adb.shell(['echo', 'a', 'b'], timeout=5)
+  >> await adb.push(['/tmp/file', '/sdcard/'])
+  >> await adb.install(['-r', '-g', '/tmp/app.apk'])
+
+  Each command runs the adb binary as an asyncio subprocess. Commands that
+  exit with a non-zero code raise `adb.AdbError`, and commands that time out
+  are killed and raise `adb.AdbTimeoutError`, like with `AdbProxy`. Commands
+  are not run through the system shell.
+  """
+
+  def __init__(self, serial=''):
+    """Initializes the proxy.
+
+    Args:
+      serial: string, the serial of the device, empty for commands that are
+        not specific to a device.
+    """
+    # Builds the commands and parses their output.
+    self._sync_proxy = adb.AdbProxy(serial)
+
+  @property
+  def serial(self):
+    return self._sync_proxy.serial
+
+  @serial.setter
+  def serial(self, serial):
+    self._sync_proxy.serial = serial
+
+  def __repr__(self):
+    return '<AsyncAdbProxy|%s>' % self.serial
+
+  async def _exec_cmd(self, args, timeout, stderr) -> bytes:
+    """Executes adb commands in a subprocess.
+
+    Args:
+      args: list of strings, program arguments.
+      timeout: float, the number of seconds to wait before timing out.
+        If not specified, no timeout takes effect.
+      stderr: a Byte stream, like io.BytesIO, stderr of the command will
+        be written to this object if provided.
+
+    Returns:
+      The output of the adb command run if exit code is 0.
+
+    Raises:
+      ValueError: timeout value is invalid.
+      AdbError: The adb command exit code is not 0.
+      AdbTimeoutError: The adb command timed out.
+    """
+    if timeout and timeout <= 0:
+      raise ValueError('Timeout is not a positive value: %s' % timeout)
+    start_time = time.monotonic()
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+      out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+      self._sync_proxy._record_cmd(args, start_time)
+      raise adb.AdbTimeoutError(
+          cmd=args, timeout=timeout, serial=self.serial
+      ) from None
+    finally:
+      # Also kills the process when the coroutine is cancelled.
+      if proc.returncode is None:
+        proc.kill()
+        await proc.wait()
+    ret = proc.returncode
+    self._sync_proxy._record_cmd(args, start_time, ret, len(out) + len(err))
+    logging.debug(
+        'cmd: %s, stdout: %s, stderr: %s, ret: %s',
+        utils.cli_cmd_to_string(args),
+        out,
+        err,
+        ret,
+    )
+    if stderr:
+      stderr.write(err)
+    if ret == 0:
+      return out
+    raise adb.AdbError(
+        cmd=args, stdout=out, stderr=err, ret_code=ret, serial=self.serial
+    )
+
+  async def _exec_adb_cmd(self, name, args, timeout, stderr) -> bytes:
+    adb_cmd = self._sync_proxy._construct_adb_cmd(name, args, shell=False)
+    return await self._exec_cmd(adb_cmd, timeout=timeout, stderr=stderr)
+
+  async def getprop(self, prop_name, timeout=adb.DEFAULT_GETPROP_TIMEOUT_SEC):
+    """Gets a property of the device, see `AdbProxy.getprop`."""
+    out = await self.shell(['getprop', prop_name], timeout=timeout)
+    return out.decode('utf-8').strip()
+
+  async def getprops(self, prop_names):
+    """Gets multiple properties of the device, see `AdbProxy.getprops`."""
+    attempts = adb.DEFAULT_GETPROPS_ATTEMPTS
+    results = {}
+    for attempt in range(attempts):
+      # The ADB getprop command can randomly return empty string, so try
+      # multiple times.
+      raw_output = await self.shell(
+          ['getprop'], timeout=adb.DEFAULT_GETPROP_TIMEOUT_SEC
+      )
+      properties = self._sync_proxy._parse_getprop_output(raw_output)
+      if properties:
+        for name in prop_names:
+          if name in properties:
+            results[name] = properties[name]
+        break
+      if attempt < attempts - 1:
+        await asyncio.sleep(adb.DEFAULT_GETPROPS_RETRY_SLEEP_SEC)
+    return results
+
+  async def has_shell_command(self, command) -> bool:
+    """Checks whether a command exists on the device."""
+    try:
+      output = await self.shell(['command', '-v', command])
+    except adb.AdbError:
+      return False
+    return command in output.decode('utf-8').strip()
+
+  async def forward(self, args=None, timeout=None) -> bytes:
+    async with _port_lock():
+      return await self._exec_adb_cmd('forward', args, timeout, None)
+
+  async def reverse(self, args=None, timeout=None) -> bytes:
+    async with _port_lock():
+      return await self._exec_adb_cmd('reverse', args, timeout, None)
+
+  def __getattr__(self, name):
+    # adb commands never start with '_', unlike missing private attributes.
+    if name.startswith('_'):
+      raise AttributeError(name)
+
+    async def adb_call(args=None, timeout=None, stderr=None) -> bytes:
+      """Wrapper for an ADB command.
+
+      Args:
+        args: string or list of strings, arguments to the adb command.
+        timeout: float, the number of seconds to wait before timing out.
+          If not specified, no timeout takes effect.
+        stderr: a Byte stream, like io.BytesIO, stderr of the command
+          will be written to this object if provided.
+
+      Returns:
+        The output of the adb command run if exit code is 0.
+      """
+      return await self._exec_adb_cmd(name, args, timeout, stderr)
+
+    return adb_call
@@ -0,0 +1,191 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tracking of the devices known to the adb server, as they change.
+
+The tracker keeps a `host:track-devices` stream open to the adb server, which
+sends the full list of devices whenever one is connected, disconnected or
+changes state. Looking up devices is then an in-memory read, and waiting for
+a device blocks until the server reports it instead of polling.
+"""
+
+import logging
+import threading
+from typing import Collection, Optional
+
+from mobly.controllers.android_device_lib import adb_socket
+
+# Seconds to wait before reconnecting after the stream was lost, e.g.
+# because the adb server is not running.
+_RECONNECT_INTERVAL_SEC = 1
+
+# Longest time to wait for the first list of devices when starting.
+_START_TIMEOUT_SEC = 2
+
+
+class DeviceTracker:
+  """Keeps an up-to-date map of the devices known to the adb server.
+
+  The tracker follows the server from a background thread. While the stream
+  is lost, `is_tracking` is False and the map is not reliable; the tracker
+  keeps reconnecting until stopped.
+  """
+
+  def __init__(self, client: Optional[adb_socket.AdbSocketClient] = None):
+    """Initializes the tracker.
+
+    Args:
+      client: AdbSocketClient, the client of the adb server to track.
+        Defaults to the server the adb binary uses.
+    """
+    self._client = client or adb_socket.AdbSocketClient()
+    self._condition = threading.Condition()
+    self._states: dict[str, str] = {}
+    self._is_tracking = False
+    self._stopped = False
+    self._stream: Optional[adb_socket.DeviceListStream] = None
+    self._thread: Optional[threading.Thread] = None
+
+  @property
+  def is_tracking(self) -> bool:
+    """True if the map of devices is up to date."""
+    with self._condition:
+      return self._is_tracking
+
+  @property
+  def devices(self) -> dict[str, str]:
+    """A snapshot of the states of the devices, by serial."""
+    with self._condition:
+      return dict(self._states)
+
+  def get_state(self, serial: str) -> Optional[str]:
+    """Returns the state of a device, or None if the server does not know it.
+
+    States are reported like `adb devices` lists them, e.g. `device`,
+    `offline`, `unauthorized` or `recovery`.
+    """
+    with self._condition:
+      return self._states.get(serial)
+
+  def start(self, timeout: float = _START_TIMEOUT_SEC) -> bool:
+    """Starts tracking and waits for the first list of devices.
+
+    Args:
+      timeout: float, the number of seconds to wait for the first list.
+
+    Returns:
+      True if the tracker is tracking, False if it is still trying to reach
+      the adb server.
+    """
+    with self._condition:
+      if self._thread is None:
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._track, name='adb-device-tracker', daemon=True
+        )
+        self._thread.start()
+      return self._condition.wait_for(lambda: self._is_tracking, timeout)
+
+  def stop(self) -> None:
+    """Stops tracking."""
+    with self._condition:
+      self._stopped = True
+      stream = self._stream
+      thread, self._thread = self._thread, None
+      self._condition.notify_all()
+    if stream is not None:
+      stream.close()
+    if thread is not None:
+      thread.join()
+
+  def _track(self) -> None:
+    while True:
+      with self._condition:
+        if self._stopped:
+          return
+      try:
+        with self._client.track_devices() as stream:
+          with self._condition:
+            if self._stopped:
+              return
+            self._stream = stream
+          while True:
+            states = stream.read()
+            with self._condition:
+              self._states = states
+              self._is_tracking = True
+              self._condition.notify_all()
+      except (adb_socket.Error, OSError) as e:
+        logging.debug('Lost track of the devices of the adb server: %s', e)
+      with self._condition:
+        self._stream = None
+        self._is_tracking = False
+        self._condition.notify_all()
+        self._condition.wait_for(lambda: self._stopped, _RECONNECT_INTERVAL_SEC)
+
+  def wait_for_state(
+      self,
+      serial: str,
+      states: Collection[str] = ('device',),
+      timeout: Optional[float] = None,
+  ) -> bool:
+    """Waits for a device to be in one of the given states.
+
+    Args:
+      serial: string, the serial of the device.
+      states: the states to wait for, `device` by default, i.e. online.
+      timeout: float, the number of seconds to wait. If not specified, no
+        timeout takes effect.
+
+    Returns:
+      True if the device is in one of the states, False if it timed out.
+    """
+    with self._condition:
+      return self._condition.wait_for(
+          lambda: self._states.get(serial) in states, timeout
+      )
+
+  def wait_for_change(self, serial: str, timeout: Optional[float]) -> bool:
+    """Waits for the state of a device to change.
+
+    Args:
+      serial: string, the serial of the device.
+      timeout: float, the number of seconds to wait. If not specified, no
+        timeout takes effect.
+
+    Returns:
+      True if the state changed, False if it timed out.
+    """
+    with self._condition:
+      state = self._states.get(serial)
+      return self._condition.wait_for(
+          lambda: self._states.get(serial) != state, timeout
+      )
+
+
+_tracker: Optional[DeviceTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> DeviceTracker:
+  """Returns the tracker of the devices of the adb server, started once.
+
+  The tracker is shared by the whole process. Check `is_tracking` before
+  relying on its map of devices.
+  """
+  global _tracker
+  with _tracker_lock:
+    if _tracker is None:
+      _tracker = DeviceTracker()
+      _tracker.start()
+    return _tracker
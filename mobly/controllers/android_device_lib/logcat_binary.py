@@ -0,0 +1,288 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Decoding of binary logcat output, as printed by `logcat -B`.
+
+Every entry starts with a `logger_entry` header, followed by a payload of
+`len` bytes. For text log buffers, the payload holds the priority byte, the
+tag and the message, both NUL terminated::
+
+  struct logger_entry {
+    uint16_t len;       // Length of the payload.
+    uint16_t hdr_size;  // Size of the header, 0 for v1 headers.
+    int32_t pid;
+    uint32_t tid;
+    uint32_t sec;       // Seconds since the epoch, in UTC.
+    uint32_t nsec;
+    uint32_t lid;       // Log buffer id, v3 and later.
+    uint32_t uid;       // v4 and later.
+  };
+
+The fields are read directly from the header, so no regex is involved in
+decoding an entry.
+"""
+
+import dataclasses
+import logging
+import re
+import struct
+import time
+from typing import Optional
+
+# Size of v1 headers, which have a zero `hdr_size`.
+_V1_HEADER_SIZE = 20
+
+# Size of the headers with a log buffer id.
+_LID_HEADER_SIZE = 24
+
+# Largest header size accepted, larger values mean the stream is corrupt.
+_MAX_HEADER_SIZE = 100
+
+_PREFIX = struct.Struct('<HH')
+_FIELDS = struct.Struct('<iIII')
+_LID = struct.Struct('<I')
+
+# Log buffers whose payloads are binary events rather than text.
+_BINARY_BUFFER_IDS = frozenset(
+    [
+        2,  # events
+        5,  # stats
+        6,  # security
+    ]
+)
+
+# Characters logcat prints for the priorities of entries. Entries of other
+# priorities are skipped, as logcat prints them with a `?` level that the
+# parser of logcat files rejects.
+_PRIORITY_CHARS = {
+    2: 'V',
+    3: 'D',
+    4: 'I',
+    5: 'W',
+    6: 'E',
+    7: 'F',
+    8: 'S',
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class LogEntry:
+  """A log entry decoded from binary logcat output.
+
+  Attributes:
+    pid: The id of the process that logged the entry.
+    tid: The id of the thread that logged the entry.
+    sec: Seconds of the time of the entry, since the epoch in UTC.
+    nsec: Nanoseconds of the time of the entry.
+    lid: The id of the log buffer of the entry, None for v1 headers.
+    level: The priority of the entry, as a threadtime level character.
+    tag: The tag of the entry.
+    message: The message of the entry, without trailing line feeds.
+  """
+
+  pid: int
+  tid: int
+  sec: int
+  nsec: int
+  lid: Optional[int]
+  level: str
+  tag: bytes
+  message: bytes
+
+
+@dataclasses.dataclass(frozen=True)
+class TextLine:
+  """A threadtime line formatted from a log entry, with its columns.
+
+  The columns are taken from the entry, so the line does not have to be
+  parsed again to be handed to logcat listeners.
+
+  Attributes:
+    data: The line as written to the logcat file, with its line feed.
+    raw: The decoded line, without its line feed.
+    timestamp_end: The end of the timestamp in `raw`.
+    pid: The id of the process that logged the entry.
+    tid: The id of the thread that logged the entry.
+    level: The priority of the entry, as a threadtime level character.
+    tag: The decoded tag of the entry.
+    message_start: The start of the message in `raw`.
+  """
+
+  data: bytes
+  raw: str
+  timestamp_end: int
+  pid: int
+  tid: int
+  level: str
+  tag: str
+  message_start: int
+
+
+def parse_utc_offset(value: str) -> int:
+  """Parses a UTC offset like `+0200` as printed by `date +%z`.
+
+  Returns:
+    The offset in seconds.
+
+  Raises:
+    ValueError: The value is not a UTC offset.
+  """
+  match = re.fullmatch(r'([+-])(\d{2}):?(\d{2})', value.strip())
+  if match is None:
+    raise ValueError(f'Invalid UTC offset: {value!r}')
+  sign, hours, minutes = match.groups()
+  offset = int(hours) * 3600 + int(minutes) * 60
+  return -offset if sign == '-' else offset
+
+
+class BinaryLogcatDecoder:
+  """Decodes a stream of binary logcat output into threadtime text.
+
+  Data can be fed in arbitrary chunks, entries split across chunks are
+  decoded once complete. Entries of binary log buffers, e.g. events, are
+  skipped as they can not be formatted without the event tag map. Corrupt
+  data is logged and skipped, decoding resumes with the next chunk.
+  """
+
+  def __init__(self, utc_offset_sec: int = 0):
+    """Initializes the decoder.
+
+    Args:
+      utc_offset_sec: The UTC offset of the device time zone, used to print
+        the local time of entries like logcat does.
+    """
+    self._utc_offset_sec = utc_offset_sec
+    self._pending = b''
+    self._time_cache: tuple[int, bytes] = (-1, b'')
+
+  def decode(self, data: bytes) -> list[LogEntry]:
+    """Returns the entries completed by `data`."""
+    data = self._pending + data if self._pending else data
+    entries = []
+    pos = 0
+    size = len(data)
+    while size - pos >= _PREFIX.size:
+      length, header_size = _PREFIX.unpack_from(data, pos)
+      if not header_size:
+        header_size = _V1_HEADER_SIZE
+      elif not _V1_HEADER_SIZE <= header_size <= _MAX_HEADER_SIZE:
+        logging.error(
+            'Invalid logger_entry header size %d, skipping %d bytes of'
+            ' binary logcat output.',
+            header_size,
+            size - pos,
+        )
+        pos = size
+        break
+      end = pos + header_size + length
+      if end > size:
+        break
+      pid, tid, sec, nsec = _FIELDS.unpack_from(data, pos + _PREFIX.size)
+      lid = None
+      if header_size >= _LID_HEADER_SIZE:
+        (lid,) = _LID.unpack_from(data, pos + _V1_HEADER_SIZE)
+      if (
+          lid not in _BINARY_BUFFER_IDS
+          and length
+          and data[pos + header_size] in _PRIORITY_CHARS
+      ):
+        entries.append(
+            _decode_payload(
+                pid, tid, sec, nsec, lid, data[pos + header_size : end]
+            )
+        )
+      pos = end
+    self._pending = data[pos:]
+    return entries
+
+  def _time(self, sec: int) -> bytes:
+    """Returns the local time of a second, as printed by threadtime."""
+    if sec != self._time_cache[0]:
+      local = time.gmtime(sec + self._utc_offset_sec)
+      self._time_cache = (
+          sec,
+          time.strftime('%m-%d %H:%M:%S', local).encode('ascii'),
+      )
+    return self._time_cache[1]
+
+  def _prefix(self, entry: LogEntry) -> bytes:
+    """Returns the threadtime columns of an entry, up to its message."""
+    return b'%s.%03d %5d %5d %s %-8s: ' % (
+        self._time(entry.sec),
+        entry.nsec // 1000000,
+        entry.pid,
+        entry.tid,
+        entry.level.encode('ascii'),
+        entry.tag,
+    )
+
+  def format(self, entry: LogEntry) -> bytes:
+    """Formats an entry as threadtime text, one line per message line."""
+    prefix = self._prefix(entry)
+    return b''.join(
+        prefix + line + b'\n' for line in entry.message.split(b'\n')
+    )
+
+  def feed(self, data: bytes) -> bytes:
+    """Returns the threadtime text of the entries completed by `data`."""
+    return b''.join(self.format(entry) for entry in self.decode(data))
+
+  def feed_lines(self, data: bytes) -> list[TextLine]:
+    """Returns the threadtime lines of the entries completed by `data`."""
+    lines = []
+    for entry in self.decode(data):
+      prefix = self._prefix(entry)
+      prefix_text = prefix.decode('utf-8', errors='replace')
+      # The timestamp is followed by the milliseconds.
+      timestamp_end = len(self._time_cache[1]) + 4
+      tag = entry.tag.decode('utf-8', errors='replace')
+      for message in entry.message.split(b'\n'):
+        lines.append(
+            TextLine(
+                data=prefix + message + b'\n',
+                raw=prefix_text + message.decode('utf-8', errors='replace'),
+                timestamp_end=timestamp_end,
+                pid=entry.pid,
+                tid=entry.tid,
+                level=entry.level,
+                tag=tag,
+                message_start=len(prefix_text),
+            )
+        )
+    return lines
+
+
+def _decode_payload(
+    pid: int, tid: int, sec: int, nsec: int, lid: Optional[int], payload: bytes
+) -> LogEntry:
+  """Decodes the priority, tag and message of a text log entry."""
+  tag_end = payload.find(b'\0', 1)
+  if tag_end < 0:
+    tag = payload[1:]
+    message = b''
+  else:
+    tag = payload[1:tag_end]
+    message = payload[tag_end + 1 :]
+    message_end = message.find(b'\0')
+    if message_end >= 0:
+      message = message[:message_end]
+  return LogEntry(
+      pid=pid,
+      tid=tid,
+      sec=sec,
+      nsec=nsec,
+      lid=lid,
+      level=_PRIORITY_CHARS[payload[0]],
+      tag=tag,
+      message=message.rstrip(b'\n'),
+  )
@@ -13,16 +13,28 @@
 # limitations under the License.
 """Logcat line parsing, timestamp comparison, and file reader utilities."""
 
+import asyncio
+import bisect
 import collections
-from collections.abc import Iterable
+from collections.abc import AsyncIterator, Iterable, Mapping
+import concurrent.futures
+import ctypes
 import dataclasses
+import enum
+import heapq
+import logging
+import mmap
 import os
+import platform
 import queue
 import re
+import select
+import sys
 import threading
 import time
 from typing import (
     Any,
+    Callable,
     ClassVar,
     Iterator,
     Optional,
@@ -32,6 +44,9 @@ from typing import (
     Union,
 )
 
+from mobly.controllers.android_device_lib import logcat_binary
+from mobly.controllers.android_device_lib import logcat_storage
+
 _LEVEL_NORM_MAP = {
     'V': 'V',
     'VERBOSE': 'V',
@@ -52,6 +67,135 @@ _LEVEL_NORM_MAP = {
     'SILENT': 'S',
 }
 
+# Default spacing in bytes between two checkpoints of the timestamp index.
+DEFAULT_INDEX_INTERVAL_BYTES = 64 * 1024
+
+# Default number of recently published lines kept in memory, see
+# `LogcatProcessor.publish`.
+DEFAULT_HOT_BUFFER_LINES = 10000
+
+# Default memory bound of the cache of `get_lines` queries.
+DEFAULT_QUERY_CACHE_BYTES = 64 * 1024 * 1024
+
+# Approximate memory used by a cached line besides its raw text.
+_CACHED_LINE_OVERHEAD = 200
+
+# Size of the reads used when extending the timestamp index.
+_INDEX_READ_SIZE = 1024 * 1024
+
+# Matches the timestamp prefix of every line that `LogLine._PATTERN` accepts.
+_INDEX_TIMESTAMP_PATTERN = re.compile(
+    rb'^(?:(\d{4})[-/])?(\d{2})[-/](\d{2})\s+'
+    rb'(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?',
+    re.MULTILINE,
+)
+
+# Multiplier that places the year above every other timestamp field in a key.
+_YEAR_KEY_SPAN = 13 * 32 * 24 * 60 * 60 * 1000000
+
+# How much older than the lines read before it a line of a merged timeline
+# may be, in microseconds. Log buffers interleave in logcat files, so lines
+# are held back this long to be sorted, and reading stops this long past the
+# end of the time range.
+_TIMELINE_REORDER_SLACK_US = 2 * 1000000
+
+# Most lines of one file held back to be sorted in a merged timeline.
+_TIMELINE_REORDER_MAX_LINES = 10000
+
+# Matches the columns of a threadtime line before the tag, as in
+# `LogLine._PATTERN`.
+_THREADTIME_HEAD_PATTERN = re.compile(
+    r'((?:\d{4}[-/])?\d{2}[-/]\d{2}\s+\d{2}:\d{2}:\d{2}(?:\.\d+)?)'
+    r'\s+(\d+)\s+(\d+)\s+([VDIWEFSA])\s+'
+)
+
+# Size of the reads used when scanning a logcat file.
+_SCAN_READ_SIZE = 1024 * 1024
+
+# Size of the reads looking for the end of a line at an arbitrary offset.
+_LINE_PROBE_SIZE = 4096
+
+# Characters with a special meaning in a regex, see `_literal_of`.
+_REGEX_SPECIALS = frozenset('.^$*+?{}[]\\|()')
+
+# Largest tag collection a `LogcatFilter` screens raw lines with.
+_MAX_SCREEN_TAGS = 16
+
+# Longest time a tailer blocks without a change notification before it checks
+# its file again, in case a notification was missed.
+_TAIL_MAX_WAIT_SEC = 1.0
+
+# Interval at which the file is checked where inotify is unavailable.
+_TAIL_POLL_INTERVAL_SEC = 0.05
+
+# Size of the reads used when following a logcat file.
+_TAIL_READ_SIZE = 1024 * 1024
+
+# Time an idle shared reader keeps its thread for new subscribers.
+_READER_IDLE_TIMEOUT_SEC = 5.0
+
+# Largest number of lines a paused listener reads from the file at once, so
+# that `get_next_event` does not run far past its timeout resuming it.
+_LISTENER_RESUME_MAX_LINES = 10000
+
+# inotify event masks, see <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+
+
+def _split_threadtime(
+    line: str,
+) -> Optional[tuple[str, str, str, str, str, int]]:
+  """Splits a threadtime line into its columns.
+
+  This is a fast path for `LogLine._PATTERN`. Only the fixed columns are
+  matched by a regex; the tag and message are then split at the first colon.
+  This avoids the lazy tag match of `LogLine._PATTERN`, and yields the same
+  groups for every line without a line feed.
+
+  Returns:
+    (timestamp, pid, tid, level, tag, message_start), or None if the line is
+    not a threadtime line. The message is `line[message_start:]`.
+  """
+  match = _THREADTIME_HEAD_PATTERN.match(line)
+  if match is None:
+    return None
+  head_end = match.end()
+  colon = line.find(':', head_end)
+  if colon < 0:
+    return None
+  message_start = colon + 1
+  if line[message_start : message_start + 1].isspace():
+    message_start += 1
+  timestamp, pid, tid, level = match.groups()
+  return (
+      timestamp,
+      pid,
+      tid,
+      level,
+      line[head_end:colon].rstrip(),
+      message_start,
+  )
+
+
+# Approximate size of the parts of a memory mapped file searched at once.
+_MAPPED_WINDOW_SIZE = 1024 * 1024
+
+# Smallest part of a file scanned by one process of a parallel query.
+_PARALLEL_MIN_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Number of parts per process a file is split into for a parallel query, so
+# that processes finishing early can take over more of the work.
+_PARALLEL_CHUNKS_PER_WORKER = 4
+
+
+def _decode_line(raw: bytes) -> str:
+  """Decodes a raw line read from a logcat file."""
+  return raw.decode('utf-8', errors='replace')
+
 
 @dataclasses.dataclass(frozen=True)
 class LogcatPosition:
@@ -72,7 +216,7 @@ class LogcatPosition:
   ) -> 'LogcatPosition':
     """Captures a snapshot of a logcat file at the current moment."""
     try:
-      file_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+      file_size = logcat_storage.file_size(file_path)
     except OSError:
       file_size = 0
     return cls(
@@ -129,39 +273,52 @@ class LogcatPosition:
       str_t1, str_t2 = str(t1 or ''), str(t2 or '')
       return (str_t1 > str_t2) - (str_t1 < str_t2)
 
+  def _get_time_key(self) -> Optional[int]:
+    """Returns the integer sort key of the timestamp, see `_timestamp_key`."""
+    try:
+      return self.__dict__['_time_key']
+    except KeyError:
+      time_key = _timestamp_key(self.timestamp)
+      object.__setattr__(self, '_time_key', time_key)
+      return time_key
+
   def __lt__(self, other: Any) -> bool:
     if not isinstance(other, LogcatPosition):
       return NotImplemented
     if self._byte_offset != other._byte_offset:
       return self._byte_offset < other._byte_offset
-    return self._compare_timestamps(self.timestamp, other.timestamp) < 0
+    return _compare_times(self, other) < 0
 
   def __le__(self, other: Any) -> bool:
     if not isinstance(other, LogcatPosition):
       return NotImplemented
     if self._byte_offset != other._byte_offset:
       return self._byte_offset <= other._byte_offset
-    return self._compare_timestamps(self.timestamp, other.timestamp) <= 0
+    return _compare_times(self, other) <= 0
 
   def __gt__(self, other: Any) -> bool:
     if not isinstance(other, LogcatPosition):
       return NotImplemented
     if self._byte_offset != other._byte_offset:
       return self._byte_offset > other._byte_offset
-    return self._compare_timestamps(self.timestamp, other.timestamp) > 0
+    return _compare_times(self, other) > 0
 
   def __ge__(self, other: Any) -> bool:
     if not isinstance(other, LogcatPosition):
       return NotImplemented
     if self._byte_offset != other._byte_offset:
       return self._byte_offset >= other._byte_offset
-    return self._compare_timestamps(self.timestamp, other.timestamp) >= 0
+    return _compare_times(self, other) >= 0
 
 
-@dataclasses.dataclass(frozen=True)
 class LogLine:
   """Represents a single parsed Android logcat line in threadtime format.
 
+  Lines are immutable and compare like frozen dataclasses. As many lines are
+  buffered and collected, they are stored compactly: the timestamp and message
+  are slices of the raw line taken on access, tags are interned, and the
+  position is created on access.
+
   Attributes:
     position: LogcatPosition, position marker and timestamp of this log line.
     pid: int, process ID.
@@ -173,12 +330,26 @@ class LogLine:
     raw: str, original raw log line string without line endings.
   """
 
-  position: LogcatPosition
+  __slots__ = (
+      'pid',
+      'tid',
+      'level',
+      'tag',
+      'raw',
+      # Start of the message in `raw`, or the message if it is not a suffix.
+      '_message',
+      # End of the timestamp in `raw`, or the timestamp if it is not a prefix.
+      '_timestamp',
+      # Integer sort key of the timestamp, set on first use.
+      '_time_key',
+      '_byte_offset',
+      '_creation_time',
+  )
+
   pid: int
   tid: int
   level: str
   tag: str
-  message: str
   raw: str
 
   _PATTERN: ClassVar[Pattern[str]] = re.compile(
@@ -192,10 +363,81 @@ class LogLine:
       r'(?P<message>.*)$'
   )
 
+  def __init__(
+      self,
+      position: LogcatPosition,
+      pid: int,
+      tid: int,
+      level: str,
+      tag: str,
+      message: str,
+      raw: str,
+  ):
+    timestamp = position.timestamp
+    self._init(
+        raw=raw,
+        pid=pid,
+        tid=tid,
+        level=level,
+        tag=tag,
+        message=(len(raw) - len(message) if raw.endswith(message) else message),
+        timestamp=(
+            len(timestamp)
+            if timestamp and raw.startswith(timestamp)
+            else timestamp
+        ),
+        byte_offset=position._byte_offset,
+        creation_time=position.creation_time,
+    )
+
+  def _init(
+      self,
+      raw: str,
+      pid: int,
+      tid: int,
+      level: str,
+      tag: str,
+      message: Union[int, str],
+      timestamp: Union[int, str, None],
+      byte_offset: int,
+      creation_time: float,
+  ) -> None:
+    """Sets the fields of this immutable line."""
+    set_field = object.__setattr__
+    set_field(self, 'raw', raw)
+    set_field(self, 'pid', pid)
+    set_field(self, 'tid', tid)
+    set_field(self, 'level', level)
+    set_field(self, 'tag', sys.intern(tag))
+    set_field(self, '_message', message)
+    set_field(self, '_timestamp', timestamp)
+    set_field(self, '_byte_offset', byte_offset)
+    set_field(self, '_creation_time', creation_time)
+
+  @property
+  def message(self) -> str:
+    """Returns the message payload of this log line."""
+    message = self._message
+    return self.raw[message:] if isinstance(message, int) else message
+
+  def _position_timestamp(self) -> Optional[str]:
+    """Returns the timestamp of the position of this log line."""
+    timestamp = self._timestamp
+    return self.raw[:timestamp] if isinstance(timestamp, int) else timestamp
+
   @property
   def timestamp(self) -> str:
     """Returns the string timestamp of this log line."""
-    return self.position.timestamp or ''
+    return self._position_timestamp() or ''
+
+  @property
+  def position(self) -> LogcatPosition:
+    """Returns the position marker of this log line."""
+    return LogcatPosition(
+        timestamp=self._position_timestamp(),
+        creation_time=self._creation_time,
+        _byte_offset=self._byte_offset,
+    )
 
   @classmethod
   def from_string(cls, line: str, byte_offset: int = 0) -> Optional['LogLine']:
@@ -204,306 +446,2484 @@ class LogLine:
       return None
 
     clean_line = line.rstrip('\r\n')
-    match = cls._PATTERN.match(clean_line)
-    if not match:
-      return None
+    if '\n' in clean_line:
+      # Whitespace matched by `_PATTERN` may include line feeds.
+      match = cls._PATTERN.match(clean_line)
+      if not match:
+        return None
+      fields = match.group('timestamp', 'pid', 'tid', 'level', 'tag') + (
+          match.start('message'),
+      )
+    else:
+      fields = _split_threadtime(clean_line)
+      if fields is None:
+        return None
+    timestamp, pid, tid, level, tag, message_start = fields
 
     try:
-      pos = LogcatPosition(
-          timestamp=match.group('timestamp'),
-          _byte_offset=byte_offset,
-      )
-      return cls(
-          position=pos,
-          pid=int(match.group('pid')),
-          tid=int(match.group('tid')),
-          level=match.group('level'),
-          tag=match.group('tag'),
-          message=match.group('message'),
+      log_line = cls.__new__(cls)
+      log_line._init(
           raw=clean_line,
+          pid=int(pid),
+          tid=int(tid),
+          level=level,
+          tag=tag,
+          message=message_start,
+          timestamp=len(timestamp),
+          byte_offset=byte_offset,
+          creation_time=time.time(),
       )
+      return log_line
     except (ValueError, TypeError, IndexError):
       return None
 
   def matches(
       self,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
+      pattern: Optional[Union[str, Pattern[str], 'LogcatFilter']] = None,
       tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
       level: Optional[Union[str, Sequence[str], Set[str]]] = None,
   ) -> bool:
-    """Checks if this log line matches the given pattern, tag, and/or level."""
-    if pattern is not None:
-      regex = re.compile(pattern) if isinstance(pattern, str) else pattern
-      if not (regex.search(self.message) or regex.search(self.raw)):
-        return False
-
-    if tag is not None:
-      if isinstance(tag, str):
-        if self.tag != tag:
-          return False
-      elif hasattr(tag, 'search'):
-        if not tag.search(self.tag):
-          return False
-      elif isinstance(tag, Iterable) and self.tag not in tag:
-        return False
-
-    if level is not None:
-      levels = {level} if isinstance(level, str) else set(level)
-      norm_levels = {
-          _LEVEL_NORM_MAP.get(str(l).upper(), str(l).upper()) for l in levels
-      }
-      self_norm = _LEVEL_NORM_MAP.get(self.level.upper(), self.level.upper())
-      if self.level not in levels and self_norm not in norm_levels:
-        return False
+    """Checks if this log line matches the given pattern, tag, and/or level.
 
-    return True
+    To match many lines against the same criteria, create a
+    :class:`LogcatFilter` once and pass it as ``pattern`` instead.
+    """
+    return _to_filter(pattern, tag, level).matches(self)
 
   @property
   def is_error(self) -> bool:
     """Returns True if this line represents an error or fatal severity."""
     return self.level.upper() in ('E', 'F', 'A')
 
+  def _get_time_key(self) -> Optional[int]:
+    """Returns the integer sort key of the timestamp, see `_timestamp_key`."""
+    try:
+      return self._time_key
+    except AttributeError:
+      time_key = _timestamp_key(self._position_timestamp())
+      object.__setattr__(self, '_time_key', time_key)
+      return time_key
+
+  def _astuple(self) -> tuple[Any, ...]:
+    return (
+        self._position_timestamp(),
+        self._creation_time,
+        self._byte_offset,
+        self.pid,
+        self.tid,
+        self.level,
+        self.tag,
+        self.message,
+        self.raw,
+    )
+
+  def __eq__(self, other: Any) -> bool:
+    if other.__class__ is not self.__class__:
+      return NotImplemented
+    return self._astuple() == other._astuple()
+
+  def __hash__(self) -> int:
+    return hash(self._astuple())
+
+  def __repr__(self) -> str:
+    return (
+        f'{self.__class__.__qualname__}(position={self.position!r},'
+        f' pid={self.pid!r}, tid={self.tid!r}, level={self.level!r},'
+        f' tag={self.tag!r}, message={self.message!r}, raw={self.raw!r})'
+    )
+
+  def __setattr__(self, name: str, value: Any) -> None:
+    raise dataclasses.FrozenInstanceError(f'cannot assign to field {name!r}')
+
+  def __delattr__(self, name: str) -> None:
+    raise dataclasses.FrozenInstanceError(f'cannot delete field {name!r}')
+
+  def __reduce__(self) -> tuple[Any, ...]:
+    return (
+        _restore_log_line,
+        (
+            self.__class__,
+            self.raw,
+            self.pid,
+            self.tid,
+            self.level,
+            self.tag,
+            self._message,
+            self._timestamp,
+            self._byte_offset,
+            self._creation_time,
+        ),
+    )
+
   def __lt__(self, other: Any) -> bool:
     if not isinstance(other, LogLine):
       return NotImplemented
-    return self.position < other.position
+    if self._byte_offset != other._byte_offset:
+      return self._byte_offset < other._byte_offset
+    return _compare_times(self, other) < 0
 
   def __le__(self, other: Any) -> bool:
     if not isinstance(other, LogLine):
       return NotImplemented
-    return self.position <= other.position
+    if self._byte_offset != other._byte_offset:
+      return self._byte_offset <= other._byte_offset
+    return _compare_times(self, other) <= 0
 
   def __gt__(self, other: Any) -> bool:
     if not isinstance(other, LogLine):
       return NotImplemented
-    return self.position > other.position
+    if self._byte_offset != other._byte_offset:
+      return self._byte_offset > other._byte_offset
+    return _compare_times(self, other) > 0
 
   def __ge__(self, other: Any) -> bool:
     if not isinstance(other, LogLine):
       return NotImplemented
-    return self.position >= other.position
+    if self._byte_offset != other._byte_offset:
+      return self._byte_offset >= other._byte_offset
+    return _compare_times(self, other) >= 0
+
+
+def _restore_log_line(cls: type[LogLine], *fields: Any) -> LogLine:
+  """Recreates a pickled `LogLine` from its stored fields."""
+  log_line = cls.__new__(cls)
+  log_line._init(*fields)
+  return log_line
+
+
+def _log_line_from_text(
+    text_line: logcat_binary.TextLine, byte_offset: int
+) -> LogLine:
+  """Creates a `LogLine` from the columns of a decoded binary entry."""
+  log_line = LogLine.__new__(LogLine)
+  log_line._init(
+      raw=text_line.raw,
+      pid=text_line.pid,
+      tid=text_line.tid,
+      level=text_line.level,
+      tag=text_line.tag,
+      message=text_line.message_start,
+      timestamp=text_line.timestamp_end,
+      byte_offset=byte_offset,
+      creation_time=time.time(),
+  )
+  return log_line
 
 
-class LogcatListenerContext:
-  """Context manager for listening to real-time logcat events."""
+class LogcatFilter:
+  """Log line criteria compiled once to match many lines.
+
+  Creating a filter compiles the pattern and normalizes the tag and level
+  criteria up front, instead of for every line scanned. Filters can be passed
+  as the ``pattern`` argument of :meth:`LogcatProcessor.get_lines`,
+  :meth:`LogcatProcessor.tail` and :meth:`LogcatProcessor.listen`, and as
+  items of the ``patterns`` of :meth:`LogcatProcessor.wait_for`.
+
+  Examples::
+
+    crash_filter = LogcatFilter(r'FATAL EXCEPTION', level=['E', 'F'])
+    lines = ad.services.logcat.get_lines(crash_filter, since=start)
+
+  Attributes:
+    pattern: Compiled regular expression matched against message and raw
+      line, or None.
+    tag: Tag string, compiled regex pattern, or collection of tags to match,
+      or None.
+    level: Severity level string or collection of levels to match, or None.
+  """
 
   def __init__(
       self,
-      processor: 'LogcatProcessor',
       pattern: Optional[Union[str, Pattern[str]]] = None,
       tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
       level: Optional[Union[str, Sequence[str], Set[str]]] = None,
-      position: Optional[Union[LogcatPosition, LogLine]] = None,
-      max_events: int = 1000,
-      timeout_error_cls: type[Exception] = TimeoutError,
   ):
-    self._processor = processor
-    self._pattern = pattern
-    self._tag = tag
-    self._level = level
-    self._position = (
-        position.position if isinstance(position, LogLine) else position
-    )
-    self._max_events = max_events
-    self._timeout_error_cls = timeout_error_cls
-    self._events: collections.deque[LogLine] = collections.deque(
-        maxlen=max_events
-    )
-    self._queue: queue.Queue[LogLine] = queue.Queue(maxsize=max_events)
-    self._lock = threading.Lock()
-    self._stop_event = threading.Event()
-    self._thread: Optional[threading.Thread] = None
+    self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+    self.tag = tag
+    self.level = level
+    self._tag_value: Optional[str] = None
+    self._tag_regex: Optional[Pattern[str]] = None
+    self._tag_values: Optional[Any] = None
+    if isinstance(tag, str):
+      self._tag_value = tag
+    elif hasattr(tag, 'search'):
+      self._tag_regex = tag
+    elif isinstance(tag, Iterable):
+      try:
+        self._tag_values = frozenset(tag)
+      except TypeError:
+        self._tag_values = tag
+    self._levels: Optional[set[Any]] = None
+    self._norm_levels: set[str] = set()
+    # Whether a line level is accepted, filled in as levels are encountered.
+    self._level_results: dict[str, bool] = {}
+    if level is not None:
+      self._levels = {level} if isinstance(level, str) else set(level)
+      self._norm_levels = {
+          _LEVEL_NORM_MAP.get(str(l).upper(), str(l).upper())
+          for l in self._levels
+      }
+    self._init_screen()
+
+  def _init_screen(self) -> None:
+    """Derives cheap checks on raw lines from the criteria, see `screen`."""
+    # Byte strings that all appear in every matching raw line.
+    self._needles: list[bytes] = []
+    # Byte strings of which at least one appears in every matching raw line.
+    self._any_needles: Optional[tuple[bytes, ...]] = None
+    # Level column values of the matching lines.
+    self._level_columns: Optional[frozenset[bytes]] = None
+    # Pattern that must match every matching decoded raw line.
+    self._raw_pattern: Optional[Pattern[str]] = None
+    literal = _literal_of(self.pattern)
+    if literal:
+      self._needles.append(literal.encode('utf-8'))
+    elif _is_position_independent(self.pattern):
+      # A match in the message is also a match in the raw line, which ends
+      # with the message.
+      self._raw_pattern = self.pattern
+    if self._tag_value:
+      self._needles.append(self._tag_value.encode('utf-8'))
+    elif (
+        isinstance(self._tag_values, frozenset)
+        and 0 < len(self._tag_values) <= _MAX_SCREEN_TAGS
+        and all(isinstance(t, str) and t for t in self._tag_values)
+    ):
+      self._any_needles = tuple(t.encode('utf-8') for t in self._tag_values)
+    # Byte string or bytes pattern found in every matching raw line.
+    self._search_key: Optional[Union[bytes, Pattern[bytes]]] = None
+    if self._needles:
+      self._search_key = max(self._needles, key=len)
+    elif self._raw_pattern is not None:
+      self._search_key = _to_bytes_pattern(self._raw_pattern)
+    if self._search_key is None and self._any_needles is not None:
+      self._search_key = re.compile(
+          b'|'.join(re.escape(needle) for needle in self._any_needles)
+      )
+    if self._levels is not None:
+      self._level_columns = frozenset(
+          l.encode('ascii') for l in 'VDIWEFSA' if self._accepts_level(l)
+      )
+
+  def screen(self, raw: bytes) -> Optional[str]:
+    """Decodes a raw line read from a file if it may match this filter.
+
+    Lines are checked for required substrings and their level column before
+    being decoded, and against position independent patterns before being
+    parsed. These checks only reject lines that can not match.
+
+    Args:
+      raw: The undecoded line, without the line feed.
+
+    Returns:
+      The decoded line, to be parsed and checked with `matches`, or None if
+      the line can not match.
+    """
+    for needle in self._needles:
+      if needle not in raw:
+        return None
+    if self._any_needles is not None and not any(
+        needle in raw for needle in self._any_needles
+    ):
+      return None
+    if self._level_columns is not None:
+      parts = raw.split(None, 5)
+      # Only trust the level column of lines with the plain threadtime layout.
+      if (
+          len(parts) == 6
+          and len(parts[4]) == 1
+          and parts[2].isdigit()
+          and parts[3].isdigit()
+          and parts[4] not in self._level_columns
+      ):
+        return None
+    text = _decode_line(raw)
+    if self._raw_pattern is not None and not self._raw_pattern.search(
+        text.rstrip('\r\n')
+    ):
+      return None
+    return text
 
   @property
-  def events(self) -> list[LogLine]:
-    """Returns a snapshot list of captured events."""
-    with self._lock:
-      return list(self._events)
+  def _cache_key(self) -> Optional[tuple[Any, ...]]:
+    """A key equal for filters with the same criteria.
+
+    None if the criteria are not hashable.
+    """
+    pattern = None
+    if self.pattern is not None:
+      pattern = (self.pattern.pattern, self.pattern.flags)
+    tag = None
+    if self._tag_value is not None:
+      tag = ('value', self._tag_value)
+    elif self._tag_regex is not None:
+      tag = ('regex', self._tag_regex.pattern, self._tag_regex.flags)
+    elif self._tag_values is not None:
+      if not isinstance(self._tag_values, frozenset):
+        return None
+      tag = ('values', self._tag_values)
+    return (pattern, tag, self._level_columns)
+
+  def _accepts_level(self, level: str) -> bool:
+    result = self._level_results.get(level)
+    if result is None:
+      norm = _LEVEL_NORM_MAP.get(level.upper(), level.upper())
+      result = level in self._levels or norm in self._norm_levels
+      self._level_results[level] = result
+    return result
+
+  def matches(self, line: 'LogLine') -> bool:
+    """Checks if a log line satisfies all criteria of this filter."""
+    if self._tag_value is not None:
+      if line.tag != self._tag_value:
+        return False
+    elif self._tag_regex is not None:
+      if not self._tag_regex.search(line.tag):
+        return False
+    elif self._tag_values is not None and line.tag not in self._tag_values:
+      return False
+    if self._levels is not None and not self._accepts_level(line.level):
+      return False
+    if self.pattern is not None:
+      return bool(
+          self.pattern.search(line.message) or self.pattern.search(line.raw)
+      )
+    return True
 
-  def has_events(self) -> bool:
-    """Returns True if any events have been captured."""
-    with self._lock:
-      return bool(self._events)
+  def __repr__(self) -> str:
+    return (
+        f'LogcatFilter(pattern={self.pattern!r}, tag={self.tag!r},'
+        f' level={self.level!r})'
+    )
 
-  def get_next_event(self, timeout: Optional[float] = None) -> LogLine:
-    """Gets the next event from the queue, blocking up to timeout seconds."""
-    try:
-      return self._queue.get(block=True, timeout=timeout)
-    except queue.Empty:
-      raise self._timeout_error_cls(
-          f'Timed out after {timeout}s waiting for next logcat event '
-          f'(pattern={self._pattern!r}, tag={self._tag!r},'
-          f' level={self._level!r})'
+
+def _literal_of(pattern: Optional[Pattern[str]]) -> Optional[str]:
+  """Returns the pattern source if the pattern only matches itself."""
+  if pattern is None or pattern.flags & (re.IGNORECASE | re.VERBOSE):
+    return None
+  source = pattern.pattern
+  if not isinstance(source, str) or any(c in source for c in _REGEX_SPECIALS):
+    return None
+  return source
+
+
+def _is_position_independent(pattern: Optional[Pattern[str]]) -> bool:
+  """Checks if a pattern can match a string only where it matches a suffix.
+
+  Start anchors and lookbehinds depend on what precedes the match, so such
+  patterns may match a message but not the raw line that ends with it.
+  """
+  if pattern is None or not isinstance(pattern.pattern, str):
+    return False
+  source = pattern.pattern
+  return '^' not in source and '\\A' not in source and '(?<' not in source
+
+
+def _to_bytes_pattern(pattern: Pattern[str]) -> Optional[Pattern[bytes]]:
+  """Compiles a pattern for UTF-8 bytes that matches wherever it matches text.
+
+  Only ASCII patterns without classes, `.`, `$`, letter escapes or case
+  folding are converted, as these match differently in text and in bytes.
+
+  Returns:
+    The bytes pattern, or None if the pattern can not be converted safely.
+  """
+  source = pattern.pattern
+  if (
+      not isinstance(source, str)
+      or not source.isascii()
+      or pattern.flags & re.IGNORECASE
+  ):
+    return None
+  escaped = re.findall(r'\\(.)', source, re.DOTALL)
+  if any(c.isalpha() for c in escaped):
+    return None
+  unescaped = re.sub(r'\\.', '', source, flags=re.DOTALL)
+  if any(c in unescaped for c in '.[$'):
+    return None
+  try:
+    return re.compile(source.encode('ascii'), pattern.flags & re.VERBOSE)
+  except re.error:
+    return None
+
+
+def _find_mapped_lines(
+    data: Union[bytes, mmap.mmap],
+    key: Union[bytes, Pattern[bytes]],
+    begin: int,
+    end: int,
+) -> list[tuple[int, int]]:
+  """Finds the lines of `data[begin:end]` that contain a match of `key`.
+
+  `begin` must be the start of a line, and `end` the end of the mapped data
+  or the start of a line.
+
+  Returns:
+    The (start, end) offsets of the lines, without their line feeds.
+  """
+  lines = []
+  pos = begin
+  while pos < end:
+    if isinstance(key, bytes):
+      hit = data.find(key, pos, end)
+      if hit < 0:
+        break
+    else:
+      match = key.search(data, pos, end)
+      if match is None:
+        break
+      hit = match.start()
+    line_start = data.rfind(b'\n', pos, hit) + 1 or pos
+    line_end = data.find(b'\n', hit, end)
+    if line_end < 0:
+      line_end = end
+    lines.append((line_start, line_end))
+    pos = line_end + 1
+  return lines
+
+
+def _mapped_windows(
+    data: Union[bytes, mmap.mmap], begin: int, end: int
+) -> list[tuple[int, int]]:
+  """Splits `data[begin:end]` into windows of whole lines."""
+  windows = []
+  lo = begin
+  while lo < end:
+    hi = data.find(b'\n', min(lo + _MAPPED_WINDOW_SIZE, end) - 1, end)
+    hi = end if hi < 0 else hi + 1
+    windows.append((lo, hi))
+    lo = hi
+  return windows
+
+
+def _to_filter(
+    pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
+    tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+    level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+) -> LogcatFilter:
+  """Returns `pattern` if it is a filter, or compiles the criteria into one."""
+  if isinstance(pattern, LogcatFilter):
+    if tag is not None or level is not None:
+      raise ValueError(
+          'tag and level can not be specified together with a LogcatFilter,'
+          ' set them on the filter instead.'
       )
+    return pattern
+  return LogcatFilter(pattern=pattern, tag=tag, level=level)
 
-  def _dispatch(self, line: LogLine) -> None:
-    if line.matches(pattern=self._pattern, tag=self._tag, level=self._level):
-      with self._lock:
-        self._events.append(line)
-      try:
-        self._queue.put_nowait(line)
-      except queue.Full:
-        pass
 
-  def _listen_loop(self) -> None:
-    current_offset = (
-        self._position._byte_offset
-        if self._position
-        else LogcatPosition.from_file(self._processor.file_path)._byte_offset
-    )
-    while not self._stop_event.is_set():
-      for offset, line in self._processor._iter_lines(offset=current_offset):
-        current_offset = offset
-        self._dispatch(line)
-        if self._stop_event.is_set():
-          break
-      time.sleep(0.05)
+def _combine_patterns(
+    filters: Sequence[LogcatFilter],
+) -> Optional[Pattern[str]]:
+  """Combines the patterns of filters into a single alternation regex.
 
-  def __enter__(self) -> 'LogcatListenerContext':
-    self._stop_event.clear()
-    self._thread = threading.Thread(target=self._listen_loop, daemon=True)
-    self._thread.start()
-    return self
+  A line that matches any of the filters also matches the combined regex, so
+  lines can be screened with one search instead of one per filter.
 
-  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-    self._stop_event.set()
-    if self._thread and self._thread.is_alive():
-      self._thread.join(timeout=2.0)
-    self._thread = None
+  Returns:
+    The combined regex, or None if the patterns can not be combined safely,
+    e.g. because a filter has no pattern, the flags differ, or a pattern
+    uses backreferences whose numbering would change.
+  """
+  if len(filters) < 2 or any(f.pattern is None for f in filters):
+    return None
+  flags = {f.pattern.flags for f in filters}
+  if len(flags) != 1:
+    return None
+  sources = [f.pattern.pattern for f in filters]
+  if any(
+      not isinstance(src, str) or re.search(r'\\\d|\(\?P=', src)
+      for src in sources
+  ):
+    return None
+  try:
+    return re.compile('|'.join(f'(?:{src})' for src in sources), flags.pop())
+  except re.error:
+    return None
+
+
+def _timestamp_keys(
+    year: int,
+    month: int,
+    day: int,
+    hour: int,
+    minute: int,
+    second: int,
+    microsecond: int,
+) -> tuple[int, int]:
+  """Packs timestamp fields into (full, yearless) integer sort keys."""
+  yearless = (
+      (((month * 32 + day) * 24 + hour) * 60 + minute) * 60 + second
+  ) * 1000000 + microsecond
+  return year * _YEAR_KEY_SPAN + yearless, yearless
+
+
+def _timestamp_key(timestamp: Optional[str]) -> Optional[int]:
+  """Packs a timestamp string into its full integer sort key.
+
+  Returns:
+    The key, or None if the timestamp can not be parsed, or has fields out of
+    the ranges `_timestamp_keys` can pack while keeping the order.
+  """
+  if not timestamp:
+    return None
+  try:
+    fields = LogcatPosition._parse_timestamp(timestamp)
+  except (ValueError, IndexError):
+    return None
+  _, month, day, hour, minute, second, microsecond = fields
+  if (
+      min(fields) < 0
+      or month > 12
+      or day > 31
+      or hour > 23
+      or minute > 59
+      or second > 59
+      or microsecond > 999999
+  ):
+    return None
+  return _timestamp_keys(*fields)[0]
 
 
-class LogcatProcessor:
-  """Thread-safe processor for querying and streaming logcat files."""
+def _compare_times(
+    first: Union[LogcatPosition, 'LogLine'],
+    second: Union[LogcatPosition, 'LogLine'],
+) -> int:
+  """Compares the timestamps of positions or lines chronologically.
+
+  This has the semantics of `LogcatPosition._compare_timestamps`, but
+  compares the cached integer sort keys of the timestamps instead of parsing
+  them again. Timestamps without a key are compared as strings.
+  """
+  key, other_key = first._get_time_key(), second._get_time_key()
+  if key is None or other_key is None:
+    return LogcatPosition._compare_timestamps(first.timestamp, second.timestamp)
+  if key < _YEAR_KEY_SPAN or other_key < _YEAR_KEY_SPAN:
+    key %= _YEAR_KEY_SPAN
+    other_key %= _YEAR_KEY_SPAN
+  return (key > other_key) - (key < other_key)
+
+
+def _index_stamp_keys(stamp: tuple[bytes, ...]) -> tuple[int, int]:
+  """Converts a `_INDEX_TIMESTAMP_PATTERN` match into integer sort keys."""
+  year, month, day, hour, minute, second, fraction = stamp
+  return _timestamp_keys(
+      int(year or 0),
+      int(month),
+      int(day),
+      int(hour),
+      int(minute),
+      int(second),
+      int(fraction.ljust(6, b'0')[:6]),
+  )
+
+
+class _TimestampIndex:
+  """Sparse, incrementally built map of device timestamps to byte offsets.
+
+  Roughly every `interval` bytes, a checkpoint records the offset of a line
+  start and the largest timestamps of all lines before it. Logcat files are
+  not strictly sorted (log buffers interleave, and lines with and without a
+  year can be mixed), so checkpoints hold running maxima rather than the
+  timestamp found at the offset. The maxima only grow, which keeps the
+  checkpoints bisectable and guarantees that every line before the offset
+  returned by `find_offset` is older than the requested timestamp.
+
+  Three maxima are tracked so that the result agrees with
+  `LogcatPosition._compare_timestamps`, which ignores the year whenever one of
+  the two timestamps has none: the full key of dated lines, the yearless key
+  of all lines, and the yearless key of undated lines.
+  """
 
   def __init__(
-      self,
-      file_path: str,
-      timeout_error_cls: type[Exception] = TimeoutError,
+      self, file_path: str, interval: int = DEFAULT_INDEX_INTERVAL_BYTES
   ):
     self._file_path = file_path
-    self._timeout_error_cls = timeout_error_cls
+    self._interval = interval
+    self._lock = threading.Lock()
+    self._reset()
+
+  def _reset(self) -> None:
+    self._offsets: list[int] = []
+    self._dated_maxima: list[int] = []
+    self._yearless_maxima: list[int] = []
+    self._undated_maxima: list[int] = []
+    self._indexed_offset = 0
+    self._max_dated = -1
+    self._max_yearless = -1
+    self._max_undated = -1
 
   @property
-  def file_path(self) -> str:
-    return self._file_path
+  def indexed_offset(self) -> int:
+    """The offset up to which complete lines have been indexed."""
+    return self._indexed_offset
 
-  def _iter_lines(self, offset: int = 0) -> Iterator[tuple[int, LogLine]]:
-    """Yields (line_offset, LogLine) pairs from file from given offset."""
-    if not os.path.exists(self._file_path):
-      return
+  def update(self) -> None:
+    """Indexes the complete lines appended since the last update."""
+    with self._lock:
+      self._update()
+
+  def _update(self) -> None:
     try:
-      with open(
-          self._file_path, 'r', encoding='utf-8', errors='replace', newline=''
-      ) as f:
-        if offset > 0:
-          f.seek(offset)
-        while True:
-          line_offset = f.tell()
-          line = f.readline()
-          if not line:
+      with logcat_storage.SegmentedFileReader(self._file_path) as reader:
+        file_size = reader.size()
+        if file_size < self._indexed_offset:
+          # The file was truncated or replaced, previous checkpoints are stale.
+          self._reset()
+        read_offset = self._indexed_offset
+        pending = b''
+        while read_offset < file_size:
+          chunk = reader.read(read_offset, _INDEX_READ_SIZE)
+          if not chunk:
             break
-          current_offset = f.tell()
-          parsed = LogLine.from_string(line, byte_offset=line_offset)
-          if parsed is not None:
-            yield current_offset, parsed
+          read_offset += len(chunk)
+          data = pending + chunk
+          # Only complete lines are indexed, the rest waits for the next read.
+          end = data.rfind(b'\n') + 1
+          if end:
+            self._index_lines(data, end)
+            self._indexed_offset += end
+          pending = data[end:]
     except OSError:
       return
 
-  def get_lines(
-      self,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
-      *,
-      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
-      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
-      since: Optional[Union[LogcatPosition, LogLine]] = None,
-      max_lines: Optional[int] = None,
-  ) -> list[LogLine]:
-    """Gets log lines from the file satisfying filter criteria."""
-    if (
-        pattern is None
-        and tag is None
-        and level is None
-        and since is None
-        and max_lines is None
-    ):
-      raise ValueError(
-          'At least one filter criteria (pattern, tag, level, since, or'
-          ' max_lines) must be specified. To inspect the latest logs, use'
-          ' tail() instead.'
+  def _index_lines(self, data: bytes, end: int) -> None:
+    """Indexes `data[:end]`, which starts at `self._indexed_offset`."""
+    pos = 0
+    while pos < end:
+      offset = self._indexed_offset + pos
+      if not self._offsets or offset - self._offsets[-1] >= self._interval:
+        self._offsets.append(offset)
+        self._dated_maxima.append(self._max_dated)
+        self._yearless_maxima.append(self._max_yearless)
+        self._undated_maxima.append(self._max_undated)
+      # Consume whole lines up to where the next checkpoint may start.
+      next_checkpoint = (
+          self._offsets[-1] + self._interval - self._indexed_offset
+      )
+      newline = data.find(b'\n', max(next_checkpoint - 1, pos), end)
+      block_end = end if newline < 0 else newline + 1
+      self._absorb(data, pos, block_end)
+      pos = block_end
+
+  def _absorb(self, data: bytes, start: int, end: int) -> None:
+    """Folds the timestamps of the lines in `data[start:end]` into maxima."""
+    stamps = _INDEX_TIMESTAMP_PATTERN.findall(data, start, end)
+    if not stamps:
+      return
+    # Byte fields are fixed width except the fraction, whose digits compare
+    # lexicographically like decimals, so tuple order is chronological order.
+    # Undated stamps have an empty year and sort before all dated ones.
+    newest = max(stamps)
+    has_undated = not min(stamps)[0]
+    if newest[0]:
+      self._max_dated = max(self._max_dated, _index_stamp_keys(newest)[0])
+      newest_yearless = max(stamp[1:] for stamp in stamps)
+      self._max_yearless = max(
+          self._max_yearless, _index_stamp_keys((b'',) + newest_yearless)[1]
       )
+      if has_undated:
+        newest_undated = max(stamp for stamp in stamps if not stamp[0])
+        self._max_undated = max(
+            self._max_undated, _index_stamp_keys(newest_undated)[1]
+        )
+    else:
+      yearless = _index_stamp_keys(newest)[1]
+      self._max_yearless = max(self._max_yearless, yearless)
+      self._max_undated = max(self._max_undated, yearless)
 
-    pos = since.position if isinstance(since, LogLine) else since
-    offset = pos._byte_offset if pos else 0
-    begin_time = pos.timestamp if pos and offset == 0 else None
+  def find_offset(self, timestamp: str) -> int:
+    """Finds where to start scanning for lines not older than `timestamp`.
 
-    results: list[LogLine] = []
-    for _, parsed in self._iter_lines(offset=offset):
-      if (
-          begin_time
-          and LogcatPosition._compare_timestamps(parsed.timestamp, begin_time)
-          < 0
-      ):
-        continue
-      if parsed.matches(pattern=pattern, tag=tag, level=level):
-        results.append(parsed)
-        if max_lines is not None and len(results) >= max_lines:
-          break
-    return results
+    Args:
+      timestamp: The device timestamp to search for.
 
-  def tail(
-      self,
-      num_lines: int = 100,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
-      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
-      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
-  ) -> list[LogLine]:
-    """Tails last num_lines matching log lines reading backwards from EOF."""
-    if num_lines <= 0 or not os.path.exists(self._file_path):
-      return []
+    Returns:
+      A line start offset such that every line before it is strictly older
+      than `timestamp`. Falls back to 0 if the timestamp can not be parsed.
+    """
+    try:
+      parts = LogcatPosition._parse_timestamp(timestamp)
+    except (ValueError, IndexError):
+      return 0
+    full, yearless = _timestamp_keys(*parts)
+    has_year = parts[0] != 0
 
-    buf: collections.deque[LogLine] = collections.deque()
-    block_size = 64 * 1024  # 64KB chunks
+    def _all_older(dated_max: int, yearless_max: int, undated_max: int) -> bool:
+      if has_year:
+        return dated_max < full and undated_max < yearless
+      return yearless_max < yearless
 
-    try:
-      with open(self._file_path, 'rb') as f:
-        f.seek(0, os.SEEK_END)
-        file_size = f.tell()
-        if file_size == 0:
-          return []
+    with self._lock:
+      self._update()
+      if _all_older(self._max_dated, self._max_yearless, self._max_undated):
+        return self._indexed_offset
+      # Bisect for the last checkpoint preceded only by older lines.
+      lo, hi = 0, len(self._offsets)
+      while lo < hi:
+        mid = (lo + hi) // 2
+        if _all_older(
+            self._dated_maxima[mid],
+            self._yearless_maxima[mid],
+            self._undated_maxima[mid],
+        ):
+          lo = mid + 1
+        else:
+          hi = mid
+      return self._offsets[lo - 1] if lo else 0
 
-        remaining = file_size
-        remainder = b''
-        lines_to_process: list[tuple[int, bytes]] = []
 
-        while remaining > 0 and len(buf) < num_lines:
-          read_size = min(block_size, remaining)
-          remaining -= read_size
-          f.seek(remaining)
-          chunk = f.read(read_size)
-          data = chunk + remainder
+class _PollingWatcher:
+  """Waits for file changes by sleeping for a short polling interval."""
 
-          # Split lines from chunk
-          split = data.split(b'\n')
-          if remaining > 0:
-            remainder = split[0]
-            lines_chunk = split[1:]
-          else:
+  def __init__(self):
+    self._wakeup = threading.Event()
+
+  def wait(self, timeout: float) -> None:
+    self._wakeup.wait(min(timeout, _TAIL_POLL_INTERVAL_SEC))
+    self._wakeup.clear()
+
+  def interrupt(self) -> None:
+    self._wakeup.set()
+
+  def close(self) -> None:
+    pass
+
+
+class _InotifyWatcher:
+  """Waits for file changes with Linux inotify, accessed through libc."""
+
+  def __init__(self, file_path: str):
+    libc = ctypes.CDLL(None, use_errno=True)
+    self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed.')
+    mask = (
+        _IN_MODIFY
+        | _IN_ATTRIB
+        | _IN_CLOSE_WRITE
+        | _IN_DELETE_SELF
+        | _IN_MOVE_SELF
+    )
+    if libc.inotify_add_watch(self._fd, os.fsencode(file_path), mask) < 0:
+      errno = ctypes.get_errno()
+      os.close(self._fd)
+      raise OSError(errno, f'inotify_add_watch failed for {file_path}.')
+    # Self-pipe used to wake up a blocked `wait` from another thread.
+    self._wakeup_read, self._wakeup_write = os.pipe()
+    os.set_blocking(self._wakeup_read, False)
+    os.set_blocking(self._wakeup_write, False)
+
+  @classmethod
+  def create(cls, file_path: str) -> Optional['_InotifyWatcher']:
+    """Creates a watcher, or returns None if inotify is not available."""
+    if platform.system() != 'Linux':
+      return None
+    try:
+      return cls(file_path)
+    except (OSError, AttributeError):
+      return None
+
+  def wait(self, timeout: float) -> None:
+    readable, _, _ = select.select(
+        [self._fd, self._wakeup_read], [], [], timeout
+    )
+    for fd in readable:
+      try:
+        while os.read(fd, 4096):
+          pass
+      except BlockingIOError:
+        pass
+
+  def interrupt(self) -> None:
+    try:
+      os.write(self._wakeup_write, b'\0')
+    except BlockingIOError:
+      # The pipe is full, so a wakeup is already pending.
+      pass
+
+  def close(self) -> None:
+    for fd in (self._fd, self._wakeup_read, self._wakeup_write):
+      os.close(fd)
+
+
+class _FileTailer:
+  """Follows a growing logcat file through one persistent file handle.
+
+  New data is waited for with inotify on Linux and by polling elsewhere. Only
+  complete lines are parsed; a partially written last line is read again once
+  its line ending has arrived.
+  """
+
+  def __init__(self, file_path: str, offset: int = 0):
+    self._file_path = file_path
+    self._offset = offset
+    self._reader: Optional[logcat_storage.SegmentedFileReader] = None
+    self._watcher = _PollingWatcher()
+    self._interrupted = threading.Event()
+
+  @property
+  def offset(self) -> int:
+    """The offset right after the last complete line read."""
+    return self._offset
+
+  def _ensure_open(self) -> bool:
+    if self._reader is not None:
+      return True
+    if not os.path.exists(self._file_path):
+      return False
+    self._reader = logcat_storage.SegmentedFileReader(self._file_path)
+    inotify_watcher = _InotifyWatcher.create(self._file_path)
+    if inotify_watcher is not None:
+      self._watcher.close()
+      self._watcher = inotify_watcher
+    return True
+
+  def seek(self, offset: int) -> None:
+    """Moves the tailer to the line starting at `offset`."""
+    self._offset = offset
+
+  def read_lines(self) -> Iterator[tuple[int, LogLine]]:
+    """Yields (next_line_offset, LogLine) for the lines appended so far."""
+    if not self._ensure_open():
+      return
+    try:
+      if self._reader.size() < self._offset:
+        # The file was truncated, follow it from its new beginning.
+        self._offset = 0
+    except OSError:
+      return
+    # Reads continue after the last complete line consumed, so a partial last
+    # line or the rest of a chunk the caller stopped early in is read again.
+    read_offset = self._offset
+    pending = b''
+    while True:
+      try:
+        chunk = self._reader.read(read_offset, _TAIL_READ_SIZE)
+      except OSError:
+        return
+      if not chunk:
+        return
+      read_offset += len(chunk)
+      lines = (pending + chunk).split(b'\n')
+      pending = lines.pop()
+      for line_bytes in lines:
+        line_offset = self._offset
+        self._offset += len(line_bytes) + 1
+        parsed = LogLine.from_string(
+            _decode_line(line_bytes), byte_offset=line_offset
+        )
+        if parsed is not None:
+          yield self._offset, parsed
+
+  def wait(self, timeout: float = _TAIL_MAX_WAIT_SEC) -> None:
+    """Blocks until the file may have changed, timeout or `interrupt`."""
+    if self._interrupted.is_set():
+      return
+    self._watcher.wait(max(0.0, min(timeout, _TAIL_MAX_WAIT_SEC)))
+
+  def interrupt(self) -> None:
+    """Wakes up a thread blocked in `wait`, now and in all later calls."""
+    self._interrupted.set()
+    self._watcher.interrupt()
+
+  def close(self) -> None:
+    self._watcher.close()
+    if self._reader is not None:
+      self._reader.close()
+      self._reader = None
+
+  def __enter__(self) -> '_FileTailer':
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    self.close()
+
+
+class _Subscription:
+  """A callback registered with a `_LogcatReader`.
+
+  Attributes:
+    callback: Called with (next_line_offset, LogLine) for every line.
+    skip_until: Lines ending at or before this offset were already delivered
+      while the subscription caught up with the file.
+    on_progress: Optional, called with the offset up to which the file was
+      read, including lines that did not parse, after lines were delivered.
+  """
+
+  def __init__(
+      self,
+      callback: Callable[[int, LogLine], None],
+      skip_until: int,
+      on_progress: Optional[Callable[[int], None]] = None,
+  ):
+    self.callback = callback
+    self.skip_until = skip_until
+    self.on_progress = on_progress
+
+
+class _LogcatReader:
+  """Parses a logcat file once and fans every new line out to subscribers.
+
+  One background thread follows the file with a `_FileTailer` and hands each
+  parsed line to all current subscriptions, so concurrent listeners and waiters
+  do not scan the file independently. The thread is started by the first
+  subscription and exits after being idle for `_READER_IDLE_TIMEOUT_SEC`.
+
+  The writer of the file can also `publish` the data it appends. Published
+  lines are delivered right away, ahead of the reader thread, and the most
+  recent ones are kept in a hot buffer that new subscriptions replay from
+  instead of reading the file.
+  """
+
+  def __init__(
+      self, file_path: str, hot_buffer_lines: int = DEFAULT_HOT_BUFFER_LINES
+  ):
+    self._file_path = file_path
+    self._lock = threading.RLock()
+    self._condition = threading.Condition(self._lock)
+    self._subscriptions: list[_Subscription] = []
+    self._tailer: Optional[_FileTailer] = None
+    self._thread: Optional[threading.Thread] = None
+    self._stop_event = threading.Event()
+    # (next_line_offset, LogLine) of the lines published last. They are
+    # contiguous, ending at `_hot_end`, the offset after the last complete
+    # line published.
+    self._hot: collections.deque[tuple[int, LogLine]] = collections.deque(
+        maxlen=max(0, hot_buffer_lines)
+    )
+    self._hot_begin = 0
+    self._hot_end = 0
+    self._published_offset = 0
+    self._published_pending = b''
+
+  def publish(
+      self,
+      offset: int,
+      data: bytes,
+      text_lines: Optional[Sequence[logcat_binary.TextLine]] = None,
+  ) -> None:
+    """Delivers data the writer of the file just appended at `offset`.
+
+    Args:
+      offset: The byte offset the data was written at.
+      data: The data written, not necessarily ending with a complete line.
+      text_lines: Optional, the lines of the data with their columns, which
+        are then not parsed again.
+    """
+    with self._lock:
+      if offset != self._published_offset or not self._hot.maxlen:
+        # The data does not continue the data published last, e.g. after a
+        # restart of the writer.
+        self._hot.clear()
+        self._published_pending = b''
+        self._hot_begin = offset
+        self._hot_end = offset
+      if text_lines is not None and (
+          self._published_pending or len(text_lines) != data.count(b'\n')
+      ):
+        # The lines do not line up with the data, which is parsed instead.
+        text_lines = None
+      lines = (self._published_pending + data).split(b'\n')
+      self._published_pending = lines.pop()
+      self._published_offset = offset + len(data)
+      line_offset = self._hot_end
+      for i, line_bytes in enumerate(lines):
+        next_offset = line_offset + len(line_bytes) + 1
+        if text_lines is not None:
+          parsed = _log_line_from_text(text_lines[i], line_offset)
+        else:
+          parsed = LogLine.from_string(
+              _decode_line(line_bytes), byte_offset=line_offset
+          )
+        if parsed is not None:
+          if len(self._hot) == self._hot.maxlen:
+            self._hot_begin = self._hot[0][0]
+          self._hot.append((next_offset, parsed))
+        if self._tailer is not None and self._tailer.offset == line_offset:
+          # Lines the reader thread has not reached yet are delivered right
+          # away, and the reader skips them. Lines it already delivered, or
+          # lines after a gap it still has to read, are left to it.
+          self._tailer.seek(next_offset)
+          if parsed is not None:
+            self._dispatch(next_offset, parsed)
+        line_offset = next_offset
+      self._hot_end = line_offset
+      if not self._hot:
+        self._hot_begin = line_offset
+      if self._tailer is not None:
+        self._report_progress(self._tailer.offset)
+
+  def _replay_hot(
+      self,
+      callback: Callable[[int, LogLine], None],
+      offset: int,
+      stop: Optional[Callable[[], bool]],
+  ) -> bool:
+    """Replays the hot buffer from `offset`, if it holds all lines from there.
+
+    Must be called with the lock held.
+
+    Returns:
+      Whether the lines were replayed, up to `_hot_end` unless `stop` returned
+      True before.
+    """
+    if not self._hot or not self._hot_begin <= offset <= self._hot_end:
+      return False
+    if self._tailer is not None and self._tailer.offset != self._hot_end:
+      return False
+    start = len(self._hot)
+    while start > 0 and self._hot[start - 1][1].position._byte_offset >= offset:
+      start -= 1
+    if start > 0 and self._hot[start - 1][0] > offset:
+      # The offset is not at the start of a line.
+      return False
+    for i in range(start, len(self._hot)):
+      if stop is not None and stop():
+        break
+      callback(*self._hot[i])
+    return True
+
+  def subscribe(
+      self,
+      callback: Callable[[int, LogLine], None],
+      offset: int,
+      on_progress: Optional[Callable[[int], None]] = None,
+      stop: Optional[Callable[[], bool]] = None,
+  ) -> _Subscription:
+    """Registers a callback for every line starting at or after `offset`.
+
+    Lines already in the file are replayed to the callback from the calling
+    thread, later lines are delivered from the reader thread. Each line is
+    delivered exactly once and in file order. The callback must not block.
+
+    Args:
+      callback: Called with (next_line_offset, LogLine) for every line.
+      offset: The byte offset of the first line to deliver.
+      on_progress: Optional, called with the offset up to which the file was
+        read, which moves past lines that do not parse, like buffer markers.
+      stop: Optional, called before replaying each line. Once it returns
+        True, e.g. because the subscriber found what it waited for or timed
+        out, the replay stops and the subscription is not registered.
+
+    Returns:
+      The subscription, to be passed to `unsubscribe`.
+    """
+    with self._lock:
+      if self._replay_hot(callback, offset, stop):
+        subscription = _Subscription(
+            callback, skip_until=self._hot_end, on_progress=on_progress
+        )
+        if stop is not None and stop():
+          return subscription
+        self._subscriptions.append(subscription)
+        if on_progress is not None:
+          on_progress(self._hot_end)
+        if self._thread is None:
+          self._start_thread(self._hot_end)
+        self._condition.notify_all()
+        return subscription
+    with _FileTailer(self._file_path, offset) as catch_up:
+      # Replay the bulk of the existing lines without holding up the reader.
+      for next_offset, line in catch_up.read_lines():
+        if stop is not None and stop():
+          return _Subscription(callback, skip_until=next_offset)
+        callback(next_offset, line)
+      with self._lock:
+        if self._tailer is not None and self._subscriptions:
+          # The reader is busy and may be ahead of the replay. It does not
+          # move while the lock is held, so the replay can close the gap.
+          for next_offset, line in catch_up.read_lines():
+            if stop is not None and stop():
+              return _Subscription(callback, skip_until=next_offset)
+            callback(next_offset, line)
+        elif self._tailer is not None:
+          # The reader is idle and its position is stale.
+          self._tailer.seek(catch_up.offset)
+        subscription = _Subscription(
+            callback, skip_until=catch_up.offset, on_progress=on_progress
+        )
+        if stop is not None and stop():
+          return subscription
+        self._subscriptions.append(subscription)
+        if on_progress is not None:
+          on_progress(catch_up.offset)
+        if self._thread is None:
+          self._start_thread(catch_up.offset)
+        self._condition.notify_all()
+    return subscription
+
+  def unsubscribe(self, subscription: _Subscription) -> None:
+    """Stops delivering lines to a subscription."""
+    with self._lock:
+      if subscription in self._subscriptions:
+        self._subscriptions.remove(subscription)
+
+  def _start_thread(self, offset: int) -> None:
+    self._tailer = _FileTailer(self._file_path, offset)
+    self._stop_event = threading.Event()
+    self._thread = threading.Thread(
+        target=self._run, args=(self._tailer, self._stop_event), daemon=True
+    )
+    self._thread.start()
+
+  def _run(self, tailer: _FileTailer, stop_event: threading.Event) -> None:
+    try:
+      while True:
+        with self._lock:
+          if not self._subscriptions and not stop_event.is_set():
+            self._condition.wait(_READER_IDLE_TIMEOUT_SEC)
+          if stop_event.is_set() or not self._subscriptions:
+            if self._tailer is tailer:
+              self._tailer = None
+              self._thread = None
+            return
+          for next_offset, line in tailer.read_lines():
+            self._dispatch(next_offset, line)
+          self._report_progress(tailer.offset)
+        tailer.wait()
+    finally:
+      tailer.close()
+
+  def _dispatch(self, next_offset: int, line: LogLine) -> None:
+    for subscription in list(self._subscriptions):
+      if next_offset <= subscription.skip_until:
+        continue
+      try:
+        subscription.callback(next_offset, line)
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Error in logcat subscriber %r.', subscription)
+
+  def _report_progress(self, offset: int) -> None:
+    for subscription in list(self._subscriptions):
+      if subscription.on_progress is None:
+        continue
+      try:
+        subscription.on_progress(offset)
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Error in logcat subscriber %r.', subscription)
+
+  def close(self) -> None:
+    """Drops all subscriptions and stops the reader thread."""
+    with self._lock:
+      self._subscriptions = []
+      thread, tailer = self._thread, self._tailer
+      self._thread = None
+      self._tailer = None
+      if thread is not None:
+        self._stop_event.set()
+        tailer.interrupt()
+        self._condition.notify_all()
+    if thread is not None and thread is not threading.current_thread():
+      thread.join(timeout=2.0)
+
+
+class _PatternWaiter:
+  """Subscriber that collects the first lines matching a list of patterns."""
+
+  def __init__(
+      self,
+      patterns: Sequence[Union[str, Pattern[str], LogcatFilter]],
+      in_order: bool,
+      begin: Optional[LogcatPosition],
+      on_done: Optional[Callable[[], None]] = None,
+  ):
+    self._patterns = list(patterns)
+    self._filters = [_to_filter(pat) for pat in self._patterns]
+    self._in_order = in_order
+    self._begin = begin
+    self._matched: dict[int, LogLine] = {}
+    self._screen = None if in_order else _combine_patterns(self._filters)
+    self._on_done = on_done
+    self.done = threading.Event()
+
+  @property
+  def unmatched_patterns(self) -> list[Union[str, Pattern[str], LogcatFilter]]:
+    return [
+        pat for i, pat in enumerate(self._patterns) if i not in self._matched
+    ]
+
+  @property
+  def matched_lines(self) -> list[LogLine]:
+    return [self._matched[i] for i in range(len(self._patterns))]
+
+  def on_line(self, next_offset: int, line: LogLine) -> None:
+    del next_offset  # Unused param.
+    if self.done.is_set():
+      return
+    # The time bound only delimits the search for the first in-order pattern,
+    # later ones are searched after the previous match.
+    if (
+        self._begin is not None
+        and not (self._in_order and self._matched)
+        and _compare_times(line, self._begin) < 0
+    ):
+      return
+    if self._in_order:
+      idx = len(self._matched)
+      if self._filters[idx].matches(line):
+        self._matched[idx] = line
+    else:
+      if self._screen is not None and not (
+          self._screen.search(line.message) or self._screen.search(line.raw)
+      ):
+        return
+      newly_matched = False
+      for idx, line_filter in enumerate(self._filters):
+        if idx not in self._matched and line_filter.matches(line):
+          self._matched[idx] = line
+          newly_matched = True
+      if newly_matched:
+        self._screen = _combine_patterns(
+            [f for i, f in enumerate(self._filters) if i not in self._matched]
+        )
+    if len(self._matched) == len(self._patterns):
+      self.done.set()
+      if self._on_done is not None:
+        self._on_done()
+
+  def timeout_error_message(self, timeout_sec: float) -> str:
+    if self._in_order:
+      return (
+          f'Timed out after {timeout_sec}s waiting for in-order pattern:'
+          f' {self.unmatched_patterns[0]!r}'
+      )
+    return (
+        f'Timed out after {timeout_sec}s waiting for patterns:'
+        f' {self.unmatched_patterns!r}'
+    )
+
+
+class OverflowPolicy(enum.Enum):
+  """What a listener does with a new event while its queue is full.
+
+  Attributes:
+    OVERWRITE: Drops the oldest queued event to make room.
+    BLOCK: Holds back new events until the listener consumed half of the
+      queued ones, then reads the events held back from the logcat file. No
+      event is dropped, and other listeners and waiters are not held up.
+  """
+
+  OVERWRITE = 'overwrite'
+  BLOCK = 'block'
+
+
+@dataclasses.dataclass(frozen=True)
+class LogcatListenerStats:
+  """Counters of the events of a listener.
+
+  Attributes:
+    dispatched: Number of lines delivered to the listener.
+    matched: Number of lines that matched the filter of the listener.
+    dropped: Number of matched lines that were lost from the queue because it
+      was full.
+    max_backlog: Largest number of events queued at the same time.
+  """
+
+  dispatched: int = 0
+  matched: int = 0
+  dropped: int = 0
+  max_backlog: int = 0
+
+
+class _EventRing:
+  """A bounded event queue with a policy for events arriving while full."""
+
+  def __init__(self, capacity: int, policy: OverflowPolicy):
+    self._items: collections.deque[LogLine] = collections.deque()
+    self._capacity = max(1, capacity)
+    self._policy = policy
+    self._condition = threading.Condition()
+    self.dropped = 0
+    self.max_backlog = 0
+
+  @property
+  def is_half_empty(self) -> bool:
+    """Whether at most half of the capacity is used."""
+    with self._condition:
+      return len(self._items) <= self._capacity // 2
+
+  def put(self, item: LogLine) -> bool:
+    """Queues an item, applying the overflow policy if the ring is full.
+
+    Returns:
+      False if the ring is full and its policy is BLOCK, in which case the
+      item is not queued.
+    """
+    with self._condition:
+      if len(self._items) >= self._capacity:
+        if self._policy is OverflowPolicy.BLOCK:
+          return False
+        self._items.popleft()
+        self.dropped += 1
+      self._items.append(item)
+      self.max_backlog = max(self.max_backlog, len(self._items))
+      self._condition.notify_all()
+      return True
+
+  def get(self, timeout: Optional[float] = None) -> LogLine:
+    """Takes the oldest item, blocking up to `timeout` seconds.
+
+    Raises:
+      queue.Empty: No item was queued in time.
+    """
+    with self._condition:
+      if not self._condition.wait_for(lambda: self._items, timeout):
+        raise queue.Empty
+      return self._items.popleft()
+
+
+class LogcatListenerContext:
+  """Context manager for listening to real-time logcat events.
+
+  Matched events are queued for `get_next_event` in a ring of `max_events`
+  events, and the latest `max_events` of them are kept in `events`. How
+  events arriving while the queue is full are handled is set by
+  `overflow_policy`, and `stats` counts the events lost that way.
+  """
+
+  def __init__(
+      self,
+      processor: 'LogcatProcessor',
+      pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
+      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      position: Optional[Union[LogcatPosition, LogLine]] = None,
+      max_events: int = 1000,
+      timeout_error_cls: type[Exception] = TimeoutError,
+      overflow_policy: OverflowPolicy = OverflowPolicy.OVERWRITE,
+  ):
+    self._processor = processor
+    self._filter = _to_filter(pattern, tag, level)
+    self._position = (
+        position.position if isinstance(position, LogLine) else position
+    )
+    self._max_events = max_events
+    self._timeout_error_cls = timeout_error_cls
+    self._overflow_policy = overflow_policy
+    self._events: collections.deque[LogLine] = collections.deque(
+        maxlen=max_events
+    )
+    self._queue = _EventRing(max_events, overflow_policy)
+    self._lock = threading.Lock()
+    self._subscription: Optional[_Subscription] = None
+    self._is_listening = False
+    # Offset of the first line held back while the queue was full, with the
+    # BLOCK policy. The listener is unsubscribed from then on, and reads the
+    # lines held back from the file once there is room again.
+    self._resume_offset: Optional[int] = None
+    # Held while subscribing, resuming and unsubscribing.
+    self._subscribe_lock = threading.Lock()
+    self._dispatched = 0
+    self._matched = 0
+
+  @property
+  def filter(self) -> LogcatFilter:
+    """The filter events are matched with."""
+    return self._filter
+
+  @property
+  def overflow_policy(self) -> OverflowPolicy:
+    return self._overflow_policy
+
+  @property
+  def is_listening(self) -> bool:
+    """Whether the listener is receiving events, i.e. inside its context."""
+    return self._is_listening
+
+  @property
+  def max_events(self) -> int:
+    return self._max_events
+
+  @property
+  def events(self) -> list[LogLine]:
+    """Returns a snapshot list of captured events."""
+    with self._lock:
+      return list(self._events)
+
+  @property
+  def stats(self) -> LogcatListenerStats:
+    """Returns a snapshot of the event counters of the listener."""
+    with self._lock:
+      return LogcatListenerStats(
+          dispatched=self._dispatched,
+          matched=self._matched,
+          dropped=self._queue.dropped,
+          max_backlog=self._queue.max_backlog,
+      )
+
+  def has_events(self) -> bool:
+    """Returns True if any events have been captured."""
+    with self._lock:
+      return bool(self._events)
+
+  def get_next_event(self, timeout: Optional[float] = None) -> LogLine:
+    """Gets the next event from the queue, blocking up to timeout seconds."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+      if self._resume_offset is not None and self._queue.is_half_empty:
+        self._resume()
+      # A listener still held back reads more lines instead of blocking.
+      resuming = (
+          self._is_listening
+          and self._resume_offset is not None
+          and self._queue.is_half_empty
+      )
+      remaining = (
+          None if deadline is None else max(0.0, deadline - time.monotonic())
+      )
+      try:
+        return self._queue.get(timeout=0 if resuming else remaining)
+      except queue.Empty:
+        if not resuming or remaining == 0:
+          raise self._timeout_error_cls(
+              f'Timed out after {timeout}s waiting for next logcat event '
+              f'(pattern={self._filter.pattern!r}, tag={self._filter.tag!r},'
+              f' level={self._filter.level!r})'
+          )
+
+  def _dispatch(self, next_offset: int, line: LogLine) -> None:
+    del next_offset  # Unused param.
+    matches = self._filter.matches(line)
+    with self._lock:
+      if self._resume_offset is not None:
+        return
+      if matches:
+        if not self._queue.put(line):
+          self._resume_offset = line._byte_offset
+          return
+        self._matched += 1
+        self._events.append(line)
+      self._dispatched += 1
+
+  def _resume(self) -> None:
+    """Reads the lines held back while the queue was full from the file.
+
+    Lines are read until the queue is full again, until
+    `_LISTENER_RESUME_MAX_LINES` lines were read, or until the end of the
+    file, where the listener subscribes to the reader again.
+    """
+    reader = self._processor._reader
+    with self._subscribe_lock:
+      if not self._is_listening or self._resume_offset is None:
+        return
+      if self._subscription is not None:
+        reader.unsubscribe(self._subscription)
+        self._subscription = None
+      offset = self._resume_offset
+      with self._lock:
+        self._resume_offset = None
+      with _FileTailer(self._processor.file_path, offset) as tailer:
+        for count, (next_offset, line) in enumerate(tailer.read_lines(), 1):
+          self._dispatch(next_offset, line)
+          if self._resume_offset is not None:
+            return
+          if count >= _LISTENER_RESUME_MAX_LINES:
+            with self._lock:
+              self._resume_offset = next_offset
+            return
+        offset = tailer.offset
+      self._subscription = reader.subscribe(self._dispatch, offset)
+
+  def __enter__(self) -> 'LogcatListenerContext':
+    offset = (
+        self._position._byte_offset
+        if self._position
+        else LogcatPosition.from_file(self._processor.file_path)._byte_offset
+    )
+    with self._subscribe_lock:
+      self._is_listening = True
+      self._subscription = self._processor._reader.subscribe(
+          self._dispatch, offset
+      )
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    with self._subscribe_lock:
+      self._is_listening = False
+      if self._subscription is not None:
+        self._processor._reader.unsubscribe(self._subscription)
+        self._subscription = None
+
+
+# Number of recent seconds whose line counts are kept apart by aggregators.
+# Lines of interleaved log buffers arrive slightly out of order, and are
+# still counted in the second they were logged in.
+_RATE_WINDOW_SECONDS = 8
+
+# Default time `LogcatAggregator.take_stats` waits for lines to be counted.
+_AGGREGATOR_CATCH_UP_TIMEOUT_SEC = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class LogcatStats:
+  """Counts of the log lines in a part of a logcat file.
+
+  Attributes:
+    lines: Number of lines counted.
+    tags: Number of lines per tag.
+    pids: Number of lines per process id.
+    levels: Number of lines per level.
+    rate_histogram: Number of seconds per logging rate. Keys are the lowest
+      number of lines per second of each bucket, i.e. 1, 2, 4, 8 and so on,
+      and seconds without lines are not counted.
+    peak_rate: Largest number of lines logged in one second.
+    peak_second: The timestamp, to the second, of the peak rate. None if no
+      line was counted.
+  """
+
+  lines: int = 0
+  tags: dict[str, int] = dataclasses.field(default_factory=dict)
+  pids: dict[int, int] = dataclasses.field(default_factory=dict)
+  levels: dict[str, int] = dataclasses.field(default_factory=dict)
+  rate_histogram: dict[int, int] = dataclasses.field(default_factory=dict)
+  peak_rate: int = 0
+  peak_second: Optional[str] = None
+
+
+class LogcatAggregator:
+  """Context manager counting logcat lines by tag, pid, level and rate.
+
+  Lines are counted once, as the logcat reader of the processor delivers
+  them, so the counts of long runs are available at any time without
+  scanning the file again. The counts can be split at byte offsets, e.g.
+  at the ends of test excerpts, with `take_stats`.
+  """
+
+  def __init__(
+      self,
+      processor: 'LogcatProcessor',
+      position: Optional[Union[LogcatPosition, LogLine]] = None,
+  ):
+    self._processor = processor
+    self._position = (
+        position.position if isinstance(position, LogLine) else position
+    )
+    self._condition = threading.Condition()
+    self._subscription: Optional[_Subscription] = None
+    # Offset up to which the file was read, and its lines counted. Lines
+    # that do not parse, like buffer markers, are skipped over.
+    self._offset = 0
+    # Offset at which `take_stats` waits for the counts to be split, and the
+    # counts of the lines before it once split.
+    self._split_offset: Optional[int] = None
+    self._split_stats: Optional[LogcatStats] = None
+    self._reset()
+
+  def _reset(self) -> None:
+    self._lines = 0
+    self._tags: collections.Counter[str] = collections.Counter()
+    self._pids: collections.Counter[int] = collections.Counter()
+    self._levels: collections.Counter[str] = collections.Counter()
+    # Line counts of the recent seconds, keyed by timestamp to the second.
+    self._seconds: dict[str, int] = {}
+    self._rate_histogram: collections.Counter[int] = collections.Counter()
+    self._peak_rate = 0
+    self._peak_second: Optional[str] = None
+
+  @property
+  def is_aggregating(self) -> bool:
+    """Whether lines are being counted, i.e. inside the context."""
+    return self._subscription is not None
+
+  @property
+  def stats(self) -> LogcatStats:
+    """Returns the counts since entering or since the last `take_stats`."""
+    with self._condition:
+      return self._stats()
+
+  def _stats(self) -> LogcatStats:
+    rate_histogram = self._rate_histogram.copy()
+    peak_rate, peak_second = self._peak_rate, self._peak_second
+    for second, count in self._seconds.items():
+      rate_histogram[_rate_bucket(count)] += 1
+      if count > peak_rate:
+        peak_rate, peak_second = count, second
+    return LogcatStats(
+        lines=self._lines,
+        tags=dict(self._tags),
+        pids=dict(self._pids),
+        levels=dict(self._levels),
+        rate_histogram=dict(sorted(rate_histogram.items())),
+        peak_rate=peak_rate,
+        peak_second=peak_second,
+    )
+
+  def _take(self) -> LogcatStats:
+    stats = self._stats()
+    self._reset()
+    return stats
+
+  def take_stats(
+      self,
+      end: Optional[LogcatPosition] = None,
+      timeout_sec: float = _AGGREGATOR_CATCH_UP_TIMEOUT_SEC,
+  ) -> LogcatStats:
+    """Returns the counts of the lines before `end`, and restarts counting.
+
+    Args:
+      end: The position to split the counts at, e.g. the end of an excerpt.
+        Lines starting at or after it that were not counted yet are counted
+        in the next stats. Waits up to `timeout_sec` for the lines before it
+        to be counted. None to split after the lines counted so far.
+      timeout_sec: Longest time to wait for the lines before `end`.
+
+    Returns:
+      The counts since entering or since the previous call.
+    """
+    with self._condition:
+      if end is not None:
+        split_offset = end._byte_offset
+        self._split_offset = split_offset
+        self._condition.wait_for(
+            lambda: self._split_stats is not None
+            or self._offset >= split_offset,
+            timeout_sec,
+        )
+        self._split_offset = None
+      stats = self._split_stats
+      self._split_stats = None
+      return stats if stats is not None else self._take()
+
+  def _dispatch(self, next_offset: int, line: LogLine) -> None:
+    with self._condition:
+      if (
+          self._split_offset is not None
+          and line.position._byte_offset >= self._split_offset
+      ):
+        self._split_stats = self._take()
+        self._split_offset = None
+      self._lines += 1
+      self._tags[line.tag] += 1
+      self._pids[line.pid] += 1
+      self._levels[line.level] += 1
+      second = line.timestamp.partition('.')[0]
+      self._seconds[second] = self._seconds.get(second, 0) + 1
+      if len(self._seconds) > _RATE_WINDOW_SECONDS:
+        oldest = min(self._seconds)
+        count = self._seconds.pop(oldest)
+        self._rate_histogram[_rate_bucket(count)] += 1
+        if count > self._peak_rate:
+          self._peak_rate, self._peak_second = count, oldest
+      self._offset = next_offset
+      self._condition.notify_all()
+
+  def _on_progress(self, offset: int) -> None:
+    with self._condition:
+      if offset > self._offset:
+        self._offset = offset
+        self._condition.notify_all()
+
+  def __enter__(self) -> 'LogcatAggregator':
+    offset = (
+        self._position._byte_offset
+        if self._position
+        else LogcatPosition.from_file(self._processor.file_path)._byte_offset
+    )
+    with self._condition:
+      self._offset = offset
+    self._subscription = self._processor._reader.subscribe(
+        self._dispatch, offset, on_progress=self._on_progress
+    )
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    if self._subscription is not None:
+      self._processor._reader.unsubscribe(self._subscription)
+      self._subscription = None
+
+
+def _rate_bucket(count: int) -> int:
+  """Returns the histogram bucket of a number of lines per second."""
+  return 1 << (count.bit_length() - 1)
+
+
+def _set_future_result(future: asyncio.Future, result: Any) -> None:
+  """Sets the result of a future, unless it is done, e.g. cancelled."""
+  if not future.done():
+    future.set_result(result)
+
+
+def _next_line_start(
+    reader: logcat_storage.SegmentedFileReader, offset: int
+) -> int:
+  """Returns the first line start of a file at or after `offset`."""
+  if offset <= 0:
+    return 0
+  offset -= 1
+  while True:
+    chunk = reader.read(offset, _LINE_PROBE_SIZE)
+    newline = chunk.find(b'\n')
+    if newline >= 0:
+      return offset + newline + 1
+    offset += len(chunk)
+    if len(chunk) < _LINE_PROBE_SIZE:
+      return offset
+
+
+def _iter_file_lines(
+    file_path: str,
+    offset: int = 0,
+    end: Optional[int] = None,
+    line_filter: Optional[LogcatFilter] = None,
+) -> Iterator[tuple[int, LogLine]]:
+  """Yields (next_line_offset, LogLine) pairs from a file.
+
+  The file is read in large binary chunks and offsets are counted while
+  splitting lines, which avoids slow text mode `tell()` calls. If a filter
+  is given, lines rejected by its screen are skipped without being parsed,
+  and often without being decoded. Yielded lines still have to be checked
+  with `line_filter.matches`.
+
+  Args:
+    file_path: The logcat file to read.
+    offset: The byte offset of the first line to read.
+    end: The byte offset to stop reading at, or None to read to the end of
+      the file. Lines starting before it are read completely.
+    line_filter: The filter to screen lines with.
+  """
+  decode = line_filter.screen if line_filter else _decode_line
+  try:
+    with logcat_storage.SegmentedFileReader(file_path) as reader:
+      if end is not None:
+        end = _next_line_start(reader, end)
+      line_offset = offset
+      read_offset = offset
+      pending = b''
+      while end is None or read_offset < end:
+        read_size = _SCAN_READ_SIZE
+        if end is not None:
+          read_size = min(read_size, end - read_offset)
+        chunk = reader.read(read_offset, read_size)
+        if not chunk:
+          break
+        read_offset += len(chunk)
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line_bytes in lines:
+          next_offset = line_offset + len(line_bytes) + 1
+          text = decode(line_bytes)
+          if text is not None:
+            parsed = LogLine.from_string(text, byte_offset=line_offset)
+            if parsed is not None:
+              yield next_offset, parsed
+          line_offset = next_offset
+      # The last line may not be terminated yet.
+      text = decode(pending) if pending else None
+      if text is not None:
+        parsed = LogLine.from_string(text, byte_offset=line_offset)
+        if parsed is not None:
+          yield line_offset + len(pending), parsed
+  except OSError:
+    return
+
+
+def _iter_mapped_file_lines(
+    file_path: str,
+    line_filter: LogcatFilter,
+    offset: int = 0,
+    end: Optional[int] = None,
+    reverse: bool = False,
+) -> Iterator[LogLine]:
+  """Yields the lines of a memory mapped file that may match a filter.
+
+  Instead of reading every line, the mapped file is searched for the search
+  key of the filter, and only the lines around the hits are copied out of
+  the mapping and parsed. Yielded lines still have to be checked with
+  `line_filter.matches`.
+
+  Args:
+    file_path: The logcat file to search.
+    line_filter: The filter to search for, must have a search key.
+    offset: The byte offset of the first line to search.
+    end: The byte offset to stop searching at, or None to search to the end
+      of the file. Lines starting before it are searched completely.
+    reverse: Whether to yield the lines from the end of the file.
+  """
+  try:
+    with logcat_storage.SegmentedFileReader(file_path) as reader:
+      segments = reader.segments
+      if not segments:
+        with open(file_path, 'rb') as f:
+          if os.fstat(f.fileno()).st_size <= offset:
+            return
+          with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            data_end = len(data)
+            if end is not None:
+              data_end = min(_next_line_start(reader, end), data_end)
+            yield from _search_data(
+                data, 0, line_filter, offset, data_end, reverse
+            )
+        return
+      # Sealed segments are searched decompressed. The active segment is read
+      # into memory rather than mapped, as rotations truncate it.
+      data_end = reader.size()
+      if end is not None:
+        data_end = min(_next_line_start(reader, end), data_end)
+      parts: list[tuple[int, int, Optional[logcat_storage.Segment]]] = [
+          (segment.begin, segment.end, segment) for segment in segments
+      ]
+      parts.append((segments[-1].end, data_end, None))
+      if reverse:
+        parts.reverse()
+      for part_begin, part_end, segment in parts:
+        part_end = min(part_end, data_end)
+        if part_end <= offset or part_begin >= part_end:
+          continue
+        if segment is not None:
+          data = reader.segment_data(segment)
+        else:
+          data = reader.read(part_begin, part_end - part_begin)
+        yield from _search_data(
+            data,
+            part_begin,
+            line_filter,
+            max(offset - part_begin, 0),
+            min(part_end - part_begin, len(data)),
+            reverse,
+        )
+  except (OSError, ValueError):
+    return
+
+
+def _search_data(
+    data: Union[bytes, mmap.mmap],
+    base: int,
+    line_filter: LogcatFilter,
+    begin: int,
+    end: int,
+    reverse: bool,
+) -> Iterator[LogLine]:
+  """Yields the lines of `data[begin:end]` that may match a filter.
+
+  Args:
+    data: The content searched, starting at byte offset `base` of the file.
+    base: The byte offset of `data` in the file.
+    line_filter: The filter to search for, must have a search key.
+    begin: The offset in `data` of the first line to search.
+    end: The offset in `data` to stop searching at, a line start or the end.
+    reverse: Whether to yield the lines from the end.
+  """
+  key = line_filter._search_key
+  assert key is not None
+  windows = _mapped_windows(data, begin, end)
+  if reverse:
+    windows.reverse()
+  for lo, hi in windows:
+    lines = _find_mapped_lines(data, key, lo, hi)
+    if reverse:
+      lines.reverse()
+    for line_start, line_end in lines:
+      text = line_filter.screen(data[line_start:line_end])
+      if text is None:
+        continue
+      parsed = LogLine.from_string(text, byte_offset=base + line_start)
+      if parsed is not None:
+        yield parsed
+
+
+def _query_file(
+    file_path: str,
+    line_filter: LogcatFilter,
+    offset: int,
+    end: Optional[int],
+    begin: Optional[LogcatPosition],
+    until: Optional[LogcatPosition],
+    max_lines: Optional[int],
+    use_mmap: bool,
+) -> list[LogLine]:
+  """Gets the lines of a part of a file matching a query.
+
+  This is the scan of `LogcatProcessor.get_lines`, run on whole files or in
+  worker processes on parts of them.
+
+  Args:
+    file_path: The logcat file to scan.
+    line_filter: The filter lines must match.
+    offset: The byte offset of the first line to scan.
+    end: The byte offset to stop scanning at, or None to scan to the end of
+      the file.
+    begin: The position lines must not be older than, or None.
+    until: The position lines must not be newer than, or None.
+    max_lines: Maximum number of lines to return, or None.
+    use_mmap: Whether to search the memory mapped file, if the filter has a
+      search key.
+
+  Returns:
+    The matching lines in file order.
+  """
+  if use_mmap and line_filter._search_key is not None:
+    lines = _iter_mapped_file_lines(
+        file_path, line_filter, offset=offset, end=end
+    )
+  else:
+    lines = (
+        parsed
+        for _, parsed in _iter_file_lines(
+            file_path, offset=offset, end=end, line_filter=line_filter
+        )
+    )
+  results: list[LogLine] = []
+  for parsed in lines:
+    if begin is not None and _compare_times(parsed, begin) < 0:
+      continue
+    if until is not None and _compare_times(parsed, until) > 0:
+      continue
+    if line_filter.matches(parsed):
+      results.append(parsed)
+      if max_lines is not None and len(results) >= max_lines:
+        break
+  return results
+
+
+def _split_file(
+    file_path: str, offset: int, num_chunks: int, end: Optional[int] = None
+) -> list[tuple[int, int]]:
+  """Splits the part of a file from `offset` into chunks of whole lines.
+
+  Chunks are at least `_PARALLEL_MIN_CHUNK_SIZE` bytes long, so fewer chunks
+  may be returned.
+
+  Args:
+    file_path: The file to split.
+    offset: The byte offset of the line to start the first chunk at.
+    num_chunks: The number of chunks to split into.
+    end: The byte offset to end the last chunk at, or None for the end of
+      the file. Lines starting before it are part of the last chunk.
+
+  Returns:
+    The (start, end) byte offsets of the chunks, in file order.
+  """
+  reader = logcat_storage.SegmentedFileReader(file_path)
+  try:
+    file_size = reader.size()
+  except OSError:
+    reader.close()
+    return []
+  if end is not None:
+    file_size = min(end, file_size)
+  if file_size <= offset:
+    reader.close()
+    return []
+  chunk_size = max(
+      _PARALLEL_MIN_CHUNK_SIZE, -(-(file_size - offset) // num_chunks)
+  )
+  chunks = []
+  start = offset
+  with reader:
+    while start < file_size:
+      chunk_end = start + chunk_size
+      if chunk_end < file_size:
+        chunk_end = _next_line_start(reader, chunk_end)
+      chunk_end = min(chunk_end, file_size)
+      chunks.append((start, chunk_end))
+      start = chunk_end
+  return chunks
+
+
+def _complete_end(reader: logcat_storage.SegmentedFileReader, size: int) -> int:
+  """Returns the offset after the last complete line of the first `size` bytes."""
+  end = size
+  while end > 0:
+    start = max(0, end - _LINE_PROBE_SIZE)
+    newline = reader.read(start, end - start).rfind(b'\n')
+    if newline >= 0:
+      return start + newline + 1
+    end = start
+  return 0
+
+
+def _bound_lines(
+    lines: Iterable[LogLine],
+    begin: Optional[LogcatPosition],
+    until: Optional[LogcatPosition],
+    max_lines: Optional[int],
+) -> list[LogLine]:
+  """Returns the lines within the time bounds, up to `max_lines` of them."""
+  results: list[LogLine] = []
+  for line in lines:
+    if begin is not None and _compare_times(line, begin) < 0:
+      continue
+    if until is not None and _compare_times(line, until) > 0:
+      continue
+    results.append(line)
+    if max_lines is not None and len(results) >= max_lines:
+      break
+  return results
+
+
+@dataclasses.dataclass
+class _QueryCacheEntry:
+  """The lines matching a filter in a part of the file.
+
+  Attributes:
+    begin: The byte offset the scan started at.
+    end: The byte offset after the last complete line scanned.
+    lines: The matching lines, in file order.
+    size: The approximate memory used by the lines.
+  """
+
+  begin: int
+  end: int
+  lines: list[LogLine] = dataclasses.field(default_factory=list)
+  size: int = 0
+
+
+class _KeyLock:
+  """A lock of the queries of one cache key, and the number of its users."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.users = 0
+
+
+class _QueryCache:
+  """LRU cache of the lines matching filters, extended as the file grows.
+
+  Each entry remembers how far the file was scanned, so repeating a query
+  only scans the lines appended since. Entries are evicted, least recently
+  used first, to keep the memory used by the cached lines under `max_bytes`.
+
+  Queries of the same filter run one after another, to scan the file once.
+  Queries of different filters scan the file concurrently.
+  """
+
+  def __init__(self, file_path: str, max_bytes: int):
+    self._file_path = file_path
+    self._max_bytes = max_bytes
+    self._entries: collections.OrderedDict[Any, _QueryCacheEntry] = (
+        collections.OrderedDict()
+    )
+    self._size = 0
+    # Guards the entries, their size and the key locks, never held while
+    # scanning the file.
+    self._lock = threading.Lock()
+    self._key_locks: dict[Any, _KeyLock] = {}
+
+  def _acquire_key(self, key: Any) -> _KeyLock:
+    with self._lock:
+      key_lock = self._key_locks.get(key)
+      if key_lock is None:
+        key_lock = self._key_locks[key] = _KeyLock()
+      key_lock.users += 1
+    key_lock.lock.acquire()
+    return key_lock
+
+  def _release_key(self, key: Any, key_lock: _KeyLock) -> None:
+    key_lock.lock.release()
+    with self._lock:
+      key_lock.users -= 1
+      if not key_lock.users:
+        del self._key_locks[key]
+
+  def query(
+      self,
+      line_filter: LogcatFilter,
+      offset: int,
+      end: Optional[int],
+      use_mmap: bool,
+  ) -> Optional[list[LogLine]]:
+    """Gets the lines matching a filter from `offset` to `end`.
+
+    Args:
+      line_filter: The filter lines must match.
+      offset: The byte offset of the first line to get.
+      end: The byte offset to stop at, or None for the end of the file.
+      use_mmap: Whether to search the memory mapped file for new lines, see
+        `_query_file`.
+
+    Returns:
+      The matching lines in file order, or None if the filter can not be
+      cached.
+    """
+    key = line_filter._cache_key
+    if key is None:
+      return None
+    key_lock = self._acquire_key(key)
+    try:
+      with self._lock:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+          self._size -= entry.size
+      try:
+        with logcat_storage.SegmentedFileReader(self._file_path) as reader:
+          file_size = reader.size()
+          scan_end = _complete_end(reader, file_size)
+      except OSError:
+        file_size = scan_end = 0
+      if entry is None or offset < entry.begin or file_size < entry.end:
+        # Not cached, or the file was truncated.
+        entry = _QueryCacheEntry(begin=offset, end=offset)
+      if scan_end > entry.end:
+        new_lines = _query_file(
+            self._file_path,
+            line_filter,
+            entry.end,
+            scan_end,
+            None,
+            None,
+            None,
+            use_mmap,
+        )
+        entry.lines.extend(new_lines)
+        entry.size += sum(
+            len(line.raw) + _CACHED_LINE_OVERHEAD for line in new_lines
+        )
+        entry.end = scan_end
+      with self._lock:
+        if entry.size <= self._max_bytes:
+          self._entries[key] = entry
+          self._size += entry.size
+          while self._size > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+      # The lines of the entry are only extended with its key lock held.
+      lines = entry.lines
+      entry_end = entry.end
+      start = bisect.bisect_left(
+          lines, offset, key=lambda line: line._byte_offset
+      )
+      stop = len(lines)
+      if end is not None:
+        stop = bisect.bisect_left(
+            lines, end, lo=start, key=lambda line: line._byte_offset
+        )
+      results = lines[start:stop]
+    finally:
+      self._release_key(key, key_lock)
+    if end is None or end > entry_end:
+      # The last line may not be complete yet, it is not cached.
+      results.extend(
+          _query_file(
+              self._file_path,
+              line_filter,
+              entry_end,
+              end,
+              None,
+              None,
+              None,
+              use_mmap,
+          )
+      )
+    return results
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._size = 0
+
+
+class LogcatProcessor:
+  """Thread-safe processor for querying and streaming logcat files."""
+
+  def __init__(
+      self,
+      file_path: str,
+      timeout_error_cls: type[Exception] = TimeoutError,
+      index_interval_bytes: int = DEFAULT_INDEX_INTERVAL_BYTES,
+      hot_buffer_lines: int = DEFAULT_HOT_BUFFER_LINES,
+      query_cache_bytes: int = DEFAULT_QUERY_CACHE_BYTES,
+  ):
+    self._file_path = file_path
+    self._query_cache = _QueryCache(file_path, query_cache_bytes)
+    self._timeout_error_cls = timeout_error_cls
+    self._index = _TimestampIndex(file_path, interval=index_interval_bytes)
+    self._reader = _LogcatReader(file_path, hot_buffer_lines=hot_buffer_lines)
+
+  @property
+  def file_path(self) -> str:
+    return self._file_path
+
+  def publish(
+      self,
+      offset: int,
+      data: bytes,
+      text_lines: Optional[Sequence[logcat_binary.TextLine]] = None,
+  ) -> None:
+    """Hands data just appended to the logcat file to listeners and waiters.
+
+    For processes that write the logcat file themselves. Listeners and
+    waiters receive the published lines without waiting for the reader to
+    notice the change of the file and read it, and the most recent lines are
+    kept in memory to catch up new listeners and waiters with.
+
+    Args:
+      offset: The byte offset the data was written at. The data must be in
+        the file already.
+      data: The data written.
+      text_lines: Optional, the lines of the data, one per line feed, with
+        their columns, e.g. decoded from binary logcat output. They are used
+        as they are instead of parsing the data.
+    """
+    self._reader.publish(offset, data, text_lines)
+
+  def close(self) -> None:
+    """Stops the background reader shared by listeners and waiters.
+
+    Active listeners stop receiving events and cached queries are dropped.
+    The processor stays usable and restarts the reader on the next listen or
+    wait.
+    """
+    self._reader.close()
+    self._query_cache.clear()
+
+  def _resolve_since(
+      self, since: Optional[Union[LogcatPosition, LogLine]]
+  ) -> tuple[int, Optional[LogcatPosition]]:
+    """Resolves a `since` bound into a scan offset and a timestamp bound.
+
+    Positions with a byte offset are exact. Positions that only carry a
+    timestamp are looked up in the timestamp index, and the returned position
+    is a bound that must still be applied to the timestamps of the lines
+    scanned from the returned offset.
+    """
+    pos = since.position if isinstance(since, LogLine) else since
+    if pos is None:
+      return 0, None
+    if pos._byte_offset or not pos.timestamp:
+      return pos._byte_offset, None
+    return self._index.find_offset(pos.timestamp), pos
+
+  def _resolve_until(
+      self, until: Optional[Union[LogcatPosition, LogLine]]
+  ) -> tuple[Optional[int], Optional[LogcatPosition]]:
+    """Resolves an `until` bound into an end offset and a timestamp bound.
+
+    Like for `since`, positions with a byte offset are exact, and positions
+    that only carry a timestamp bound the timestamps of the lines. A line
+    bound includes the line itself.
+    """
+    if isinstance(until, LogLine):
+      return until.position._byte_offset + 1, None
+    pos = until
+    if pos is None:
+      return None, None
+    if pos._byte_offset or not pos.timestamp:
+      return pos._byte_offset, None
+    return None, pos
+
+  def _iter_lines(
+      self,
+      offset: int = 0,
+      line_filter: Optional[LogcatFilter] = None,
+  ) -> Iterator[tuple[int, LogLine]]:
+    """Yields (next_line_offset, LogLine) pairs from file from given offset.
+
+    See `_iter_file_lines`.
+    """
+    return _iter_file_lines(
+        self._file_path, offset=offset, line_filter=line_filter
+    )
+
+  def _iter_mapped_lines(
+      self,
+      line_filter: LogcatFilter,
+      offset: int = 0,
+      reverse: bool = False,
+  ) -> Iterator[LogLine]:
+    """Yields the lines of the memory mapped file that may match a filter.
+
+    See `_iter_mapped_file_lines`.
+    """
+    return _iter_mapped_file_lines(
+        self._file_path, line_filter, offset=offset, reverse=reverse
+    )
+
+  def get_lines(
+      self,
+      pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
+      *,
+      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      since: Optional[Union[LogcatPosition, LogLine]] = None,
+      until: Optional[Union[LogcatPosition, LogLine]] = None,
+      max_lines: Optional[int] = None,
+      use_mmap: bool = False,
+      max_workers: Optional[int] = 1,
+      use_cache: bool = False,
+  ) -> list[LogLine]:
+    """Gets log lines from the file satisfying filter criteria.
+
+    `since` and `until` bound the lines by position. Positions with a byte
+    offset, like the ranges of logcat excerpts, bound the part of the file
+    that is read: `until` then excludes the lines starting at or after it.
+    Positions with only a timestamp bound the timestamps of the lines.
+
+    With `use_mmap`, the file is memory mapped and searched for a literal
+    pattern, tag or simple regex of the criteria, and only the lines around
+    the hits are parsed. This is much faster for selective queries on large,
+    finished logs. Criteria without such a search key are applied to every
+    line as usual.
+
+    With `max_workers` other than 1, the file is split into chunks of whole
+    lines that are scanned by a pool of processes, and the results are merged
+    in file order. Once `max_lines` lines are found, chunks not being scanned
+    yet are cancelled. Files too small to be split are scanned in this
+    process.
+
+    With `use_cache`, the lines matching the criteria are cached, and
+    repeating the query, with the same or a later `since`, only scans the
+    lines appended since the previous one. Cached queries are serialized and
+    scanned in this process. The memory used by the cache is bounded by the
+    `query_cache_bytes` of the processor.
+    """
+    if (
+        pattern is None
+        and tag is None
+        and level is None
+        and since is None
+        and until is None
+        and max_lines is None
+    ):
+      raise ValueError(
+          'At least one filter criteria (pattern, tag, level, since, until,'
+          ' or max_lines) must be specified. To inspect the latest logs, use'
+          ' tail() instead.'
+      )
+
+    line_filter = _to_filter(pattern, tag, level)
+    offset, begin = self._resolve_since(since)
+    end, until_position = self._resolve_until(until)
+
+    if use_cache:
+      lines = self._query_cache.query(line_filter, offset, end, use_mmap)
+      if lines is not None:
+        return _bound_lines(lines, begin, until_position, max_lines)
+
+    if max_workers != 1:
+      num_workers = max_workers or os.cpu_count() or 1
+      chunks = _split_file(
+          self._file_path,
+          offset,
+          num_workers * _PARALLEL_CHUNKS_PER_WORKER,
+          end=end,
+      )
+      if len(chunks) > 1:
+        return self._query_chunks(
+            chunks,
+            num_workers,
+            line_filter,
+            begin,
+            until_position,
+            max_lines,
+            use_mmap,
+        )
+    return _query_file(
+        self._file_path,
+        line_filter,
+        offset,
+        end,
+        begin,
+        until_position,
+        max_lines,
+        use_mmap,
+    )
+
+  def _query_chunks(
+      self,
+      chunks: list[tuple[int, int]],
+      num_workers: int,
+      line_filter: LogcatFilter,
+      begin: Optional[LogcatPosition],
+      until: Optional[LogcatPosition],
+      max_lines: Optional[int],
+      use_mmap: bool,
+  ) -> list[LogLine]:
+    """Runs `_query_file` on chunks of the file in a process pool."""
+    results: list[LogLine] = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(num_workers, len(chunks))
+    ) as executor:
+      futures = [
+          executor.submit(
+              _query_file,
+              self._file_path,
+              line_filter,
+              start,
+              end,
+              begin,
+              until,
+              max_lines,
+              use_mmap,
+          )
+          for start, end in chunks
+      ]
+      for future in futures:
+        results.extend(future.result())
+        if max_lines is not None and len(results) >= max_lines:
+          executor.shutdown(wait=False, cancel_futures=True)
+          del results[max_lines:]
+          break
+    return results
+
+  def tail(
+      self,
+      num_lines: int = 100,
+      pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
+      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      *,
+      use_mmap: bool = False,
+  ) -> list[LogLine]:
+    """Tails last num_lines matching log lines reading backwards from EOF.
+
+    See `get_lines` for `use_mmap`.
+    """
+    line_filter = _to_filter(pattern, tag, level)
+    if num_lines <= 0 or not os.path.exists(self._file_path):
+      return []
+
+    if use_mmap and line_filter._search_key is not None:
+      matched = []
+      for parsed in self._iter_mapped_lines(line_filter, reverse=True):
+        if line_filter.matches(parsed):
+          matched.append(parsed)
+          if len(matched) >= num_lines:
+            break
+      matched.reverse()
+      return matched
+
+    buf: collections.deque[LogLine] = collections.deque()
+    block_size = 64 * 1024  # 64KB chunks
+
+    try:
+      with logcat_storage.SegmentedFileReader(self._file_path) as reader:
+        file_size = reader.size()
+        if file_size == 0:
+          return []
+
+        remaining = file_size
+        remainder = b''
+
+        while remaining > 0 and len(buf) < num_lines:
+          read_size = min(block_size, remaining)
+          remaining -= read_size
+          chunk = reader.read(remaining, read_size)
+          data = chunk + remainder
+
+          # Split lines from chunk
+          split = data.split(b'\n')
+          if remaining > 0:
+            remainder = split[0]
+            lines_chunk = split[1:]
+          else:
             remainder = b''
             lines_chunk = split
 
-          # Calculate offsets and parse lines in reverse order within this block
+          # Calculate offsets, then parse lines in reverse order within this
+          # block until enough lines matched.
           current_offset = remaining + len(remainder)
-          block_lines: list[tuple[int, LogLine]] = []
+          block_lines: list[tuple[int, bytes]] = []
           for line_bytes in lines_chunk:
-            line_offset = current_offset
+            block_lines.append((current_offset, line_bytes))
             current_offset += len(line_bytes) + 1  # count \n byte
-            line_str = line_bytes.decode('utf-8', errors='replace')
-            parsed = LogLine.from_string(line_str, byte_offset=line_offset)
-            if parsed is not None:
-              block_lines.append((line_offset, parsed))
 
-          for _, parsed in reversed(block_lines):
-            if parsed.matches(pattern=pattern, tag=tag, level=level):
+          for line_offset, line_bytes in reversed(block_lines):
+            text = line_filter.screen(line_bytes)
+            if text is None:
+              continue
+            parsed = LogLine.from_string(text, byte_offset=line_offset)
+            if parsed is not None and line_filter.matches(parsed):
               buf.appendleft(parsed)
               if len(buf) >= num_lines:
                 break
@@ -512,26 +2932,99 @@ class LogcatProcessor:
 
     return list(buf)
 
+  def _iter_timeline(
+      self,
+      line_filter: LogcatFilter,
+      begin: Optional[LogcatPosition],
+      until: Optional[LogcatPosition],
+  ) -> Iterator[tuple[int, LogLine]]:
+    """Yields (time_key, LogLine) pairs of matching lines, lazily.
+
+    Lines are read from the first line of `begin`, found in the timestamp
+    index, up to the first line newer than `until` by more than
+    `_TIMELINE_REORDER_SLACK_US`. Lines are held back until a line newer by
+    more than that slack is read, or `_TIMELINE_REORDER_MAX_LINES` lines are
+    held, and are sorted in the meantime, so keys never decrease. Keys are
+    normalized to ignore years, which only some timestamp formats have.
+    Lines without a time key get the key of the previous line, to stay in
+    file order.
+    """
+    offset = 0 if begin is None else self._index.find_offset(begin.timestamp)
+    until_key = None if until is None else _timestamp_key(until.timestamp)
+    if until_key is not None:
+      until_key %= _YEAR_KEY_SPAN
+    time_key = 0
+    last_key = 0
+    # Heap of (time_key, sequence number, LogLine) of the lines held back.
+    held: list[tuple[int, int, LogLine]] = []
+    for sequence, (_, line) in enumerate(self._iter_lines(offset, line_filter)):
+      line_key = line._get_time_key()
+      if line_key is not None:
+        time_key = line_key % _YEAR_KEY_SPAN
+      if until is not None and _compare_times(line, until) > 0:
+        if (
+            until_key is not None
+            and time_key - until_key > _TIMELINE_REORDER_SLACK_US
+        ):
+          break
+        continue
+      if (begin is None or _compare_times(line, begin) >= 0) and (
+          line_filter.matches(line)
+      ):
+        heapq.heappush(held, (time_key, sequence, line))
+      while held and (
+          held[0][0] < time_key - _TIMELINE_REORDER_SLACK_US
+          or len(held) > _TIMELINE_REORDER_MAX_LINES
+      ):
+        held_key, _, held_line = heapq.heappop(held)
+        # A line later than the slack is yielded right away.
+        last_key = max(last_key, held_key)
+        yield last_key, held_line
+    while held:
+      held_key, _, held_line = heapq.heappop(held)
+      last_key = max(last_key, held_key)
+      yield last_key, held_line
+
   def listen(
       self,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
+      pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
       tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
       level: Optional[Union[str, Sequence[str], Set[str]]] = None,
       position: Optional[Union[LogcatPosition, LogLine]] = None,
+      max_events: int = 1000,
+      overflow_policy: OverflowPolicy = OverflowPolicy.OVERWRITE,
   ) -> LogcatListenerContext:
-    """Listens for real-time logcat events in a context manager."""
+    """Listens for real-time logcat events in a context manager.
+
+    See `LogcatListenerContext` for `max_events` and `overflow_policy`.
+    """
     return LogcatListenerContext(
         processor=self,
         pattern=pattern,
         tag=tag,
         level=level,
         position=position,
+        max_events=max_events,
         timeout_error_cls=self._timeout_error_cls,
+        overflow_policy=overflow_policy,
     )
 
+  def aggregate(
+      self, position: Optional[Union[LogcatPosition, LogLine]] = None
+  ) -> LogcatAggregator:
+    """Counts log lines as they are logged, in a context manager.
+
+    See `LogcatAggregator`.
+
+    Args:
+      position: The position of the first line to count. Defaults to the
+        end of the file when entering the context.
+    """
+    return LogcatAggregator(processor=self, position=position)
+
   def wait_for(
       self,
-      patterns: Sequence[Union[str, Pattern[str]]],
+      patterns: Sequence[Union[str, Pattern[str], LogcatFilter]],
       timeout_sec: float = 60.0,
       in_order: bool = True,
       since: Optional[Union[LogcatPosition, LogLine]] = None,
@@ -540,83 +3033,256 @@ class LogcatProcessor:
     if not patterns:
       return []
 
-    deadline = time.perf_counter() + timeout_sec
-
-    if in_order:
-      matched_lines: list[LogLine] = []
-      current_since = since
-      for pat in patterns:
-        remaining = deadline - time.perf_counter()
-        if remaining <= 0:
-          raise self._timeout_error_cls(
-              f'Timed out after {timeout_sec}s waiting for in-order pattern:'
-              f' {pat!r}'
-          )
-        matched, next_offset = self._wait_for_single(
-            pattern=pat,
-            timeout_sec=remaining,
-            since=current_since,
-        )
-        matched_lines.append(matched)
-        current_since = LogcatPosition(_byte_offset=next_offset)
-      return matched_lines
-
-    unmatched = list(enumerate(patterns))
-    matched_dict: dict[int, LogLine] = {}
-    pos = since.position if isinstance(since, LogLine) else since
-    offset = pos._byte_offset if pos else 0
-    begin_time = pos.timestamp if pos and offset == 0 else None
-    scan_offset = offset
-
-    while time.perf_counter() < deadline:
-      for current_offset, parsed in self._iter_lines(offset=scan_offset):
-        scan_offset = current_offset
-        if (
-            begin_time
-            and LogcatPosition._compare_timestamps(parsed.timestamp, begin_time)
-            < 0
-        ):
-          continue
-        for idx, pat in list(unmatched):
-          if parsed.matches(pattern=pat):
-            matched_dict[idx] = parsed
-            unmatched.remove((idx, pat))
-        if not unmatched:
-          return [matched_dict[i] for i in range(len(patterns))]
-      time.sleep(0.1)
-
-    remaining_patterns = [pat for _, pat in unmatched]
-    raise self._timeout_error_cls(
-        f'Timed out after {timeout_sec}s waiting for patterns:'
-        f' {remaining_patterns!r}'
+    deadline = time.monotonic() + timeout_sec
+    offset, begin = self._resolve_since(since)
+    waiter = _PatternWaiter(patterns, in_order, begin)
+    subscription = self._reader.subscribe(
+        waiter.on_line,
+        offset,
+        stop=lambda: waiter.done.is_set() or time.monotonic() > deadline,
     )
+    try:
+      if waiter.done.wait(max(0.0, deadline - time.monotonic())):
+        return waiter.matched_lines
+    finally:
+      self._reader.unsubscribe(subscription)
+    raise self._timeout_error_cls(waiter.timeout_error_message(timeout_sec))
 
-  def _wait_for_single(
+  async def await_for(
       self,
-      pattern: Union[str, Pattern[str]],
+      patterns: Sequence[Union[str, Pattern[str], LogcatFilter]],
       timeout_sec: float = 60.0,
+      in_order: bool = True,
       since: Optional[Union[LogcatPosition, LogLine]] = None,
-  ) -> tuple[LogLine, int]:
-    deadline = time.perf_counter() + timeout_sec
-    pos = since.position if isinstance(since, LogLine) else since
-    offset = pos._byte_offset if pos else 0
-    begin_time = pos.timestamp if pos and offset == 0 else None
-    scan_offset = offset
+  ) -> list[LogLine]:
+    """Awaits until a sequence of patterns appears in logcat.
+
+    The asyncio counterpart of `wait_for`. The lines are matched by the
+    shared reader thread of the processor, so awaiting does not hold a thread
+    per waiter. Only catching up with the lines since `since` runs in the
+    default executor of the event loop. It counts towards the timeout, and
+    stops once the coroutine returns or is cancelled.
+    """
+    if not patterns:
+      return []
 
-    while time.perf_counter() < deadline:
-      for current_offset, parsed in self._iter_lines(offset=scan_offset):
-        scan_offset = current_offset
-        if (
-            begin_time
-            and LogcatPosition._compare_timestamps(parsed.timestamp, begin_time)
-            < 0
-        ):
-          continue
-        if parsed.matches(pattern=pattern):
-          return parsed, current_offset
-      time.sleep(0.1)
+    deadline = time.monotonic() + timeout_sec
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    # Set once the coroutine returns or is cancelled, which stops catching up
+    # in the executor. Guarded by `lock`, with the subscription made there.
+    finished = False
+    lock = threading.Lock()
+    subscriptions: list[_Subscription] = []
+    waiters: list[_PatternWaiter] = []
+
+    def on_done() -> None:
+      try:
+        loop.call_soon_threadsafe(_set_future_result, done, None)
+      except RuntimeError:
+        # The event loop was closed.
+        pass
 
-    raise self._timeout_error_cls(
-        f'Timed out after {timeout_sec}s waiting for logcat pattern:'
-        f' {pattern!r}'
+    def subscribe() -> None:
+      offset, begin = self._resolve_since(since)
+      waiter = _PatternWaiter(patterns, in_order, begin, on_done=on_done)
+      waiters.append(waiter)
+      subscription = self._reader.subscribe(
+          waiter.on_line,
+          offset,
+          stop=lambda: (
+              finished or waiter.done.is_set() or time.monotonic() > deadline
+          ),
+      )
+      with lock:
+        if finished:
+          self._reader.unsubscribe(subscription)
+        else:
+          subscriptions.append(subscription)
+
+    async def subscribe_and_wait() -> None:
+      await loop.run_in_executor(None, subscribe)
+      await done
+
+    try:
+      await asyncio.wait_for(subscribe_and_wait(), timeout_sec)
+      return waiters[0].matched_lines
+    except asyncio.TimeoutError:
+      pass
+    finally:
+      with lock:
+        finished = True
+        for subscription in subscriptions:
+          self._reader.unsubscribe(subscription)
+    waiter = waiters[0] if waiters else _PatternWaiter(patterns, in_order, None)
+    raise self._timeout_error_cls(waiter.timeout_error_message(timeout_sec))
+
+  async def astream(
+      self,
+      pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
+      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      position: Optional[Union[LogcatPosition, LogLine]] = None,
+      max_events: int = 1000,
+  ) -> AsyncIterator[LogLine]:
+    """Yields matching logcat lines as they are written, for `async for`.
+
+    The asyncio counterpart of `listen`. Lines are matched by the shared
+    reader thread of the processor and handed to the event loop. If more than
+    `max_events` lines are pending, the oldest ones are dropped.
+
+    Close the iterator when done with it, e.g. with `contextlib.aclosing`,
+    to stop the delivery of lines right away.
+
+    Args:
+      pattern: Regex pattern to filter lines, or a `LogcatFilter`.
+      tag: Tag filter.
+      level: Severity level filter.
+      position: The position to stream lines from, the end of the file if
+        None.
+      max_events: Maximum number of lines pending.
+    """
+    line_filter = _to_filter(pattern, tag, level)
+    loop = asyncio.get_running_loop()
+    pending: collections.deque[LogLine] = collections.deque()
+    ready = asyncio.Event()
+    dropped = 0
+
+    def append(line: LogLine) -> None:
+      nonlocal dropped
+      if len(pending) >= max(1, max_events):
+        pending.popleft()
+        dropped += 1
+      pending.append(line)
+      ready.set()
+
+    def on_line(next_offset: int, line: LogLine) -> None:
+      del next_offset  # Unused param.
+      if line_filter.matches(line):
+        try:
+          loop.call_soon_threadsafe(append, line)
+        except RuntimeError:
+          # The event loop was closed.
+          pass
+
+    def subscribe() -> _Subscription:
+      pos = position.position if isinstance(position, LogLine) else position
+      if pos is None:
+        pos = LogcatPosition.from_file(self._file_path)
+      return self._reader.subscribe(on_line, pos._byte_offset)
+
+    subscription = await loop.run_in_executor(None, subscribe)
+    try:
+      while True:
+        while pending:
+          yield pending.popleft()
+        ready.clear()
+        await ready.wait()
+    finally:
+      self._reader.unsubscribe(subscription)
+      if dropped:
+        logging.warning(
+            'Logcat stream (%s) dropped %d lines, consider a larger'
+            ' max_events.',
+            line_filter,
+            dropped,
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class MergedLogLine:
+  """A log line yielded by `merge_lines`.
+
+  Attributes:
+    source: The name of the logcat file the line is from, e.g. the serial of
+      the device.
+    line: The log line.
+  """
+
+  source: str
+  line: LogLine
+
+
+def _timestamp_bound(
+    bound: Optional[Union[LogcatPosition, LogLine]],
+) -> Optional[LogcatPosition]:
+  """Returns the timestamp of a bound, which applies to any logcat file.
+
+  Raises:
+    ValueError: The bound has no timestamp.
+  """
+  pos = bound.position if isinstance(bound, LogLine) else bound
+  if pos is None:
+    return None
+  if not pos.timestamp:
+    raise ValueError(
+        'Positions bounding merged logcat lines must have a timestamp, got'
+        f' {pos!r}.'
     )
+  return LogcatPosition(timestamp=pos.timestamp)
+
+
+def merge_lines(
+    processors: Mapping[str, LogcatProcessor],
+    pattern: Optional[Union[str, Pattern[str], LogcatFilter]] = None,
+    *,
+    tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+    level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+    since: Optional[Union[LogcatPosition, LogLine]] = None,
+    until: Optional[Union[LogcatPosition, LogLine]] = None,
+) -> Iterator[MergedLogLine]:
+  """Merges the lines of several logcat files into one timeline, lazily.
+
+  Each file is read in chunks as its lines are needed, and the lines are
+  merged with a heap on their timestamps, so memory use does not grow with
+  the size of the files. Log buffers interleave in logcat files, so the
+  lines of each file are sorted within a window of a few seconds first.
+  Lines with the same timestamp are yielded in the order of `processors`.
+
+  Args:
+    processors: The processors of the files to merge, by the name their
+      lines are tagged with, e.g. device serials.
+    pattern: Regex pattern matched against message and raw line, or a
+      `LogcatFilter` replacing `pattern`, `tag` and `level`.
+    tag: Tag string, compiled regex pattern, or collection of tags to match.
+    level: Severity level string or collection of levels to match.
+    since: Position or line whose timestamp the lines must not be older than.
+      Byte offsets are ignored as they are specific to one file.
+    until: Position or line whose timestamp the lines must not be newer than.
+      Each file is read up to its first line newer than it by a few seconds.
+
+  Returns:
+    An iterator of the matching lines of all files, in timestamp order.
+
+  Raises:
+    ValueError: `since` or `until` has no timestamp.
+  """
+  line_filter = _to_filter(pattern, tag, level)
+  begin = _timestamp_bound(since)
+  end = _timestamp_bound(until)
+  names = list(processors)
+  timelines = [
+      _tag_timeline(index, processors[name], line_filter, begin, end)
+      for index, name in enumerate(names)
+  ]
+  return (
+      MergedLogLine(source=names[index], line=line)
+      for _, index, line in heapq.merge(*timelines)
+  )
+
+
+def _tag_timeline(
+    index: int,
+    processor: LogcatProcessor,
+    line_filter: LogcatFilter,
+    begin: Optional[LogcatPosition],
+    until: Optional[LogcatPosition],
+) -> Iterator[tuple[int, int, LogLine]]:
+  """Yields heap entries of the timeline of one file of `merge_lines`.
+
+  Entries are ordered by time key, then by the index of the file. Two
+  entries of the same file are never in the heap together, so lines are
+  never compared.
+  """
+  for time_key, line in processor._iter_timeline(line_filter, begin, until):
+    yield time_key, index, line
@@ -0,0 +1,421 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Size-rotated, compressed storage of logcat files.
+
+A logcat file stored in segments consists of:
+
+* the file itself, holding the newest, active segment as plain text,
+* sealed segments next to it, compressed with gzip and named
+  ``<file>.<number>.gz``,
+* an index ``<file>.segments`` with one JSON line per sealed segment, giving
+  its file name and the offset and size of its content.
+
+The content of the sealed segments followed by the content of the active
+segment forms one virtual file. Offsets into it do not change when segments
+are rotated, so byte offsets of log lines and positions stay valid. A plain
+logcat file without an index is read as a single active segment.
+"""
+
+import bisect
+import dataclasses
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from typing import BinaryIO, Callable, Optional
+
+# Compression level of sealed segments. Segments are sealed while logcat is
+# being collected, so speed is favored over size.
+_COMPRESS_LEVEL = 1
+
+# Size of the reads used when sealing segments and collecting logcat.
+_COPY_SIZE = 1024 * 1024
+
+# Interval at which readers check again for a rotation in progress to end.
+_ROTATION_POLL_SEC = 0.01
+
+# Longest time readers wait for a rotation in progress. A rotation taking
+# longer was interrupted, e.g. by a crash of the collecting process.
+_ROTATION_TIMEOUT_SEC = 5
+
+
+def index_path(file_path: str) -> str:
+  """Returns the path of the segment index of a logcat file."""
+  return file_path + '.segments'
+
+
+@dataclasses.dataclass(frozen=True)
+class Segment:
+  """A sealed segment of a logcat file.
+
+  Attributes:
+    path: Path of the compressed segment file.
+    begin: Offset of the content of the segment in the virtual file.
+    size: Size of the uncompressed content of the segment.
+  """
+
+  path: str
+  begin: int
+  size: int
+
+  @property
+  def end(self) -> int:
+    """Offset right after the content of the segment in the virtual file."""
+    return self.begin + self.size
+
+
+def _parse_index(
+    file_path: str, data: bytes, allow_partial: bool = False
+) -> Optional[list[Segment]]:
+  """Parses the segments listed in the data of an index.
+
+  The last line of the index is written without its line end while the
+  active segment is emptied, marking the rotation as in progress.
+
+  Args:
+    file_path: The logcat file the index belongs to.
+    data: The content of the index.
+    allow_partial: Whether to accept a rotation in progress as done.
+
+  Returns:
+    The sealed segments in order, or None if a rotation is in progress.
+  """
+  if data and not data.endswith(b'\n') and not allow_partial:
+    return None
+  directory = os.path.dirname(file_path)
+  segments = []
+  for line in data.splitlines():
+    try:
+      entry = json.loads(line)
+      segments.append(
+          Segment(
+              path=os.path.join(directory, entry['path']),
+              begin=entry['begin'],
+              size=entry['size'],
+          )
+      )
+    except (ValueError, KeyError, TypeError):
+      # Skips blank or partially written lines.
+      continue
+  return segments
+
+
+def file_size(file_path: str) -> int:
+  """Returns the size of the virtual file of a logcat file, 0 if missing."""
+  with SegmentedFileReader(file_path) as reader:
+    return reader.size()
+
+
+class SegmentedFileReader:
+  """Reads a logcat file stored in segments at virtual offsets.
+
+  Reads of the active segment are checked against concurrent rotations. The
+  content of the sealed segment read last is kept decompressed in memory, so
+  scanning through a segment decompresses it only once.
+  """
+
+  def __init__(self, file_path: str):
+    self._file_path = file_path
+    self._index_path = index_path(file_path)
+    # Size of the index when it was parsed last, -1 if there is none.
+    self._index_version: Optional[int] = None
+    self._segments: list[Segment] = []
+    self._begins: list[int] = []
+    self._live_file: Optional[BinaryIO] = None
+    self._cached_segment: Optional[tuple[Segment, bytes]] = None
+
+  @property
+  def segments(self) -> list[Segment]:
+    """The sealed segments of the file, empty for plain files."""
+    self._refresh()
+    return list(self._segments)
+
+  @property
+  def live_base(self) -> int:
+    """The virtual offset of the content of the active segment."""
+    self._refresh()
+    return self._live_base()
+
+  def _live_base(self) -> int:
+    return self._segments[-1].end if self._segments else 0
+
+  def _stat_index(self) -> int:
+    try:
+      return os.stat(self._index_path).st_size
+    except OSError:
+      return -1
+
+  def _refresh(self) -> int:
+    """Parses the index if it changed, waiting out rotations in progress.
+
+    Returns:
+      The version of the index parsed, to detect later changes with.
+
+    Raises:
+      OSError: The index could not be read completely in time.
+    """
+    deadline = time.monotonic() + _ROTATION_TIMEOUT_SEC
+    while True:
+      version = self._stat_index()
+      if version == self._index_version:
+        return version
+      segments: Optional[list[Segment]] = []
+      if version >= 0:
+        try:
+          with open(self._index_path, 'rb') as f:
+            data = f.read()
+        except OSError:
+          if time.monotonic() > deadline:
+            raise
+          time.sleep(_ROTATION_POLL_SEC)
+          continue
+        if len(data) != version:
+          # The index is being written.
+          if time.monotonic() > deadline:
+            raise OSError(
+                f'Index of logcat segments kept changing: {self._index_path}'
+            )
+          time.sleep(_ROTATION_POLL_SEC)
+          continue
+        segments = _parse_index(
+            self._file_path,
+            data,
+            allow_partial=time.monotonic() > deadline,
+        )
+        if segments is None:
+          time.sleep(_ROTATION_POLL_SEC)
+          continue
+      self._segments = segments
+      self._begins = [segment.begin for segment in segments]
+      self._index_version = version
+      return version
+
+  def _open_live(self) -> Optional[BinaryIO]:
+    if self._live_file is None:
+      try:
+        self._live_file = open(self._file_path, 'rb')
+      except OSError:
+        return None
+    return self._live_file
+
+  def segment_data(self, segment: Segment) -> bytes:
+    """Returns the decompressed content of a sealed segment."""
+    if self._cached_segment is None or self._cached_segment[0] != segment:
+      self._cached_segment = None
+      try:
+        with gzip.open(segment.path, 'rb') as f:
+          self._cached_segment = (segment, f.read())
+      except EOFError as e:
+        raise OSError(f'Truncated logcat segment: {segment.path}') from e
+    return self._cached_segment[1]
+
+  def size(self) -> int:
+    """Returns the size of the virtual file."""
+    while True:
+      version = self._refresh()
+      try:
+        live_size = os.path.getsize(self._file_path)
+      except OSError:
+        live_size = 0
+      if self._stat_index() == version:
+        return self._live_base() + live_size
+
+  def read(self, offset: int, size: int) -> bytes:
+    """Reads up to `size` bytes at a virtual offset.
+
+    Returns:
+      The bytes read, fewer than `size` only at the end of the file.
+    """
+    parts = []
+    while size > 0:
+      data = self._read_part(offset, size)
+      if not data:
+        break
+      parts.append(data)
+      offset += len(data)
+      size -= len(data)
+    return b''.join(parts)
+
+  def _read_part(self, offset: int, size: int) -> bytes:
+    """Reads up to `size` bytes at a virtual offset from a single segment."""
+    while True:
+      version = self._refresh()
+      if offset < self._live_base():
+        index = bisect.bisect_right(self._begins, offset) - 1
+        if index < 0:
+          return b''
+        segment = self._segments[index]
+        start = offset - segment.begin
+        return self.segment_data(segment)[start : start + size]
+      live_file = self._open_live()
+      if live_file is None:
+        return b''
+      live_file.seek(offset - self._live_base())
+      data = live_file.read(size)
+      # Data read while the active segment was rotated may belong to the
+      # next segment, read it again at its new offset.
+      if self._stat_index() == version:
+        return data
+
+  def close(self) -> None:
+    if self._live_file is not None:
+      self._live_file.close()
+      self._live_file = None
+    self._cached_segment = None
+
+  def __enter__(self) -> 'SegmentedFileReader':
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    self.close()
+
+
+class SegmentedFileWriter:
+  """Writes a logcat stream into a file stored in size-rotated segments.
+
+  Data is appended to the active segment. Once the active segment reaches
+  `segment_size_bytes`, it is sealed at the next line end: its content is
+  compressed into a new segment file that is listed in the index, and the
+  active segment is emptied. Writing to an existing file continues it.
+  Without a segment size, the file is never rotated and stays a plain file.
+  """
+
+  def __init__(self, file_path: str, segment_size_bytes: Optional[int]):
+    self._file_path = file_path
+    self._index_path = index_path(file_path)
+    self._segment_size = segment_size_bytes
+    self._recover()
+    segments = []
+    try:
+      with open(self._index_path, 'rb') as f:
+        segments = _parse_index(file_path, f.read(), allow_partial=True)
+    except OSError:
+      pass
+    self._next_number = len(segments) + 1
+    self._base = segments[-1].end if segments else 0
+    self._file = open(file_path, 'ab')
+    self._size = self._file.tell()
+
+  @property
+  def file_path(self) -> str:
+    return self._file_path
+
+  @property
+  def end_offset(self) -> int:
+    """The virtual offset the next data is written at."""
+    return self._base + self._size
+
+  def _recover(self) -> None:
+    """Completes a rotation interrupted while emptying the active segment."""
+    try:
+      with open(self._index_path, 'rb') as f:
+        data = f.read()
+    except OSError:
+      return
+    if not data or data.endswith(b'\n'):
+      return
+    complete = data[: data.rfind(b'\n') + 1]
+    if _parse_index(self._file_path, data[len(complete) :], allow_partial=True):
+      # The segment was sealed and listed, only emptying it may be missing.
+      with open(self._file_path, 'r+b') as f:
+        f.truncate(0)
+      with open(self._index_path, 'ab') as f:
+        f.write(b'\n')
+    else:
+      with open(self._index_path, 'wb') as f:
+        f.write(complete)
+
+  def write(self, data: bytes) -> None:
+    """Appends data, sealing the active segment at line ends when full."""
+    if self._segment_size is None:
+      self._file.write(data)
+      self._size += len(data)
+      return
+    while data:
+      room = self._segment_size - self._size
+      cut = data.find(b'\n', max(room - 1, 0)) if len(data) >= room else -1
+      if cut < 0:
+        self._file.write(data)
+        self._size += len(data)
+        return
+      self._file.write(data[: cut + 1])
+      self._size += cut + 1
+      self._seal()
+      data = data[cut + 1 :]
+
+  def _seal(self) -> None:
+    """Compresses the active segment into a new sealed segment."""
+    self._file.flush()
+    name = f'{os.path.basename(self._file_path)}.{self._next_number:05d}.gz'
+    path = os.path.join(os.path.dirname(self._file_path), name)
+    with open(self._file_path, 'rb') as src:
+      with gzip.open(path + '.tmp', 'wb', compresslevel=_COMPRESS_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, _COPY_SIZE)
+    os.replace(path + '.tmp', path)
+    entry = json.dumps({'path': name, 'begin': self._base, 'size': self._size})
+    with open(self._index_path, 'ab') as index:
+      # Readers wait for the line end, so that they never read data of the
+      # next segment at offsets of the sealed one.
+      index.write(entry.encode('utf-8'))
+      index.flush()
+      self._file.truncate(0)
+      index.write(b'\n')
+    self._base += self._size
+    self._size = 0
+    self._next_number += 1
+
+  def flush(self) -> None:
+    self._file.flush()
+
+  def collect(
+      self,
+      stream: BinaryIO,
+      transform: Optional[Callable[[bytes], bytes]] = None,
+      on_write: Optional[Callable[[int, bytes], None]] = None,
+  ) -> None:
+    """Writes the data read from a stream until it ends, then closes.
+
+    Args:
+      stream: A buffered binary stream, e.g. the stdout of a logcat process.
+        Closing it from another thread ends the collection.
+      transform: Converts the data read before it is written, e.g. decodes
+        binary logcat output.
+      on_write: Called with the virtual offset and the data after each write
+        was flushed.
+    """
+    try:
+      while True:
+        try:
+          data = stream.read1(_COPY_SIZE)
+        except (OSError, ValueError):
+          # The stream was closed.
+          break
+        if not data:
+          break
+        if transform is not None:
+          data = transform(data)
+        offset = self.end_offset
+        self.write(data)
+        self.flush()
+        if on_write is not None and data:
+          on_write(offset, data)
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Failed to write logcat to %s.', self._file_path)
+    finally:
+      self.close()
+
+  def close(self) -> None:
+    self._file.close()
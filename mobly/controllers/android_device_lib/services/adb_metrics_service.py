@@ -0,0 +1,113 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Module for the service saving the adb metrics of a device."""
+import os
+
+import yaml
+
+from mobly import utils
+from mobly.controllers.android_device_lib import adb_metrics
+from mobly.controllers.android_device_lib.services import base_service
+
+
+class AdbMetricsService(base_service.BaseService):
+  """Service recording the latency and failures of the adb commands run.
+
+  While the service is alive, the adb commands run on the device are
+  counted in `adb_metrics`. Each output excerpt saves the counters of the
+  commands run since the previous one, so the adb time of each test can be
+  broken down.
+  """
+
+  OUTPUT_FILE_TYPE = 'adb_metrics'
+
+  def __init__(self, device, configs=None):
+    del configs  # Unused param.
+    super().__init__(device)
+    self._ad = device
+    self._is_alive = False
+
+  @property
+  def is_alive(self):
+    return self._is_alive
+
+  def start(self):
+    """Starts recording the adb commands of the device."""
+    if not self._is_alive:
+      adb_metrics.get_metrics().enable(self._ad.serial)
+      self._is_alive = True
+
+  def stop(self):
+    """Stops recording the adb commands of the device.
+
+    The counters recorded so far are saved with the next excerpt, if the
+    service is started again, e.g. after a reboot or a USB disconnect.
+    """
+    if self._is_alive:
+      adb_metrics.get_metrics().disable(self._ad.serial)
+      self._is_alive = False
+
+  def create_output_excerpts(self, test_info):
+    """Saves the counters of the adb commands run since the last excerpt.
+
+    The counters of each adb command, see `adb_metrics.CommandStats`, are
+    saved to a YAML file in the output directory of the test, slowest
+    commands first, and reset. No file is created if no command was run.
+
+    Args:
+      test_info: `self.current_test_info` in a Mobly test.
+
+    Returns:
+      List of strings, the absolute paths to the files created.
+    """
+    stats_by_name = adb_metrics.get_metrics().take(self._ad.serial)
+    if not stats_by_name:
+      return []
+    commands = {}
+    for name, stats in sorted(
+        stats_by_name.items(), key=lambda item: -item[1].total_sec
+    ):
+      commands[name] = {
+          'Calls': stats.calls,
+          'Errors': stats.errors,
+          'Timeouts': stats.timeouts,
+          'Total Seconds': round(stats.total_sec, 3),
+          'Max Seconds': round(stats.max_sec, 3),
+          'Bytes Sent': stats.bytes_sent,
+          'Bytes Received': stats.bytes_received,
+          'Calls Per Exit Code': dict(sorted(stats.exit_codes.items())),
+          'Calls Per Milliseconds': {
+              f'{low}-{max(low, 2 * low - 1)}': calls
+              for low, calls in sorted(stats.latency_histogram.items())
+          },
+      }
+    summary = {
+        'Calls': sum(stats.calls for stats in stats_by_name.values()),
+        'Errors': sum(stats.errors for stats in stats_by_name.values()),
+        'Timeouts': sum(stats.timeouts for stats in stats_by_name.values()),
+        'Total Seconds': round(
+            sum(stats.total_sec for stats in stats_by_name.values()), 3
+        ),
+        'Commands': commands,
+    }
+    dest_path = test_info.output_path
+    utils.create_dir(dest_path)
+    filename = self._ad.generate_filename(
+        self.OUTPUT_FILE_TYPE, test_info, 'yaml'
+    )
+    metrics_file_path = os.path.join(dest_path, filename)
+    with open(metrics_file_path, 'w', encoding='utf-8') as f:
+      yaml.safe_dump(summary, f, default_flow_style=False, sort_keys=False)
+    self._ad.log.debug('adb metrics saved at: %s', metrics_file_path)
+    return [metrics_file_path]
@@ -12,19 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import collections
+from collections.abc import AsyncIterator, Iterator
+import contextlib
 import logging
 import os
+import threading
 import time
 from typing import Any, Callable, Optional, Pattern, Sequence, Set, Union
 
+import yaml
+
 from mobly import utils
 from mobly.controllers.android_device_lib import adb
 from mobly.controllers.android_device_lib import errors
+from mobly.controllers.android_device_lib import logcat_binary
 from mobly.controllers.android_device_lib import logcat_processor
+from mobly.controllers.android_device_lib import logcat_storage
 from mobly.controllers.android_device_lib.services import base_service
 
 CREATE_LOGCAT_FILE_TIMEOUT_SEC = 5
 
+# Size of the reads used to copy excerpts where the kernel can not copy them.
+_EXCERPT_COPY_BUFFER_SIZE = 1024 * 1024
+
+# Time to wait for the thread writing segmented logcat storage to finish.
+_COLLECTOR_STOP_TIMEOUT_SEC = 5
+
+# Number of tags and processes listed in the logcat stats of a test.
+_STATS_TOP_COUNT = 20
+
 
 class Error(errors.ServiceError):
   """Root error type for logcat service."""
@@ -45,12 +63,99 @@ class Config:
     output_file_path: string, the path on the host to write the log file to,
       including the actual filename. The service will automatically generate one
       if not specified.
+    segment_size_bytes: int, if set, the logcat file is rotated into segments
+      of about this size, and sealed segments are compressed. The logcat file
+      then holds the newest segment only, but queries and excerpts still cover
+      all segments. See `logcat_storage` for the file layout.
+    binary_format: bool, collects logcat with `logcat -B` and decodes the
+      binary entries on the host into threadtime text, instead of having
+      logcat format them on the device. Entries of binary buffers, e.g.
+      events, are not collected in this format.
+    direct_pipe: bool, reads the output of adb logcat in the host process
+      instead of redirecting it to the file. New lines are then handed to
+      listeners and waiters as soon as they are written, and the most recent
+      lines are kept in memory to catch up new ones with. Implied by
+      `segment_size_bytes` and `binary_format`.
+    collect_stats: bool, counts the lines logged per tag, pid and level, and
+      the number of lines logged per second, while logcat is collected. The
+      counts of each excerpt are summarized in a YAML file next to it.
   """
 
-  def __init__(self, logcat_params=None, clear_log=True, output_file_path=None):
+  def __init__(
+      self,
+      logcat_params=None,
+      clear_log=True,
+      output_file_path=None,
+      segment_size_bytes=None,
+      binary_format=False,
+      direct_pipe=False,
+      collect_stats=False,
+  ):
     self.clear_log = clear_log
     self.logcat_params = logcat_params if logcat_params else ''
     self.output_file_path = output_file_path
+    self.segment_size_bytes = segment_size_bytes
+    self.binary_format = binary_format
+    self.direct_pipe = direct_pipe
+    self.collect_stats = collect_stats
+
+
+def _copy_in_kernel(
+    copy_func: Callable[[int, int], int], offset: int, count: int
+) -> int:
+  """Copies bytes with `copy_func(offset, count)` until done or unsupported.
+
+  Returns:
+    The number of bytes copied.
+  """
+  copied = 0
+  try:
+    while copied < count:
+      size = copy_func(offset + copied, count - copied)
+      if not size:
+        break
+      copied += size
+  except OSError:
+    # Not supported for these files or file systems.
+    pass
+  return copied
+
+
+def _copy_byte_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+  """Copies a byte range of a file to the current position of another file.
+
+  The data is copied by the kernel with `os.copy_file_range` or `os.sendfile`
+  where the platform and file systems support it, and through a large buffer
+  otherwise.
+
+  Args:
+    src_fd: The file descriptor to copy from.
+    dst_fd: The file descriptor to copy to.
+    offset: The offset in the source file to copy from.
+    count: The number of bytes to copy. Copying stops early at the end of the
+      source file.
+  """
+  copied = 0
+  if hasattr(os, 'copy_file_range'):
+    copied += _copy_in_kernel(
+        lambda pos, size: os.copy_file_range(src_fd, dst_fd, size, pos),
+        offset,
+        count,
+    )
+  if copied < count and hasattr(os, 'sendfile'):
+    copied += _copy_in_kernel(
+        lambda pos, size: os.sendfile(dst_fd, src_fd, pos, size),
+        offset + copied,
+        count - copied,
+    )
+  if copied < count:
+    os.lseek(src_fd, offset + copied, os.SEEK_SET)
+    while copied < count:
+      data = os.read(src_fd, min(_EXCERPT_COPY_BUFFER_SIZE, count - copied))
+      if not data:
+        break
+      os.write(dst_fd, data)
+      copied += len(data)
 
 
 class Logcat(base_service.BaseService):
@@ -68,8 +173,20 @@ class Logcat(base_service.BaseService):
     self._ad = android_device
     self._adb_logcat_process = None
     self._adb_logcat_file_obj = None
+    self._logcat_collector = None
+    # Offset in the logcat file where the next excerpt starts.
+    self._excerpt_offset = 0
     self.adb_logcat_file_path = None
     self._processor = None
+    self._last_excerpt_range = None
+    # Listeners created since the last excerpt, or still listening, with
+    # their counters at the last excerpt.
+    self._listeners: dict[
+        logcat_processor.LogcatListenerContext,
+        logcat_processor.LogcatListenerStats,
+    ] = {}
+    # Counts the lines logged since the last excerpt, with `collect_stats`.
+    self._aggregator: Optional[logcat_processor.LogcatAggregator] = None
     self._last_connection_time = None
     # Logcat service uses a single config obj, using singular internal
     # name: `_config`.
@@ -122,6 +239,18 @@ class Logcat(base_service.BaseService):
       self._ad.log.debug('Failed to get device timestamp.')
     return None
 
+  def _get_device_utc_offset(self) -> int:
+    """Retrieves the UTC offset of the device time zone in seconds."""
+    try:
+      response = self._ad.adb.shell(['date', '+%z'])
+      return logcat_binary.parse_utc_offset(response.decode('utf-8'))
+    except (adb.AdbError, ValueError):
+      self._ad.log.warning(
+          'Failed to get the device time zone, binary logcat times are'
+          ' printed in UTC.'
+      )
+      return 0
+
   def now(self) -> logcat_processor.LogcatPosition:
     """Captures the current logcat position and device timestamp.
 
@@ -145,21 +274,29 @@ class Logcat(base_service.BaseService):
 
   def get_lines(
       self,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
+      pattern: Optional[
+          Union[str, Pattern[str], logcat_processor.LogcatFilter]
+      ] = None,
       *,
       tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
       level: Optional[Union[str, Sequence[str], Set[str]]] = None,
       since: Optional[
           Union[logcat_processor.LogcatPosition, logcat_processor.LogLine]
       ] = None,
+      until: Optional[
+          Union[logcat_processor.LogcatPosition, logcat_processor.LogLine]
+      ] = None,
       max_lines: Optional[int] = None,
+      use_mmap: bool = False,
+      max_workers: Optional[int] = 1,
+      use_cache: bool = False,
   ) -> list[logcat_processor.LogLine]:
     """Gets log lines from the logcat file matching the given filters.
 
     Filters are evaluated conjunctively. At least one filter criteria
-    (``pattern``, ``tag``, ``level``, ``since``, or ``max_lines``) must be
-    specified. To retrieve the latest un-filtered logs, use :meth:`tail`
-    instead.
+    (``pattern``, ``tag``, ``level``, ``since``, ``until``, or ``max_lines``)
+    must be specified. To retrieve the latest un-filtered logs, use
+    :meth:`tail` instead.
 
     Examples::
 
@@ -172,12 +309,26 @@ class Logcat(base_service.BaseService):
       lines = ad.services.logcat.get_lines('WiFi connected', since=start)
 
     Args:
-      pattern: Regular expression pattern matched against message and raw line.
+      pattern: Regular expression pattern matched against message and raw line,
+        or a :class:`logcat_processor.LogcatFilter` replacing ``pattern``,
+        ``tag`` and ``level``.
       tag: Tag string, compiled regex pattern, or collection of tags to match.
       level: Severity level string ('V', 'D', 'I', 'W', 'E', 'F') or collection.
       since: Optional :class:`logcat_processor.LogcatPosition` or
         :class:`logcat_processor.LogLine` bounding search start.
+      until: Optional :class:`logcat_processor.LogcatPosition` or
+        :class:`logcat_processor.LogLine` bounding search end, e.g. the end of
+        :attr:`last_excerpt_range`.
       max_lines: Maximum number of matching log lines to return.
+      use_mmap: Whether to search the memory mapped file for the criteria
+        instead of reading every line. Useful for selective queries on large
+        logs, e.g. in ``teardown_test`` or ``on_fail``.
+      max_workers: Number of processes scanning chunks of large logcat files
+        in parallel, or None for one per CPU. By default, the file is scanned
+        in this process.
+      use_cache: Whether to cache the lines matching the criteria, so that
+        repeating the query, e.g. polling for new lines, only scans the lines
+        logged since the previous one. ``max_workers`` is ignored.
 
     Returns:
       A list of matching
@@ -192,15 +343,23 @@ class Logcat(base_service.BaseService):
         tag=tag,
         level=level,
         since=since,
+        until=until,
         max_lines=max_lines,
+        use_mmap=use_mmap,
+        max_workers=max_workers,
+        use_cache=use_cache,
     )
 
   def tail(
       self,
       num_lines: int = 100,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
+      pattern: Optional[
+          Union[str, Pattern[str], logcat_processor.LogcatFilter]
+      ] = None,
       tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
       level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      *,
+      use_mmap: bool = False,
   ) -> list[logcat_processor.LogLine]:
     """Tails the last matching log lines from the logcat file.
 
@@ -214,9 +373,12 @@ class Logcat(base_service.BaseService):
 
     Args:
       num_lines: Number of matching lines to return from the end of the file.
-      pattern: Optional regex pattern filter.
+      pattern: Optional regex pattern filter, or a
+        :class:`logcat_processor.LogcatFilter`.
       tag: Optional tag filter.
       level: Optional severity level filter.
+      use_mmap: Whether to search the memory mapped file, see
+        :meth:`get_lines`.
 
     Returns:
       A list of the last ``num_lines`` matching
@@ -228,13 +390,20 @@ class Logcat(base_service.BaseService):
         pattern=pattern,
         tag=tag,
         level=level,
+        use_mmap=use_mmap,
     )
 
   def listen(
       self,
-      pattern: Optional[Union[str, Pattern[str]]] = None,
+      pattern: Optional[
+          Union[str, Pattern[str], logcat_processor.LogcatFilter]
+      ] = None,
       tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
       level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      max_events: int = 1000,
+      overflow_policy: logcat_processor.OverflowPolicy = (
+          logcat_processor.OverflowPolicy.OVERWRITE
+      ),
   ) -> logcat_processor.LogcatListenerContext:
     """Listens for real-time logcat events within a scoped context manager.
 
@@ -249,25 +418,36 @@ class Logcat(base_service.BaseService):
         assert 'STATE_CONNECTED' in event.message
 
     Args:
-      pattern: Optional regex pattern to filter incoming events.
+      pattern: Optional regex pattern to filter incoming events, or a
+        :class:`logcat_processor.LogcatFilter`.
       tag: Optional tag filter.
       level: Optional severity level filter.
+      max_events: Number of events the listener queues.
+      overflow_policy: What to do with new events while the queue is full.
+        The events dropped are counted in the listener's ``stats``, which
+        are saved next to the excerpt of the test the listener was used in.
 
     Returns:
       A :class:`logcat_processor.LogcatListenerContext` managing event queue
       and background stream.
     """
     cursor = self.now()
-    return self._get_processor().listen(
+    listener = self._get_processor().listen(
         pattern=pattern,
         tag=tag,
         level=level,
         position=cursor,
+        max_events=max_events,
+        overflow_policy=overflow_policy,
     )
+    self._listeners[listener] = logcat_processor.LogcatListenerStats()
+    return listener
 
   def wait_for(
       self,
-      patterns: Sequence[Union[str, Pattern[str]]],
+      patterns: Sequence[
+          Union[str, Pattern[str], logcat_processor.LogcatFilter]
+      ],
       timeout_sec: float = 60.0,
       in_order: bool = True,
       since: Optional[
@@ -290,7 +470,8 @@ class Logcat(base_service.BaseService):
       )
 
     Args:
-      patterns: Sequence of string patterns or compiled regular expressions.
+      patterns: Sequence of string patterns, compiled regular expressions, or
+        :class:`logcat_processor.LogcatFilter` objects.
       timeout_sec: Maximum wall-clock time in seconds to wait before timing out.
       in_order: Whether patterns must occur in the specified sequential order
         (True) or any order (False).
@@ -312,11 +493,103 @@ class Logcat(base_service.BaseService):
         since=since,
     )
 
+  async def await_for(
+      self,
+      patterns: Sequence[
+          Union[str, Pattern[str], logcat_processor.LogcatFilter]
+      ],
+      timeout_sec: float = 60.0,
+      in_order: bool = True,
+      since: Optional[
+          Union[logcat_processor.LogcatPosition, logcat_processor.LogLine]
+      ] = None,
+  ) -> list[logcat_processor.LogLine]:
+    """Awaits until pattern(s) appear in logcat within the given timeout.
+
+    The asyncio counterpart of :meth:`wait_for`, which does not block a thread
+    while waiting, so one event loop can wait on many devices at once.
+
+    Examples::
+
+      lines = await asyncio.gather(*(
+          ad.services.logcat.await_for(['Bluetooth connected'])
+          for ad in ads
+      ))
+
+    Args:
+      patterns: See :meth:`wait_for`.
+      timeout_sec: See :meth:`wait_for`.
+      in_order: See :meth:`wait_for`.
+      since: See :meth:`wait_for`.
+
+    Returns:
+      A list of matching :class:`logcat_processor.LogLine` objects
+      corresponding to each pattern in ``patterns``.
+
+    Raises:
+      LogcatTimeoutError: If matching pattern(s) are not found within
+        ``timeout_sec``.
+    """
+    return await self._get_processor().await_for(
+        patterns=patterns,
+        timeout_sec=timeout_sec,
+        in_order=in_order,
+        since=since,
+    )
+
+  async def astream(
+      self,
+      pattern: Optional[
+          Union[str, Pattern[str], logcat_processor.LogcatFilter]
+      ] = None,
+      tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+      level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+      max_events: int = 1000,
+  ) -> AsyncIterator[logcat_processor.LogLine]:
+    """Yields real-time logcat events, the asyncio counterpart of listen.
+
+    Streams the lines written from the time of the call on.
+
+    Examples::
+
+      async with contextlib.aclosing(
+          ad.services.logcat.astream(tag='WifiService')
+      ) as events:
+        async for event in events:
+          if 'STATE_CONNECTED' in event.message:
+            break
+
+    Args:
+      pattern: Optional regex pattern to filter incoming events, or a
+        :class:`logcat_processor.LogcatFilter`.
+      tag: Optional tag filter.
+      level: Optional severity level filter.
+      max_events: Number of events kept pending, older events are dropped
+        if the consumer falls behind.
+
+    Yields:
+      :class:`logcat_processor.LogLine` objects matching the filters.
+    """
+    cursor = await asyncio.get_running_loop().run_in_executor(None, self.now)
+    lines = self._get_processor().astream(
+        pattern=pattern,
+        tag=tag,
+        level=level,
+        position=cursor,
+        max_events=max_events,
+    )
+    async with contextlib.aclosing(lines):
+      async for line in lines:
+        yield line
+
   def create_output_excerpts(self, test_info):
     """Creates excerpts of adb logcat copied from current stream.
 
-    This copies logcat lines from self.adb_logcat_file_path to an excerpt
-    file, starting from the location where the previous excerpt ended.
+    This copies the bytes of self.adb_logcat_file_path to an excerpt file,
+    starting from the location where the previous excerpt ended. The byte
+    range copied is available as :attr:`last_excerpt_range`. The event
+    counters of the listeners used since the previous excerpt are saved next
+    to the excerpt.
 
     Call this method at the end of: `setup_class`, `teardown_test`, and
     `teardown_class`.
@@ -333,24 +606,160 @@ class Logcat(base_service.BaseService):
         self.OUTPUT_FILE_TYPE, test_info, 'txt'
     )
     excerpt_file_path = os.path.join(dest_path, filename)
-    with open(
-        excerpt_file_path,
-        'w',
-        encoding='utf-8',
-        errors='replace',
-        # When newline is '', line endings are read without conversion.
-        newline='',
-    ) as out:
+    self._last_excerpt_range = None
+    with open(excerpt_file_path, 'wb') as out:
       # Devices may accidentally go offline during test,
-      # check not None before readline().
-      while self._adb_logcat_file_obj:
-        line = self._adb_logcat_file_obj.readline()
-        if not line:
-          break
-        out.write(line)
+      # check not None before copying.
+      if self._adb_logcat_file_obj:
+        if self._config.segment_size_bytes:
+          begin, end = self._copy_segmented_excerpt(out)
+        else:
+          src_fd = self._adb_logcat_file_obj.fileno()
+          begin = self._excerpt_offset
+          end = os.fstat(src_fd).st_size
+          if end < begin:
+            # The logcat file was truncated, copy it from the start.
+            begin = 0
+          _copy_byte_range(src_fd, out.fileno(), begin, end - begin)
+        self._excerpt_offset = end
+        self._last_excerpt_range = (
+            logcat_processor.LogcatPosition(_byte_offset=begin),
+            logcat_processor.LogcatPosition(_byte_offset=end),
+        )
     self._ad.log.debug('logcat excerpt created at: %s', excerpt_file_path)
+    self._write_listener_stats(excerpt_file_path)
+    if self._aggregator is not None and self._last_excerpt_range is not None:
+      self._write_log_stats(
+          excerpt_file_path,
+          self._aggregator.take_stats(end=self._last_excerpt_range[1]),
+      )
     return [excerpt_file_path]
 
+  def _write_listener_stats(self, excerpt_file_path: str) -> None:
+    """Saves the event counters of the listeners used since the last excerpt.
+
+    The counters of the events since the last excerpt are saved to a YAML
+    file next to the excerpt, named after it, if any listener was used. The
+    max backlog is the largest since the listener was created.
+
+    Args:
+      excerpt_file_path: The path of the excerpt created.
+    """
+    listeners = self._listeners
+    self._listeners = {}
+    if not listeners:
+      return
+    entries = []
+    for listener, previous in listeners.items():
+      total = listener.stats
+      if listener.is_listening:
+        self._listeners[listener] = total
+      stats = logcat_processor.LogcatListenerStats(
+          dispatched=total.dispatched - previous.dispatched,
+          matched=total.matched - previous.matched,
+          dropped=total.dropped - previous.dropped,
+          max_backlog=total.max_backlog,
+      )
+      line_filter = listener.filter
+      entries.append(
+          {
+              'Filter': (
+                  f'pattern={line_filter.pattern!r}, tag={line_filter.tag!r},'
+                  f' level={line_filter.level!r}'
+              ),
+              'Max Events': listener.max_events,
+              'Overflow Policy': listener.overflow_policy.value,
+              'Dispatched': stats.dispatched,
+              'Matched': stats.matched,
+              'Dropped': stats.dropped,
+              'Max Backlog': stats.max_backlog,
+          }
+      )
+      if stats.dropped:
+        self._ad.log.warning(
+            'Logcat listener (%s) dropped %d of %d events, consider a larger'
+            ' max_events.',
+            entries[-1]['Filter'],
+            stats.dropped,
+            stats.matched,
+        )
+    stats_file_path = (
+        os.path.splitext(excerpt_file_path)[0] + '.listener_stats.yaml'
+    )
+    with open(stats_file_path, 'w', encoding='utf-8') as f:
+      yaml.safe_dump(entries, f, default_flow_style=False)
+    self._ad.log.debug('logcat listener stats saved at: %s', stats_file_path)
+
+  def _write_log_stats(
+      self, excerpt_file_path: str, stats: logcat_processor.LogcatStats
+  ) -> None:
+    """Saves a summary of the line counts of an excerpt next to it.
+
+    Args:
+      excerpt_file_path: The path of the excerpt created.
+      stats: The line counts of the excerpt.
+    """
+    top_tags = collections.Counter(stats.tags).most_common(_STATS_TOP_COUNT)
+    top_pids = collections.Counter(stats.pids).most_common(_STATS_TOP_COUNT)
+    summary = {
+        'Lines': stats.lines,
+        'Lines Per Level': stats.levels,
+        'Tags': len(stats.tags),
+        'Top Tags': [{tag: count} for tag, count in top_tags],
+        'Pids': len(stats.pids),
+        'Top Pids': [{pid: count} for pid, count in top_pids],
+        'Peak Lines Per Second': stats.peak_rate,
+        'Peak Second': stats.peak_second,
+        'Seconds Per Rate': {
+            f'{low}-{2 * low - 1}': seconds
+            for low, seconds in stats.rate_histogram.items()
+        },
+    }
+    stats_file_path = os.path.splitext(excerpt_file_path)[0] + '.stats.yaml'
+    with open(stats_file_path, 'w', encoding='utf-8') as f:
+      yaml.safe_dump(summary, f, default_flow_style=False, sort_keys=False)
+    self._ad.log.debug('logcat stats saved at: %s', stats_file_path)
+
+  def _copy_segmented_excerpt(self, out) -> tuple[int, int]:
+    """Copies the next excerpt of a segmented logcat file to `out`.
+
+    Returns:
+      The begin and end offsets copied.
+    """
+    with logcat_storage.SegmentedFileReader(
+        self.adb_logcat_file_path
+    ) as reader:
+      begin = self._excerpt_offset
+      end = reader.size()
+      if end < begin:
+        # The logcat file was truncated, copy it from the start.
+        begin = 0
+      offset = begin
+      while offset < end:
+        data = reader.read(offset, min(_EXCERPT_COPY_BUFFER_SIZE, end - offset))
+        if not data:
+          break
+        out.write(data)
+        offset += len(data)
+    return begin, offset
+
+  @property
+  def last_excerpt_range(
+      self,
+  ) -> Optional[
+      tuple[logcat_processor.LogcatPosition, logcat_processor.LogcatPosition]
+  ]:
+    """The positions in the logcat file the last excerpt was copied from.
+
+    Pass them as ``since`` and ``until`` to :meth:`get_lines` to query the
+    lines of the last excerpt without reading the rest of the logcat file,
+    e.g. ``get_lines(level='E', since=begin, until=end)``.
+
+    None if no excerpt was copied from the logcat file yet, or the service
+    was stopped when the last excerpt was created.
+    """
+    return self._last_excerpt_range
+
   @property
   def is_alive(self):
     return True if self._adb_logcat_process else False
@@ -398,7 +807,8 @@ class Logcat(base_service.BaseService):
         new_config,
     )
     self._config = new_config
-    self._processor = None
+    self._close_processor()
+    self._last_excerpt_range = None
 
   def _open_logcat_file(self):
     """Creates a file object that points to the beginning of the logcat file.
@@ -414,15 +824,13 @@ class Logcat(base_service.BaseService):
               self._ad, 'Timeout while waiting for logcat file to be created.'
           )
         time.sleep(1)
+      # Excerpts are copied as bytes, so line endings and undecodable bytes
+      # are kept as is.
       self._adb_logcat_file_obj = open(
           self.adb_logcat_file_path,  # pytype: disable=wrong-arg-types
-          'r',
-          encoding='utf-8',
-          errors='replace',
-          # When newline is '', line endings are read without conversion.
-          newline='',
+          'rb',
       )
-      self._adb_logcat_file_obj.seek(0, os.SEEK_END)
+      self._excerpt_offset = logcat_storage.file_size(self.adb_logcat_file_path)
 
   def _close_logcat_file(self):
     """Closes and resets the logcat file object, if it exists."""
@@ -445,6 +853,13 @@ class Logcat(base_service.BaseService):
       self.clear_adb_log()
     self._start()
     self._open_logcat_file()
+    if self._config.collect_stats:
+      self._aggregator = self._processor.aggregate(
+          position=logcat_processor.LogcatPosition(
+              _byte_offset=self._excerpt_offset
+          )
+      )
+      self._aggregator.__enter__()
 
   def _start(self):
     """Starts the actual subprocess logic of starting logcat."""
@@ -458,10 +873,17 @@ class Logcat(base_service.BaseService):
       )
       logcat_file_path = os.path.join(self._ad.log_path, f_name)
       self.adb_logcat_file_path = logcat_file_path
-    self._processor = logcat_processor.LogcatProcessor(
-        self.adb_logcat_file_path,
-        timeout_error_cls=lambda msg: LogcatTimeoutError(self._ad, msg),
-    )
+    if (
+        self._processor is None
+        or self._processor.file_path != self.adb_logcat_file_path
+    ):
+      # Keep the processor across pause and resume so that active listeners
+      # continue to receive events.
+      self._close_processor()
+      self._processor = logcat_processor.LogcatProcessor(
+          self.adb_logcat_file_path,
+          timeout_error_cls=lambda msg: LogcatTimeoutError(self._ad, msg),
+      )
     utils.create_dir(os.path.dirname(self.adb_logcat_file_path))
     # In debugging mode of IntelijIDEA, "patch_args" remove
     # double quotes in args if starting and ending with it.
@@ -471,20 +893,75 @@ class Logcat(base_service.BaseService):
       self._last_connection_time = None
     else:
       t_argument_value = '1'
-    cmd = ' "%s" -s %s logcat -v threadtime -T "%s" %s >> "%s" ' % (
+    output_format = '-B' if self._config.binary_format else '-v threadtime'
+    cmd = ' "%s" -s %s logcat %s -T "%s" %s ' % (
         adb.ADB,
         self._ad.serial,
+        output_format,
         t_argument_value,
         self._config.logcat_params,
-        self.adb_logcat_file_path,
+    )
+    if not (
+        self._config.segment_size_bytes
+        or self._config.binary_format
+        or self._config.direct_pipe
+    ):
+      cmd += '>> "%s" ' % self.adb_logcat_file_path
+      process = utils.start_standing_subprocess(cmd, shell=True)
+      self._adb_logcat_process = process
+      return
+    transform = None
+    on_write = self._processor.publish
+    if self._config.binary_format:
+      decoder = logcat_binary.BinaryLogcatDecoder(
+          self._get_device_utc_offset()
+      )
+      processor = self._processor
+      # The lines decoded last, handed to the processor with their columns
+      # so that they are not parsed again. Both functions run in the
+      # collector thread, one after the other.
+      text_lines = []
+
+      def transform(data):
+        text_lines[:] = decoder.feed_lines(data)
+        return b''.join(line.data for line in text_lines)
+
+      def on_write(offset, data):
+        processor.publish(offset, data, text_lines)
+
+    writer = logcat_storage.SegmentedFileWriter(
+        self.adb_logcat_file_path, self._config.segment_size_bytes
     )
     process = utils.start_standing_subprocess(cmd, shell=True)
     self._adb_logcat_process = process
+    self._logcat_collector = threading.Thread(
+        target=writer.collect,
+        args=(process.stdout, transform, on_write),
+        name=f'logcat-collector-{self._ad.serial}',
+        daemon=True,
+    )
+    self._logcat_collector.start()
+
+  def _stop_aggregator(self):
+    """Stops counting lines for the logcat stats, if counting."""
+    if self._aggregator is not None:
+      self._aggregator.__exit__(None, None, None)
+      self._aggregator = None
+
+  def _close_processor(self):
+    """Stops the background work of the logcat processor, if it exists."""
+    self._stop_aggregator()
+    if self._processor:
+      self._processor.close()
+      self._processor = None
 
   def stop(self):
     """Stops the adb logcat service."""
     self._close_logcat_file()
     self._stop()
+    self._stop_aggregator()
+    if self._processor:
+      self._processor.close()
 
   def _stop(self):
     """Stops the background process for logcat."""
@@ -494,6 +971,9 @@ class Logcat(base_service.BaseService):
       utils.stop_standing_subprocess(self._adb_logcat_process)
     except Exception:
       self._ad.log.exception('Failed to stop adb logcat.')
+    if self._logcat_collector:
+      self._logcat_collector.join(_COLLECTOR_STOP_TIMEOUT_SEC)
+      self._logcat_collector = None
     self._adb_logcat_process = None
     self._last_connection_time = None
 
@@ -518,3 +998,63 @@ class Logcat(base_service.BaseService):
     # Not clearing the log regardless of the config when resuming.
     # Otherwise the logs during the paused time will be lost.
     self._start()
+
+
+def merge_lines(
+    ads: Sequence[Any],
+    pattern: Optional[
+        Union[str, Pattern[str], logcat_processor.LogcatFilter]
+    ] = None,
+    *,
+    tag: Optional[Union[str, Pattern[str], Sequence[str], Set[str]]] = None,
+    level: Optional[Union[str, Sequence[str], Set[str]]] = None,
+    since: Optional[
+        Union[logcat_processor.LogcatPosition, logcat_processor.LogLine]
+    ] = None,
+    until: Optional[
+        Union[logcat_processor.LogcatPosition, logcat_processor.LogLine]
+    ] = None,
+) -> Iterator[logcat_processor.MergedLogLine]:
+  """Merges the logcat of several devices into one timeline, lazily.
+
+  The lines are read from the logcat files of the devices as they are
+  consumed, so the memory used does not depend on the size of the files.
+
+  Examples::
+
+    start = sender.services.logcat.now()
+    sender.droid.sendMessage(receiver.serial)
+    for merged in logcat.merge_lines([sender, receiver], since=start):
+      logging.info('[%s] %s', merged.source, merged.line.raw)
+
+  Args:
+    ads: The AndroidDevice objects whose logcat services are merged. Their
+      lines are tagged with the serials of the devices.
+    pattern: Regular expression pattern matched against message and raw line,
+      or a :class:`logcat_processor.LogcatFilter` replacing ``pattern``,
+      ``tag`` and ``level``.
+    tag: Tag string, compiled regex pattern, or collection of tags to match.
+    level: Severity level string ('V', 'D', 'I', 'W', 'E', 'F') or collection.
+    since: Optional :class:`logcat_processor.LogcatPosition` or
+      :class:`logcat_processor.LogLine` whose timestamp bounds the search
+      start on all devices, e.g. from :meth:`Logcat.now`.
+    until: Optional :class:`logcat_processor.LogcatPosition` or
+      :class:`logcat_processor.LogLine` whose timestamp bounds the search end
+      on all devices.
+
+  Returns:
+    An iterator of :class:`logcat_processor.MergedLogLine` in timestamp
+    order, whose ``source`` is the serial of the device.
+
+  Raises:
+    Error: The logcat service of a device has not been started.
+    ValueError: ``since`` or ``until`` has no timestamp.
+  """
+  return logcat_processor.merge_lines(
+      {ad.serial: ad.services.logcat._get_processor() for ad in ads},
+      pattern,
+      tag=tag,
+      level=level,
+      since=since,
+      until=until,
+  )
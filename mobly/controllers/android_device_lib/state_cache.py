@@ -0,0 +1,77 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Caching of facts about the state of a device."""
+
+import threading
+import time
+from typing import Any, Callable
+
+
+class StateCache:
+  """Caches facts about the state of a device, each for a limited time.
+
+  Facts that can only change through actions like rebooting or switching
+  adb to root are cached for long, and the cache is invalidated by these
+  actions. Facts that can also change behind the back of the test are
+  cached briefly.
+
+  Errors raised while loading a fact are not cached.
+  """
+
+  def __init__(self, clock: Callable[[], float] = time.monotonic):
+    """Initializes the cache.
+
+    Args:
+      clock: func, returns the current time in seconds.
+    """
+    self._clock = clock
+    self._lock = threading.Lock()
+    # The cached values and their expiration times by key.
+    self._entries: dict[str, tuple[Any, float]] = {}
+    # Incremented by invalidations, so that values loaded while the cache was
+    # invalidated are not stored.
+    self._generation = 0
+
+  def get(self, key: str, load: Callable[[], Any], ttl_sec: float) -> Any:
+    """Returns a cached fact, loading it if missing or expired.
+
+    Args:
+      key: string, the name of the fact.
+      load: func, returns the current value of the fact.
+      ttl_sec: float, the number of seconds to cache a loaded value for.
+
+    Returns:
+      The value of the fact.
+    """
+    now = self._clock()
+    with self._lock:
+      entry = self._entries.get(key)
+      generation = self._generation
+    if entry is not None and now < entry[1]:
+      return entry[0]
+    value = load()
+    with self._lock:
+      if generation == self._generation:
+        self._entries[key] = (value, now + ttl_sec)
+    return value
+
+  def invalidate(self, *keys: str) -> None:
+    """Drops cached facts, all of them if no key is given."""
+    with self._lock:
+      self._generation += 1
+      if not keys:
+        self._entries.clear()
+        return
+      for key in keys:
+        self._entries.pop(key, None)
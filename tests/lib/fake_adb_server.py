@@ -0,0 +1,294 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module has a fake adb server speaking the smart-socket protocol, used
+# in unit tests of the clients of the adb server.
+
+import socketserver
+import stat
+import struct
+import threading
+
+_SYNC_HEADER = struct.Struct('<4sI')
+
+
+class FakeDevice:
+  """A device of the fake adb server.
+
+  Attributes:
+    state: string, the state listed by `adb devices`.
+    features: set of strings, the features of the device.
+    files: dict, the content of the files on the device by path. Paths of
+      directories map to None.
+    mtimes: dict, the modification times of the files pushed, by path.
+    shell_handler: func, called with the command of a shell request, returns
+      its exit code, stdout and stderr.
+  """
+
+  def __init__(self, state='device', features=('shell_v2',)):
+    self.state = state
+    self.features = set(features)
+    self.files = {'/sdcard': None}
+    self.mtimes = {}
+    self.shell_handler = lambda command: (0, b'', b'')
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+  """A fake adb server on a local port, serving a subset of the protocol.
+
+  Attributes:
+    devices: dict, the FakeDevice objects by serial. Changes of the devices
+      are sent to `host:track-devices` streams once `notify_changed` is
+      called.
+    forwards: list of (serial, local, remote) tuples.
+    requests: list of strings, all requests received, in order.
+  """
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self):
+    super().__init__(('127.0.0.1', 0), _Handler)
+    self.devices = {}
+    self.forwards = []
+    self.requests = []
+    self._next_port = 40000
+    self._thread = None
+    self.closing = False
+    self.changed = threading.Condition()
+
+  @property
+  def address(self):
+    return self.server_address[:2]
+
+  def add_device(self, serial, **kwargs):
+    self.devices[serial] = FakeDevice(**kwargs)
+    self.notify_changed()
+    return self.devices[serial]
+
+  def notify_changed(self):
+    with self.changed:
+      self.changed.notify_all()
+
+  def listing(self):
+    return ''.join(
+        f'{serial}\t{device.state}\n'
+        for serial, device in list(self.devices.items())
+    ).encode('utf-8')
+
+  def start(self):
+    self._thread = threading.Thread(
+        target=self.serve_forever, args=(0.01,), daemon=True
+    )
+    self._thread.start()
+
+  def stop(self):
+    if self._thread is None:
+      return
+    self.closing = True
+    self.notify_changed()
+    self.shutdown()
+    self.server_close()
+    self._thread.join()
+    self._thread = None
+
+  def allocate_port(self):
+    self._next_port += 1
+    return self._next_port
+
+
+class _Handler(socketserver.BaseRequestHandler):
+  """Serves one connection of the fake adb server."""
+
+  def _read_exact(self, size):
+    data = b''
+    while len(data) < size:
+      chunk = self.request.recv(size - len(data))
+      if not chunk:
+        return None
+      data += chunk
+    return data
+
+  def _send_string(self, data):
+    self.request.sendall(b'%04x' % len(data) + data)
+
+  def _okay(self, reply=None):
+    self.request.sendall(b'OKAY')
+    if reply is not None:
+      self._send_string(reply)
+
+  def _fail(self, message):
+    self.request.sendall(b'FAIL')
+    self._send_string(message.encode('utf-8'))
+
+  def handle(self):
+    device = None
+    serial = ''
+    while True:
+      length = self._read_exact(4)
+      if length is None:
+        return
+      request = self._read_exact(int(length, 16)).decode('utf-8')
+      self.server.requests.append(request)
+      if device is not None:
+        self._serve_device(serial, device, request)
+        return
+      if request.startswith('host:transport'):
+        serial = request.partition('host:transport:')[2]
+        if not serial and self.server.devices:
+          serial = next(iter(self.server.devices))
+        device = self.server.devices.get(serial)
+        if device is None:
+          self._fail(f"device '{serial}' not found")
+          return
+        self._okay()
+        continue
+      self._serve_host(request)
+      return
+
+  def _serve_host(self, request):
+    if request in ('host:devices', 'host:devices-l'):
+      self._okay(self.server.listing())
+      return
+    if request == 'host:track-devices':
+      self._okay()
+      self._track_devices()
+      return
+    if request == 'host:list-forward':
+      self._okay(self._list_forward(None))
+      return
+    prefix, _, command = request.partition(':')
+    serial = ''
+    if prefix == 'host-serial':
+      serial, _, command = command.partition(':')
+      if serial not in self.server.devices:
+        self._fail(f"device '{serial}' not found")
+        return
+    device = self.server.devices.get(serial)
+    if command == 'features':
+      self._okay(','.join(sorted(device.features)).encode('utf-8'))
+    elif command == 'get-state':
+      self._okay(device.state.encode('utf-8'))
+    elif command == 'list-forward':
+      self._okay(self._list_forward(serial))
+    elif command.startswith('forward:'):
+      self._forward(serial, command.removeprefix('forward:'))
+    elif command.startswith('killforward'):
+      local = command.partition(':')[2] or None
+      self.server.forwards = [
+          forward
+          for forward in self.server.forwards
+          if forward[0] != serial or local not in (None, forward[1])
+      ]
+      self._okay()
+      self._okay()
+    else:
+      self._fail(f'unknown host service: {command}')
+
+  def _track_devices(self):
+    sent = None
+    with self.server.changed:
+      while not self.server.closing:
+        listing = self.server.listing()
+        if listing != sent:
+          try:
+            self._send_string(listing)
+          except OSError:
+            return
+          sent = listing
+        self.server.changed.wait()
+
+  def _list_forward(self, serial):
+    return ''.join(
+        f'{forward_serial} {local} {remote}\n'
+        for forward_serial, local, remote in self.server.forwards
+        if serial is None or forward_serial == serial
+    ).encode('utf-8')
+
+  def _forward(self, serial, spec):
+    no_rebind = spec.startswith('norebind:')
+    local, _, remote = spec.removeprefix('norebind:').partition(';')
+    self._okay()
+    port = None
+    if local == 'tcp:0':
+      port = self.server.allocate_port()
+      local = f'tcp:{port}'
+    if no_rebind and any(f[1] == local for f in self.server.forwards):
+      self._fail(f"cannot rebind existing socket '{local}'")
+      return
+    self.server.forwards.append((serial, local, remote))
+    self._okay(None if port is None else str(port).encode('utf-8'))
+
+  def _serve_device(self, serial, device, request):
+    del serial  # Unused param.
+    if request.startswith('shell,v2,raw:'):
+      if 'shell_v2' not in device.features:
+        self._fail('closed')
+        return
+      self._okay()
+      ret, out, err = device.shell_handler(request.partition(':')[2])
+      for packet_id, data in ((1, out), (2, err), (3, bytes([ret]))):
+        if data:
+          self.request.sendall(struct.pack('<BI', packet_id, len(data)) + data)
+    elif request.startswith('shell:') or request.startswith('exec:'):
+      self._okay()
+      _, out, err = device.shell_handler(request.partition(':')[2])
+      self.request.sendall(out + err)
+    elif request == 'sync:':
+      self._okay()
+      self._serve_sync(device)
+    else:
+      self._fail(f'unknown service: {request}')
+
+  def _serve_sync(self, device):
+    while True:
+      header = self._read_exact(_SYNC_HEADER.size)
+      if header is None:
+        return
+      packet_id, length = _SYNC_HEADER.unpack(header)
+      if packet_id == b'QUIT':
+        return
+      data = self._read_exact(length).decode('utf-8')
+      if packet_id == b'STAT':
+        if data not in device.files:
+          mode = 0
+        elif device.files[data] is None:
+          mode = stat.S_IFDIR | 0o755
+        else:
+          mode = stat.S_IFREG | 0o644
+        self.request.sendall(struct.pack('<4sIII', b'STAT', mode, 0, 0))
+      elif packet_id == b'SEND':
+        path = data.rpartition(',')[0]
+        content = b''
+        while True:
+          packet_id, length = _SYNC_HEADER.unpack(
+              self._read_exact(_SYNC_HEADER.size)
+          )
+          if packet_id == b'DONE':
+            device.mtimes[path] = length
+            break
+          content += self._read_exact(length)
+        device.files[path] = content
+        self.request.sendall(_SYNC_HEADER.pack(b'OKAY', 0))
+      elif packet_id == b'RECV':
+        content = device.files.get(data)
+        if content is None:
+          message = b'remote object does not exist'
+          self.request.sendall(_SYNC_HEADER.pack(b'FAIL', len(message)))
+          self.request.sendall(message)
+          continue
+        for i in range(0, len(content), 5):
+          chunk = content[i : i + 5]
+          self.request.sendall(_SYNC_HEADER.pack(b'DATA', len(chunk)) + chunk)
+        self.request.sendall(_SYNC_HEADER.pack(b'DONE', 0))
@@ -0,0 +1,91 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mobly.controllers.android_device_lib import adb_metrics
+
+
+class AdbMetricsTest(unittest.TestCase):
+  """Unit tests for the adb_metrics module."""
+
+  def test_command_name(self):
+    self.assertEqual(
+        adb_metrics.command_name(['adb', '-s', 'x', 'install', 'a.apk']),
+        'install',
+    )
+    self.assertEqual(
+        adb_metrics.command_name(['adb', 'shell', 'pm list packages']),
+        'shell pm',
+    )
+    self.assertEqual(
+        adb_metrics.command_name('"adb" -s "x" exec-out screencap -p'),
+        'exec-out screencap',
+    )
+    self.assertEqual(adb_metrics.command_name(['adb', 'shell']), 'shell')
+    self.assertEqual(adb_metrics.command_name(['adb']), '')
+
+  def test_record(self):
+    metrics = adb_metrics.AdbMetrics()
+    metrics.enable('x')
+
+    metrics.record('x', ['adb', '-s', 'x', 'push', 'a', 'b'], 0.0004, 0, 3)
+    metrics.record('x', ['adb', '-s', 'x', 'push', 'c', 'd'], 0.0015, 1, 2)
+    metrics.record('x', ['adb', '-s', 'x', 'push', 'e', 'f'], 0.0100)
+
+    stats = metrics.snapshot('x')['push']
+    self.assertEqual(stats.calls, 3)
+    self.assertEqual(stats.errors, 1)
+    self.assertEqual(stats.timeouts, 1)
+    self.assertAlmostEqual(stats.total_sec, 0.0119)
+    self.assertEqual(stats.max_sec, 0.01)
+    self.assertEqual(stats.bytes_sent, 3 * len('adb -s x push a b'))
+    self.assertEqual(stats.bytes_received, 5)
+    self.assertEqual(stats.exit_codes, {0: 1, 1: 1})
+    self.assertEqual(stats.latency_histogram, {0: 1, 1: 1, 8: 1})
+
+  def test_record_only_enabled_devices(self):
+    metrics = adb_metrics.AdbMetrics()
+    metrics.enable('x')
+    metrics.enable('x')
+
+    metrics.record('', ['adb', 'devices'], 0.1, 0)
+    metrics.record('x', ['adb', '-s', 'x', 'root'], 0.1, 0)
+    metrics.disable('x')
+    metrics.record('x', ['adb', '-s', 'x', 'root'], 0.1, 0)
+    metrics.disable('x')
+    metrics.record('x', ['adb', '-s', 'x', 'root'], 0.1, 0)
+
+    self.assertFalse(metrics.is_enabled('x'))
+    self.assertEqual(metrics.snapshot(''), {})
+    self.assertEqual(metrics.take('x')['root'].calls, 2)
+
+  def test_take_and_reset(self):
+    metrics = adb_metrics.AdbMetrics()
+    metrics.enable('x')
+    metrics.enable('y')
+    metrics.record('x', ['adb', '-s', 'x', 'root'], 0.1, 0)
+    metrics.record('y', ['adb', '-s', 'y', 'root'], 0.1, 0)
+
+    snapshot = metrics.snapshot('x')
+    snapshot['root'].exit_codes[0] = 5
+    self.assertEqual(metrics.snapshot('x')['root'].exit_codes, {0: 1})
+    self.assertEqual(list(metrics.take('x')), ['root'])
+    self.assertEqual(metrics.take('x'), {})
+    metrics.reset()
+    self.assertEqual(metrics.snapshot('y'), {})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,184 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import platform
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import adb_shell_session
+
+# Stands in for the adb binary: runs `adb -s <serial> shell [command]` with
+# the local shell.
+_FAKE_ADB = """#!/bin/sh
+shift 3
+if [ $# -gt 0 ]; then
+  exec sh -c "$*"
+fi
+exec sh
+"""
+
+
+@unittest.skipIf(
+    platform.system() == 'Windows', 'The tests run commands in a POSIX shell.'
+)
+class AdbShellSessionTest(unittest.TestCase):
+  """Unit tests for the adb_shell_session module, with a local shell."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+  def _start_session(self, cmd=('sh',)):
+    session = adb_shell_session.ShellSession(cmd)
+    session.start()
+    self.addCleanup(session.close)
+    return session
+
+  def _make_proxy(self):
+    fake_adb = os.path.join(self.tmp_dir, 'adb')
+    with open(fake_adb, 'w') as f:
+      f.write(_FAKE_ADB)
+    os.chmod(fake_adb, os.stat(fake_adb).st_mode | stat.S_IEXEC)
+    patcher = mock.patch.object(adb, 'ADB', fake_adb)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    proxy = adb.AdbProxy('serial1', use_shell_session=True)
+    self.addCleanup(proxy.close_shell_session)
+    return proxy
+
+  def test_run_returns_exit_code_and_output(self):
+    session = self._start_session()
+
+    self.assertEqual(
+        session.run('printf out; echo err >&2; exit 3'), (3, b'out', b'err\n')
+    )
+    self.assertEqual(
+        session.run('echo \'a  b\' "$((1 + 1))"'), (0, b'a  b 2\n', b'')
+    )
+    # A syntax error does not break the framing of the next commands.
+    ret, out, _ = session.run("echo 'unterminated")
+    self.assertNotEqual(ret, 0)
+    self.assertEqual(out, b'')
+    self.assertEqual(session.run('echo next'), (0, b'next\n', b''))
+
+  def test_commands_do_not_change_the_session(self):
+    session = self._start_session()
+
+    session.run(f'cd {self.tmp_dir}; X=1; exit 0')
+    self.assertNotEqual(session.run('pwd')[1], self.tmp_dir.encode() + b'\n')
+    self.assertEqual(session.run('echo "[$X]"'), (0, b'[]\n', b''))
+    # Reading stdin does not consume the commands written after.
+    self.assertEqual(session.run('cat'), (0, b'', b''))
+    self.assertTrue(session.is_alive)
+
+  def test_concurrent_commands_get_their_own_output(self):
+    session = self._start_session()
+    results = {}
+
+    def run(i):
+      results[i] = session.run(f'sleep 0.0{i % 3}; echo {i}; echo e{i} >&2')
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(20)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(
+        results,
+        {i: (0, b'%d\n' % i, b'e%d\n' % i) for i in range(20)},
+    )
+
+  def test_timeout_ends_the_session(self):
+    session = self._start_session()
+
+    with self.assertRaises(TimeoutError):
+      session.run('sleep 10', timeout=0.2)
+    self.assertFalse(session.is_alive)
+    with self.assertRaises(adb_shell_session.SessionUnavailableError):
+      session.run('echo')
+
+  def test_merged_stderr(self):
+    session = self._start_session(('sh', '-c', 'exec sh 2>&1'))
+
+    self.assertEqual(
+        session.run('echo out; echo err >&2; exit 1'), (1, b'out\nerr\n', b'')
+    )
+    self.assertEqual(session.run('echo one'), (0, b'one\n', b''))
+    self.assertEqual(session.run('echo two >&2'), (0, b'two\n', b''))
+    self.assertEqual(session.run('printf three'), (0, b'three', b''))
+
+  def test_start_fails_when_the_shell_exits(self):
+    session = adb_shell_session.ShellSession(['sh', '-c', 'exit 1'])
+
+    with self.assertRaises(adb_shell_session.SessionUnavailableError):
+      session.start()
+
+  @mock.patch('mobly.utils.run_command', wraps=adb.utils.run_command)
+  def test_proxy_runs_short_shell_commands_in_the_session(self, run_command):
+    proxy = self._make_proxy()
+    stderr = io.BytesIO()
+
+    self.assertEqual(proxy.shell(['echo', 'a']), b'a\n')
+    self.assertEqual(proxy.shell(['printf', 'x'], timeout=5), b'x')
+    with self.assertRaisesRegex(adb.AdbError, 'ret: 2') as context:
+      proxy.shell('echo bad >&2; exit 2', stderr=stderr)
+    self.assertEqual(
+        context.exception.cmd,
+        [adb.ADB, '-s', 'serial1', 'shell', 'echo bad >&2; exit 2'],
+    )
+    self.assertEqual(stderr.getvalue(), b'bad\n')
+    with self.assertRaises(adb.AdbTimeoutError):
+      proxy.shell(['sleep', '10'], timeout=0.2)
+    run_command.assert_not_called()
+
+  @mock.patch('mobly.utils.run_command', wraps=adb.utils.run_command)
+  def test_proxy_falls_back_to_adb_binary(self, run_command):
+    proxy = self._make_proxy()
+    proxy.shell(['true'])
+
+    # Streaming commands do not use the session.
+    with self.assertRaises(adb.AdbError):
+      proxy.shell(['logcat', '-d'], timeout=5)
+    self.assertEqual(run_command.call_count, 1)
+    # The session died, the command runs with the binary.
+    proxy._shell_session.close()
+    with mock.patch.object(
+        adb_shell_session.ShellSession, 'start', side_effect=OSError('no')
+    ):
+      self.assertEqual(proxy.shell(['echo', 'b']), b'b\n')
+      self.assertEqual(run_command.call_count, 2)
+      # A new session is not tried right after a failure to start one.
+      proxy.shell(['echo', 'c'])
+      self.assertEqual(run_command.call_count, 3)
+    proxy.close_shell_session()
+    self.assertEqual(proxy.shell(['echo', 'd']), b'd\n')
+    self.assertEqual(run_command.call_count, 3)
+
+  def test_proxy_uses_no_session_by_default(self):
+    self.assertFalse(adb.AdbProxy('serial1')._shell_session_enabled)
+    with mock.patch.object(adb, 'USE_SHELL_SESSION', True):
+      self.assertTrue(adb.AdbProxy('serial1')._shell_session_enabled)
+      self.assertFalse(adb.AdbProxy()._shell_session_enabled)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,253 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import adb_socket
+from tests.lib import fake_adb_server
+
+
+class AdbSocketTest(unittest.TestCase):
+  """Unit tests for the adb_socket module and its use by AdbProxy."""
+
+  def setUp(self):
+    self.server = fake_adb_server.FakeAdbServer()
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    self.device = self.server.add_device('serial1')
+    self.client = adb_socket.AdbSocketClient(self.server.address)
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+  def _make_proxy(self, serial='serial1'):
+    proxy = adb.AdbProxy(serial, use_server_protocol=True)
+    proxy._socket_client = self.client
+    return proxy
+
+  def test_server_address_from_environment(self):
+    with mock.patch.dict(
+        os.environ,
+        {
+            'ANDROID_ADB_SERVER_ADDRESS': '10.0.0.2',
+            'ANDROID_ADB_SERVER_PORT': '5038',
+        },
+    ):
+      self.assertEqual(adb_socket.server_address(), ('10.0.0.2', 5038))
+    with mock.patch.dict(os.environ, {}, clear=True):
+      self.assertEqual(adb_socket.server_address(), ('127.0.0.1', 5037))
+
+  def test_devices(self):
+    self.server.add_device('serial2', state='unauthorized')
+
+    self.assertEqual(
+        self.client.devices(),
+        b'List of devices attached\n'
+        b'serial1\tdevice\nserial2\tunauthorized\n\n',
+    )
+    self.assertEqual(self.client.get_state('serial2'), b'unauthorized\n')
+
+  def test_shell_v2_reports_exit_code_and_stderr(self):
+    self.device.shell_handler = lambda command: (
+        3,
+        b'out of ' + command.encode('utf-8'),
+        b'err',
+    )
+
+    self.assertEqual(
+        self.client.shell('serial1', 'ls /data'),
+        (3, b'out of ls /data', b'err'),
+    )
+    self.assertEqual(
+        self.server.requests[-2:],
+        ['host:transport:serial1', 'shell,v2,raw:ls /data'],
+    )
+
+  def test_shell_without_shell_v2(self):
+    device = self.server.add_device('old', features=())
+    device.shell_handler = lambda command: (1, b'out', b'err')
+
+    self.assertEqual(self.client.shell('old', 'id'), (0, b'outerr', b''))
+    self.assertEqual(self.server.requests[-1], 'shell:id')
+
+  def test_unknown_device_fails(self):
+    with self.assertRaisesRegex(
+        adb_socket.RequestFailedError, "device 'missing' not found"
+    ):
+      self.client.exec_out('missing', 'id')
+
+  def test_forward(self):
+    self.assertEqual(
+        self.client.forward('serial1', 'tcp:0', 'tcp:8080'), b'40001\n'
+    )
+    self.assertEqual(self.client.forward('serial1', 'tcp:5000', 'tcp:80'), b'')
+    with self.assertRaisesRegex(adb_socket.RequestFailedError, 'rebind'):
+      self.client.forward('serial1', 'tcp:5000', 'tcp:81', no_rebind=True)
+    self.assertEqual(
+        self.client.list_forward('serial1'),
+        b'serial1 tcp:40001 tcp:8080\nserial1 tcp:5000 tcp:80\n',
+    )
+
+    self.client.kill_forward('serial1', 'tcp:5000')
+    self.assertEqual(
+        self.client.list_forward('serial1'), b'serial1 tcp:40001 tcp:8080\n'
+    )
+    self.client.kill_forward('serial1')
+    self.assertEqual(self.client.list_forward('serial1'), b'')
+
+  def test_push_and_pull(self):
+    local_path = os.path.join(self.tmp_dir, 'data.bin')
+    with open(local_path, 'wb') as f:
+      f.write(b'\x00binary content\xff')
+    os.utime(local_path, (1700000000, 1700000000))
+
+    self.client.push('serial1', local_path, '/sdcard')
+    self.assertEqual(
+        self.device.files['/sdcard/data.bin'], b'\x00binary content\xff'
+    )
+    self.assertEqual(self.device.mtimes['/sdcard/data.bin'], 1700000000)
+    self.client.pull('serial1', '/sdcard/data.bin', self.tmp_dir + '/copy')
+    with open(os.path.join(self.tmp_dir, 'copy'), 'rb') as f:
+      self.assertEqual(f.read(), b'\x00binary content\xff')
+    with self.assertRaisesRegex(adb_socket.RequestFailedError, 'not exist'):
+      self.client.pull('serial1', '/sdcard/missing', self.tmp_dir)
+
+  def test_failed_pull_keeps_the_local_file(self):
+    local_path = os.path.join(self.tmp_dir, 'missing')
+    with open(local_path, 'wb') as f:
+      f.write(b'old content')
+
+    with self.assertRaises(adb_socket.RequestFailedError):
+      self.client.pull('serial1', '/sdcard/missing', local_path)
+    with open(local_path, 'rb') as f:
+      self.assertEqual(f.read(), b'old content')
+    self.assertEqual(os.listdir(self.tmp_dir), ['missing'])
+
+  def test_pull_directory_is_not_supported(self):
+    self.assertIsNone(self.client.pull('serial1', '/sdcard', self.tmp_dir))
+    self.assertEqual(os.listdir(self.tmp_dir), [])
+
+  def test_timeout(self):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    self.addCleanup(listener.close)
+    client = adb_socket.AdbSocketClient(listener.getsockname())
+
+    start = time.monotonic()
+    with self.assertRaises(TimeoutError):
+      client.exec_out('serial1', 'sleep 10', timeout=0.2)
+    self.assertLess(time.monotonic() - start, 5)
+
+  def test_server_unavailable(self):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    address = listener.getsockname()
+    listener.close()
+
+    with self.assertRaises(adb_socket.ServerUnavailableError):
+      adb_socket.AdbSocketClient(address).devices()
+
+  @mock.patch('mobly.utils.run_command')
+  def test_proxy_runs_supported_commands_over_the_socket(self, run_command):
+    self.device.shell_handler = lambda command: (0, command.encode(), b'')
+    proxy = self._make_proxy()
+
+    self.assertEqual(proxy.shell(['echo', 'a b']), b'echo a b')
+    self.assertEqual(proxy.shell('getprop x'), b'getprop x')
+    self.assertEqual(proxy.exec_out(['cat', 'f']), b'cat f')
+    self.assertEqual(proxy.forward(['tcp:0', 'tcp:80']), b'40001\n')
+    self.assertEqual(
+        self._make_proxy('').devices(),
+        b'List of devices attached\nserial1\tdevice\n\n',
+    )
+    run_command.assert_not_called()
+
+  @mock.patch('mobly.utils.run_command')
+  def test_proxy_raises_adb_errors(self, run_command):
+    self.device.shell_handler = lambda command: (2, b'out', b'bad')
+    proxy = self._make_proxy()
+    stderr = io.BytesIO()
+
+    with self.assertRaisesRegex(adb.AdbError, 'ret: 2') as context:
+      proxy.shell(['false'], stderr=stderr)
+    self.assertEqual(
+        context.exception.cmd, ['adb', '-s', 'serial1', 'shell', 'false']
+    )
+    self.assertEqual(context.exception.serial, 'serial1')
+    self.assertEqual(stderr.getvalue(), b'bad')
+    with self.assertRaisesRegex(adb.AdbError, "device 'missing' not found"):
+      self._make_proxy('missing').shell(['id'])
+    run_command.assert_not_called()
+
+  @mock.patch('mobly.utils.run_command')
+  def test_proxy_falls_back_to_adb_binary(self, run_command):
+    run_command.return_value = (0, b'binary', b'')
+    proxy = self._make_proxy()
+
+    # Not supported over the socket.
+    self.assertEqual(proxy.install(['-r', 'app.apk']), b'binary')
+    self.assertEqual(proxy.shell('ls > f', shell=True), b'binary')
+    # Directories are pulled by the binary.
+    self.assertEqual(proxy.pull(['/sdcard', self.tmp_dir]), b'binary')
+    self.assertEqual(
+        run_command.call_args_list[-1][0][0],
+        ['adb', '-s', 'serial1', 'pull', '/sdcard', self.tmp_dir],
+    )
+    # The adb server is not reachable.
+    self.server.stop()
+    self.assertEqual(proxy.shell(['id']), b'binary')
+    self.assertEqual(
+        run_command.call_args_list[-1][0][0],
+        ['adb', '-s', 'serial1', 'shell', 'id'],
+    )
+
+  @mock.patch('logging.debug')
+  @mock.patch('mobly.utils.run_command')
+  def test_proxy_logs_only_commands_run_over_the_socket(
+      self, run_command, mock_debug_logger
+  ):
+    run_command.return_value = (0, b'binary', b'')
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    self.addCleanup(listener.close)
+    proxy = self._make_proxy()
+    proxy._socket_client = adb_socket.AdbSocketClient(listener.getsockname())
+
+    with self.assertRaises(adb.AdbTimeoutError):
+      proxy.shell(['sleep', '10'], timeout=0.2)
+    listener.close()
+    self.assertEqual(proxy.shell(['id']), b'binary')
+    # Neither command ran over the socket, so no exit code is logged.
+    self.assertNotIn(
+        'cmd: %s, stdout: %s, stderr: %s, ret: %s',
+        [call[0][0] for call in mock_debug_logger.call_args_list],
+    )
+
+  def test_proxy_uses_the_binary_by_default(self):
+    self.assertIsNone(adb.AdbProxy('serial1')._socket_client)
+    with mock.patch.object(adb, 'USE_SERVER_PROTOCOL', True):
+      self.assertIsNotNone(adb.AdbProxy('serial1')._socket_client)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,11 +16,13 @@ import collections
 import copy
 import io
 import pickle
+import platform
 import subprocess
 import unittest
 from unittest import mock
 
 from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import adb_metrics
 
 # Mock parameters for instrumentation.
 MOCK_INSTRUMENTATION_PACKAGE = 'com.my.instrumentation.tests'
@@ -964,6 +966,97 @@ class AdbTest(unittest.TestCase):
       )
       self.assertFalse(adb.AdbProxy().has_shell_command(MOCK_SHELL_COMMAND))
 
+  def _run_batch_locally(self, commands, redirect=''):
+    """Runs `shell_batch` with its script run by the local shell."""
+
+    def run_command(args, shell, timeout):
+      del shell, timeout  # Unused params.
+      proc = subprocess.run(
+          ['sh', '-c', '{\n%s\n}%s' % (args[2], redirect)],
+          capture_output=True,
+          check=False,
+      )
+      return proc.returncode, proc.stdout, proc.stderr
+
+    with mock.patch('mobly.utils.run_command', side_effect=run_command):
+      return adb.AdbProxy().shell_batch(commands)
+
+  @unittest.skipIf(
+      platform.system() == 'Windows', 'Runs the batch in a POSIX shell.'
+  )
+  def test_shell_batch(self):
+    results = self._run_batch_locally(
+        ['echo a', 'printf b; echo err >&2; exit 3', "echo 'c  d'", 'cat']
+    )
+
+    self.assertEqual(
+        results,
+        [
+            adb.ShellResult(stdout=b'a\n', stderr=b'', ret_code=0),
+            adb.ShellResult(stdout=b'b', stderr=b'err\n', ret_code=3),
+            adb.ShellResult(stdout=b'c  d\n', stderr=b'', ret_code=0),
+            adb.ShellResult(stdout=b'', stderr=b'', ret_code=0),
+        ],
+    )
+
+  @unittest.skipIf(
+      platform.system() == 'Windows', 'Runs the batch in a POSIX shell.'
+  )
+  def test_shell_batch_with_stderr_in_stdout(self):
+    results = self._run_batch_locally(
+        ['echo a; echo err >&2', 'exit 1'], redirect=' 2>&1'
+    )
+
+    self.assertEqual(
+        results,
+        [
+            adb.ShellResult(stdout=b'a\nerr\n', stderr=b'', ret_code=0),
+            adb.ShellResult(stdout=b'', stderr=b'', ret_code=1),
+        ],
+    )
+
+  @mock.patch.object(adb.AdbProxy, '_exec_cmd')
+  def test_shell_batch_with_missing_results(self, mock_exec_cmd):
+    mock_exec_cmd.return_value = b'partial output'
+
+    with self.assertRaisesRegex(adb.AdbError, 'ret: 255'):
+      adb.AdbProxy().shell_batch(['echo a'])
+    self.assertEqual(adb.AdbProxy().shell_batch([]), [])
+    mock_exec_cmd.assert_called_once()
+
+  @mock.patch('mobly.utils.run_command')
+  def test_exec_cmd_records_metrics(self, mock_run_command):
+    metrics = adb_metrics.get_metrics()
+    metrics.reset()
+    self.addCleanup(metrics.reset)
+    metrics.enable('serial')
+    self.addCleanup(metrics.disable, 'serial')
+    mock_run_command.side_effect = [
+        (0, b'out', b''),
+        (1, b'', b'error'),
+        subprocess.TimeoutExpired(cmd='adb', timeout=1),
+    ]
+    proxy = adb.AdbProxy('serial')
+
+    proxy.shell(['getprop', 'ro.x'])
+    with self.assertRaises(adb.AdbError):
+      proxy.shell('getprop ro.y')
+    with self.assertRaises(adb.AdbTimeoutError):
+      proxy.install(['a.apk'], timeout=1)
+
+    stats = metrics.take('serial')
+    self.assertEqual(list(stats), ['shell getprop', 'install'])
+    self.assertEqual(stats['shell getprop'].calls, 2)
+    self.assertEqual(stats['shell getprop'].errors, 1)
+    self.assertEqual(stats['shell getprop'].exit_codes, {0: 1, 1: 1})
+    self.assertEqual(stats['shell getprop'].bytes_received, 8)
+    self.assertEqual(
+        stats['shell getprop'].bytes_sent,
+        2 * len('adb -s serial shell getprop ro.x'),
+    )
+    self.assertEqual(stats['install'].timeouts, 1)
+    self.assertEqual(stats['install'].exit_codes, {})
+
   @mock.patch.object(adb.AdbProxy, 'getprop')
   @mock.patch.object(adb.AdbProxy, '_exec_cmd')
   def test_current_user_id_25_and_above(self, mock_exec_cmd, mock_getprop):
@@ -978,6 +1071,20 @@ class AdbTest(unittest.TestCase):
     )
     self.assertEqual(user_id, 123)
 
+  @mock.patch.object(adb.AdbProxy, 'getprop')
+  @mock.patch.object(adb.AdbProxy, '_exec_cmd')
+  def test_current_user_id_is_cached(self, mock_exec_cmd, mock_getprop):
+    mock_getprop.return_value = b'25'
+    mock_exec_cmd.return_value = b'10'
+    proxy = adb.AdbProxy()
+
+    self.assertEqual(proxy.current_user_id, 10)
+    mock_exec_cmd.return_value = b'11'
+    self.assertEqual(proxy.current_user_id, 10)
+    proxy.clear_state_cache()
+    self.assertEqual(proxy.current_user_id, 11)
+    self.assertEqual(mock_exec_cmd.call_count, 2)
+
   @mock.patch.object(adb.AdbProxy, 'getprop')
   @mock.patch.object(adb.AdbProxy, '_exec_cmd')
   def test_current_user_id_between_21_and_24(self, mock_exec_cmd, mock_getprop):
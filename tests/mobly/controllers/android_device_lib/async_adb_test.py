@@ -0,0 +1,131 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import io
+import os
+import platform
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import async_adb
+
+# Stands in for the adb binary: runs `adb -s <serial> shell <command>` with the
+# local shell, and echoes other commands.
+_FAKE_ADB = """#!/bin/sh
+if [ "$1" = "-s" ]; then
+  shift 2
+fi
+name=$1
+shift
+if [ "$name" = "shell" ]; then
+  exec sh -c "$*"
+fi
+echo "$name $*"
+"""
+
+
+@unittest.skipIf(
+    platform.system() == 'Windows', 'The fake adb binary is a shell script.'
+)
+class AsyncAdbProxyTest(unittest.IsolatedAsyncioTestCase):
+  """Unit tests for the async_adb module, with a fake adb binary."""
+
+  def setUp(self):
+    tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmp_dir)
+    fake_adb = os.path.join(tmp_dir, 'adb')
+    with open(fake_adb, 'w') as f:
+      f.write(_FAKE_ADB)
+    os.chmod(fake_adb, os.stat(fake_adb).st_mode | stat.S_IEXEC)
+    patcher = mock.patch.object(adb, 'ADB', fake_adb)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.proxy = async_adb.AsyncAdbProxy('serial1')
+
+  async def test_commands(self):
+    self.assertEqual(await self.proxy.shell(['echo', 'a']), b'a\n')
+    self.assertEqual(
+        await self.proxy.push(['f', '/sdcard/']), b'push f /sdcard/\n'
+    )
+    self.assertEqual(
+        await self.proxy.install(['-r', 'app.apk']), b'install -r app.apk\n'
+    )
+    self.assertEqual(
+        await self.proxy.forward(['tcp:1', 'tcp:2']), b'forward tcp:1 tcp:2\n'
+    )
+    self.assertTrue(await self.proxy.has_shell_command('sh'))
+    self.assertFalse(adb.ADB_PORT_LOCK.locked())
+
+  async def test_getprops(self):
+    self.proxy.shell = mock.AsyncMock(
+        return_value=b'[ro.a]: [1]\n[ro.b]: [x y]\n[ro.c]: [3]\n'
+    )
+
+    self.assertEqual(
+        await self.proxy.getprops(['ro.a', 'ro.b', 'ro.missing']),
+        {'ro.a': '1', 'ro.b': 'x y'},
+    )
+    self.proxy.shell.return_value = b'value\n'
+    self.assertEqual(await self.proxy.getprop('ro.a'), 'value')
+    self.proxy.shell.assert_awaited_with(
+        ['getprop', 'ro.a'], timeout=adb.DEFAULT_GETPROP_TIMEOUT_SEC
+    )
+
+  async def test_error(self):
+    stderr = io.BytesIO()
+
+    with self.assertRaisesRegex(adb.AdbError, 'ret: 3') as context:
+      await self.proxy.shell('echo out; echo err >&2; exit 3', stderr=stderr)
+    self.assertEqual(context.exception.stdout, b'out\n')
+    self.assertEqual(context.exception.stderr, b'err\n')
+    self.assertEqual(context.exception.serial, 'serial1')
+    self.assertEqual(stderr.getvalue(), b'err\n')
+
+  async def test_timeout(self):
+    start = time.monotonic()
+    with self.assertRaises(adb.AdbTimeoutError) as context:
+      await self.proxy.shell(['exec', 'sleep', '10'], timeout=0.2)
+    self.assertLess(time.monotonic() - start, 5)
+    self.assertEqual(context.exception.timeout, 0.2)
+    self.assertEqual(context.exception.cmd[-2:], ['sleep', '10'])
+
+  async def test_gather(self):
+    proxies = [async_adb.AsyncAdbProxy(f'serial{i}') for i in range(10)]
+
+    start = time.monotonic()
+    outputs = await asyncio.gather(
+        *(
+            proxy.shell(['sleep 0.5; echo', str(i)])
+            for i, proxy in enumerate(proxies)
+        )
+    )
+    self.assertEqual(outputs, [b'%d\n' % i for i in range(10)])
+    self.assertLess(time.monotonic() - start, 4)
+
+  async def test_forward_waits_for_the_port_lock(self):
+    with adb.ADB_PORT_LOCK:
+      forward = asyncio.ensure_future(self.proxy.forward(['--list']))
+      await asyncio.sleep(0.1)
+      self.assertFalse(forward.done())
+    self.assertEqual(await forward, b'forward --list\n')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from mobly.controllers import android_device
+from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import adb_socket
+from mobly.controllers.android_device_lib import device_tracker
+from tests.lib import fake_adb_server
+
+
+class DeviceTrackerTest(unittest.TestCase):
+  """Unit tests for the device_tracker module, with a fake adb server."""
+
+  def setUp(self):
+    self.server = fake_adb_server.FakeAdbServer()
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    self.server.add_device('serial1')
+    self.client = adb_socket.AdbSocketClient(self.server.address)
+
+  def _start_tracker(self):
+    tracker = device_tracker.DeviceTracker(self.client)
+    self.assertTrue(tracker.start())
+    self.addCleanup(tracker.stop)
+    return tracker
+
+  def _set_state_later(self, serial, state, delay=0.1):
+    def set_state():
+      time.sleep(delay)
+      if state is None:
+        del self.server.devices[serial]
+      elif serial in self.server.devices:
+        self.server.devices[serial].state = state
+      else:
+        self.server.devices[serial] = fake_adb_server.FakeDevice(state)
+      self.server.notify_changed()
+
+    thread = threading.Thread(target=set_state)
+    thread.start()
+    self.addCleanup(thread.join)
+
+  def test_track_devices_stream(self):
+    with self.client.track_devices() as stream:
+      self.assertEqual(stream.read(), {'serial1': 'device'})
+      self.server.add_device('serial2', state='unauthorized')
+      self.assertEqual(
+          stream.read(), {'serial1': 'device', 'serial2': 'unauthorized'}
+      )
+
+  def test_tracker_follows_changes(self):
+    tracker = self._start_tracker()
+    self.assertEqual(tracker.devices, {'serial1': 'device'})
+
+    self._set_state_later('serial2', 'offline')
+    self.assertTrue(tracker.wait_for_change('serial2', timeout=5))
+    self.assertEqual(tracker.get_state('serial2'), 'offline')
+    self._set_state_later('serial2', 'device')
+    self.assertTrue(tracker.wait_for_state('serial2', timeout=5))
+    self._set_state_later('serial1', None)
+    self.assertTrue(tracker.wait_for_state('serial1', [None], timeout=5))
+    self.assertEqual(tracker.devices, {'serial2': 'device'})
+
+  def test_wait_for_state_times_out(self):
+    tracker = self._start_tracker()
+
+    start = time.monotonic()
+    self.assertFalse(tracker.wait_for_state('serial2', timeout=0.1))
+    self.assertFalse(tracker.wait_for_change('serial1', timeout=0.1))
+    self.assertLess(time.monotonic() - start, 5)
+
+  def test_tracker_loses_the_server(self):
+    tracker = self._start_tracker()
+
+    self.server.stop()
+    for _ in range(500):
+      if not tracker.is_tracking:
+        break
+      time.sleep(0.01)
+    self.assertFalse(tracker.is_tracking)
+    tracker.stop()
+
+  def test_android_device_uses_the_tracker(self):
+    tracker = self._start_tracker()
+    self.server.add_device('serial2', state='offline')
+    self.assertTrue(tracker.wait_for_state('serial2', ['offline'], timeout=5))
+    ad = mock.Mock(serial='serial2', adb=mock.Mock(spec=[]))
+
+    with (
+        mock.patch.object(android_device, 'USE_DEVICE_TRACKER', True),
+        mock.patch.object(device_tracker, 'get_tracker', return_value=tracker),
+    ):
+      self.assertEqual(android_device.list_adb_devices(), ['serial1'])
+      android_device._validate_device_existence(['serial1'])
+      with self.assertRaises(adb.AdbTimeoutError):
+        android_device.AndroidDevice._wait_for_device(ad, timeout=0.1)
+      self._set_state_later('serial2', 'device')
+      android_device.AndroidDevice._wait_for_device(ad, timeout=5)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,207 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import calendar
+import struct
+import unittest
+
+from mobly.controllers.android_device_lib import logcat_binary
+from mobly.controllers.android_device_lib import logcat_processor
+
+# 2026-08-09 22:00:05 UTC.
+_SEC = calendar.timegm((2026, 8, 9, 22, 0, 5))
+
+
+def make_entry(
+    tag,
+    message,
+    priority=4,
+    pid=1000,
+    tid=1010,
+    sec=_SEC,
+    nsec=150000000,
+    lid=0,
+    version=4,
+):
+  """Creates a binary logcat entry like `logcat -B` prints it."""
+  payload = bytes([priority]) + tag + b'\0' + message + b'\0'
+  if version == 1:
+    header = struct.pack('<HHiIII', len(payload), 0, pid, tid, sec, nsec)
+  else:
+    header = struct.pack(
+        '<HHiIIIII', len(payload), 28, pid, tid, sec, nsec, lid, 0
+    )
+  return header + payload
+
+
+class LogcatBinaryTest(unittest.TestCase):
+  """Unit tests for the logcat_binary module."""
+
+  def test_decode_v4_entry(self):
+    decoder = logcat_binary.BinaryLogcatDecoder()
+
+    entries = decoder.decode(
+        make_entry(b'WifiService', b'Connected', priority=6, lid=3)
+    )
+
+    self.assertEqual(
+        entries,
+        [
+            logcat_binary.LogEntry(
+                pid=1000,
+                tid=1010,
+                sec=_SEC,
+                nsec=150000000,
+                lid=3,
+                level='E',
+                tag=b'WifiService',
+                message=b'Connected',
+            )
+        ],
+    )
+
+  def test_decode_v1_entry(self):
+    decoder = logcat_binary.BinaryLogcatDecoder()
+
+    (entry,) = decoder.decode(make_entry(b'Tag', b'Old device', version=1))
+
+    self.assertIsNone(entry.lid)
+    self.assertEqual((entry.tag, entry.message), (b'Tag', b'Old device'))
+
+  def test_decode_entries_split_across_chunks(self):
+    data = b''.join(
+        make_entry(b'Tag', b'Message %d' % i, nsec=i) for i in range(5)
+    )
+    decoder = logcat_binary.BinaryLogcatDecoder()
+
+    entries = []
+    for i in range(0, len(data), 7):
+      entries.extend(decoder.decode(data[i : i + 7]))
+
+    self.assertEqual(
+        [entry.message for entry in entries],
+        [b'Message %d' % i for i in range(5)],
+    )
+
+  def test_decode_skips_binary_buffers(self):
+    decoder = logcat_binary.BinaryLogcatDecoder()
+
+    entries = decoder.decode(
+        make_entry(b'\x01\x02', b'\x03', lid=2) + make_entry(b'Tag', b'Text')
+    )
+
+    self.assertEqual([entry.message for entry in entries], [b'Text'])
+
+  def test_decode_skips_unknown_priorities(self):
+    decoder = logcat_binary.BinaryLogcatDecoder()
+    data = (
+        make_entry(b'Tag', b'Unknown', priority=0)
+        + make_entry(b'Tag', b'Text')
+        + make_entry(b'Tag', b'Default', priority=1)
+    )
+
+    self.assertEqual(
+        [entry.message for entry in decoder.decode(data)], [b'Text']
+    )
+    self.assertEqual(
+        [line.raw for line in decoder.feed_lines(data)],
+        [line.decode('utf-8') for line in decoder.feed(data).splitlines()],
+    )
+
+  def test_decode_skips_corrupt_data(self):
+    decoder = logcat_binary.BinaryLogcatDecoder()
+
+    with self.assertLogs(level='ERROR') as logs:
+      entries = decoder.decode(
+          make_entry(b'Tag', b'Before')
+          + struct.pack('<HH', 10, 8)
+          + b'\0' * 30
+      )
+    entries += decoder.decode(make_entry(b'Tag', b'After'))
+
+    self.assertIn('header size 8', logs.output[0])
+    self.assertEqual(
+        [entry.message for entry in entries], [b'Before', b'After']
+    )
+
+  def test_feed_formats_threadtime_lines(self):
+    decoder = logcat_binary.BinaryLogcatDecoder(utc_offset_sec=2 * 3600)
+
+    text = decoder.feed(
+        make_entry(b'BtGatt', b'First line\nSecond line\n', priority=5)
+        + make_entry(b'ActivityManager', b'Started', pid=2050, tid=2060)
+    )
+
+    self.assertEqual(
+        text,
+        b'08-10 00:00:05.150  1000  1010 W BtGatt  : First line\n'
+        b'08-10 00:00:05.150  1000  1010 W BtGatt  : Second line\n'
+        b'08-10 00:00:05.150  2050  2060 I ActivityManager: Started\n',
+    )
+    lines = [
+        logcat_processor.LogLine.from_string(line)
+        for line in text.decode('utf-8').splitlines()
+    ]
+    self.assertEqual(
+        [(line.pid, line.tid, line.level, line.tag) for line in lines],
+        [
+            (1000, 1010, 'W', 'BtGatt'),
+            (1000, 1010, 'W', 'BtGatt'),
+            (2050, 2060, 'I', 'ActivityManager'),
+        ],
+    )
+    self.assertEqual(lines[1].message, 'Second line')
+
+  def test_feed_lines_keeps_columns(self):
+    decoder = logcat_binary.BinaryLogcatDecoder()
+    data = make_entry(b'BtGatt', b'One\nTwo', priority=5) + make_entry(
+        'Überwachung'.encode('utf-8'), b'Started', pid=2050, tid=2060
+    )
+
+    lines = decoder.feed_lines(data)
+
+    self.assertEqual(
+        b''.join(line.data for line in lines),
+        logcat_binary.BinaryLogcatDecoder().feed(data),
+    )
+    for line in lines:
+      parsed = logcat_processor.LogLine.from_string(line.raw)
+      self.assertEqual(
+          (
+              line.raw[: line.timestamp_end],
+              line.pid,
+              line.tid,
+              line.level,
+              line.tag,
+              line.raw[line.message_start :],
+          ),
+          (
+              parsed.timestamp,
+              parsed.pid,
+              parsed.tid,
+              parsed.level,
+              parsed.tag,
+              parsed.message,
+          ),
+      )
+
+  def test_parse_utc_offset(self):
+    self.assertEqual(logcat_binary.parse_utc_offset('+0200\n'), 7200)
+    self.assertEqual(logcat_binary.parse_utc_offset('-05:30'), -19800)
+    with self.assertRaises(ValueError):
+      logcat_binary.parse_utc_offset('UTC')
+
+
+if __name__ == '__main__':
+  unittest.main()
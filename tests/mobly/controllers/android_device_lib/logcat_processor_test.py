@@ -0,0 +1,1502 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextlib
+import dataclasses
+import os
+import pickle
+import platform
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import logcat_binary
+from mobly.controllers.android_device_lib import logcat_processor
+
+
+def _make_line(second, message, tag='TestTag', level='I', year=''):
+  """Creates a threadtime line logged at 08-09 22:00:<second>.000."""
+  prefix = f'{year}-' if year else ''
+  return (
+      f'{prefix}08-09 22:00:{second:02d}.000  1000  1010 {level} {tag}:'
+      f' {message}\n'
+  )
+
+
+def _wait_until(predicate, timeout=10):
+  """Polls `predicate` until it is true, returns whether it became true."""
+  deadline = time.perf_counter() + timeout
+  while not predicate():
+    if time.perf_counter() > deadline:
+      return False
+    time.sleep(0.01)
+  return True
+
+
+class LogcatProcessorTest(unittest.TestCase):
+  """Unit tests for the logcat_processor module."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.log_file = os.path.join(self.tmp_dir, 'logcat.txt')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _write_log(self, text, mode='w'):
+    with open(self.log_file, mode, encoding='utf-8', newline='') as f:
+      f.write(text)
+
+  def test_timestamp_index_find_offset_skips_older_lines(self):
+    lines = [_make_line(i, f'message {i}') for i in range(60)]
+    self._write_log(''.join(lines))
+    index = logcat_processor._TimestampIndex(self.log_file, interval=256)
+
+    offset = index.find_offset('08-09 22:00:40.000')
+
+    line_offsets = [sum(len(l) for l in lines[:i]) for i in range(60)]
+    self.assertIn(offset, line_offsets)
+    self.assertGreater(offset, 0)
+    self.assertLessEqual(offset, line_offsets[40])
+    self.assertLess(line_offsets[40] - offset, 256 + len(lines[0]))
+
+  def test_timestamp_index_tolerates_out_of_order_lines(self):
+    lines = [_make_line(i, f'message {i}') for i in range(40)]
+    # A late line from another buffer carries an older timestamp.
+    lines.insert(30, _make_line(5, 'late line'))
+    self._write_log(''.join(lines))
+    index = logcat_processor._TimestampIndex(self.log_file, interval=64)
+
+    offset = index.find_offset('08-09 22:00:05.000')
+
+    self.assertLessEqual(offset, sum(len(l) for l in lines[:5]))
+
+  def test_timestamp_index_is_extended_incrementally(self):
+    self._write_log(''.join(_make_line(i, 'first') for i in range(10)))
+    index = logcat_processor._TimestampIndex(self.log_file, interval=64)
+    index.update()
+    first_size = os.path.getsize(self.log_file)
+    self.assertEqual(index.indexed_offset, first_size)
+
+    self._write_log(
+        ''.join(_make_line(i, 'second') for i in range(10, 20)), mode='a'
+    )
+
+    self.assertEqual(index.find_offset('08-09 22:00:10.000'), first_size)
+    self.assertEqual(index.indexed_offset, os.path.getsize(self.log_file))
+
+  def test_timestamp_index_ignores_partial_last_line(self):
+    self._write_log(_make_line(1, 'complete') + '08-09 22:00:0')
+    index = logcat_processor._TimestampIndex(self.log_file)
+    index.update()
+    self.assertEqual(index.indexed_offset, len(_make_line(1, 'complete')))
+
+  def test_timestamp_index_resets_after_truncation(self):
+    self._write_log(''.join(_make_line(i, 'old') for i in range(30)))
+    index = logcat_processor._TimestampIndex(self.log_file, interval=64)
+    index.update()
+
+    self._write_log(_make_line(50, 'new'))
+
+    self.assertEqual(index.find_offset('08-09 22:00:50.000'), 0)
+
+  def test_timestamp_index_compares_dated_and_undated_lines(self):
+    lines = [_make_line(i, 'dated', year='2026') for i in range(20)]
+    lines += [_make_line(i, 'undated') for i in range(20, 40)]
+    self._write_log(''.join(lines))
+    index = logcat_processor._TimestampIndex(self.log_file, interval=64)
+
+    dated_offset = index.find_offset('2026-08-09 22:00:25.000')
+    undated_offset = index.find_offset('08-09 22:00:10.000')
+
+    self.assertLessEqual(dated_offset, sum(len(l) for l in lines[:25]))
+    self.assertGreater(dated_offset, sum(len(l) for l in lines[:20]))
+    self.assertLessEqual(undated_offset, sum(len(l) for l in lines[:10]))
+
+  def test_get_lines_since_timestamp_only_position(self):
+    self._write_log(''.join(_make_line(i, f'message {i}') for i in range(60)))
+    processor = logcat_processor.LogcatProcessor(
+        self.log_file, index_interval_bytes=128
+    )
+    since = logcat_processor.LogcatPosition(timestamp='08-09 22:00:45.000')
+
+    lines = processor.get_lines(pattern='message', since=since)
+
+    self.assertEqual(
+        [line.message for line in lines],
+        [f'message {i}' for i in range(45, 60)],
+    )
+
+  def test_wait_for_stops_catching_up_at_match(self):
+    self._write_log(
+        _make_line(0, 'first')
+        + ''.join(_make_line(i % 60, f'message {i}') for i in range(20000))
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with mock.patch.object(
+        logcat_processor.LogLine,
+        'from_string',
+        wraps=logcat_processor.LogLine.from_string,
+    ) as from_string:
+      lines = processor.wait_for(
+          ['first'],
+          timeout_sec=10,
+          since=logcat_processor.LogcatPosition(_byte_offset=0),
+      )
+
+    self.assertEqual(lines[0].message, 'first')
+    self.assertLess(from_string.call_count, 10)
+
+  def test_wait_for_timeout_during_catch_up(self):
+    self._write_log(
+        ''.join(_make_line(i % 60, f'message {i}') for i in range(300000))
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    start = time.monotonic()
+    with self.assertRaises(TimeoutError):
+      processor.wait_for(
+          ['NEVER'],
+          timeout_sec=0.2,
+          since=logcat_processor.LogcatPosition(_byte_offset=0),
+      )
+
+    self.assertLess(time.monotonic() - start, 1.5)
+    self.assertFalse(processor._reader._subscriptions)
+
+  def test_wait_for_since_timestamp_only_position(self):
+    self._write_log(''.join(_make_line(i, f'message {i}') for i in range(60)))
+    processor = logcat_processor.LogcatProcessor(
+        self.log_file, index_interval_bytes=128
+    )
+    since = logcat_processor.LogcatPosition(timestamp='08-09 22:00:45.000')
+
+    lines = processor.wait_for(
+        [r'message 5\d', r'message \d+'],
+        in_order=False,
+        since=since,
+        timeout_sec=1,
+    )
+
+    self.assertEqual(
+        [line.message for line in lines], ['message 50', 'message 45']
+    )
+
+  def test_file_tailer_waits_for_partial_line_to_complete(self):
+    self._write_log(_make_line(1, 'first') + '08-09 22:00:02.000  1000')
+    with logcat_processor._FileTailer(self.log_file) as tailer:
+      lines = [line.message for _, line in tailer.read_lines()]
+      self.assertEqual(lines, ['first'])
+      self.assertEqual(tailer.offset, len(_make_line(1, 'first')))
+
+      self._write_log('  1010 I TestTag: second\n', mode='a')
+
+      lines = [line.message for _, line in tailer.read_lines()]
+      self.assertEqual(lines, ['second'])
+      self.assertEqual(tailer.offset, os.path.getsize(self.log_file))
+
+  def test_file_tailer_resumes_after_early_stop(self):
+    self._write_log(''.join(_make_line(i, f'message {i}') for i in range(5)))
+    with logcat_processor._FileTailer(self.log_file) as tailer:
+      for _, line in tailer.read_lines():
+        if line.message == 'message 1':
+          break
+      lines = [line.message for _, line in tailer.read_lines()]
+    self.assertEqual(lines, ['message 2', 'message 3', 'message 4'])
+
+  def test_file_tailer_follows_truncated_file(self):
+    self._write_log(''.join(_make_line(i, 'old') for i in range(5)))
+    with logcat_processor._FileTailer(self.log_file) as tailer:
+      list(tailer.read_lines())
+      self._write_log(_make_line(9, 'new'))
+      lines = [line.message for _, line in tailer.read_lines()]
+    self.assertEqual(lines, ['new'])
+
+  def test_file_tailer_waits_for_file_creation(self):
+    with logcat_processor._FileTailer(self.log_file) as tailer:
+      self.assertEqual(list(tailer.read_lines()), [])
+      self._write_log(_make_line(1, 'created'))
+      lines = [line.message for _, line in tailer.read_lines()]
+    self.assertEqual(lines, ['created'])
+
+  def test_file_tailer_interrupt_wakes_up_wait(self):
+    self._write_log('')
+    with logcat_processor._FileTailer(self.log_file) as tailer:
+      list(tailer.read_lines())
+      threading.Timer(0.1, tailer.interrupt).start()
+      start = time.perf_counter()
+      tailer.wait(timeout=30)
+      self.assertLess(time.perf_counter() - start, 5)
+      # Once interrupted, later waits return immediately.
+      tailer.wait(timeout=30)
+
+  @unittest.skipUnless(platform.system() == 'Linux', 'Requires inotify.')
+  def test_inotify_watcher_wakes_up_on_append(self):
+    self._write_log('')
+    watcher = logcat_processor._InotifyWatcher.create(self.log_file)
+    self.assertIsNotNone(watcher)
+    try:
+      threading.Timer(
+          0.1, self._write_log, args=(_make_line(1, 'new'), 'a')
+      ).start()
+      start = time.perf_counter()
+      watcher.wait(timeout=30)
+      self.assertLess(time.perf_counter() - start, 5)
+    finally:
+      watcher.close()
+
+  def test_wait_for_line_appended_while_waiting(self):
+    self._write_log(_make_line(1, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    since = logcat_processor.LogcatPosition.from_file(self.log_file)
+    threading.Timer(
+        0.1, self._write_log, args=(_make_line(2, 'late event'), 'a')
+    ).start()
+
+    lines = processor.wait_for(['event'], since=since, timeout_sec=10)
+
+    self.assertEqual([line.message for line in lines], ['late event'])
+
+  def test_reader_parses_each_line_once_for_all_listeners(self):
+    self._write_log(_make_line(1, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    with processor.listen(tag='TestTag') as listener1:
+      with processor.listen(pattern='new') as listener2:
+        with mock.patch.object(
+            logcat_processor.LogLine,
+            'from_string',
+            wraps=logcat_processor.LogLine.from_string,
+        ) as from_string:
+          self._write_log(_make_line(2, 'new line'), mode='a')
+          event1 = listener1.get_next_event(timeout=10)
+          event2 = listener2.get_next_event(timeout=10)
+    self.assertEqual(event1.message, 'new line')
+    self.assertIs(event1, event2)
+    from_string.assert_called_once()
+
+  def test_listener_overwrite_policy_drops_oldest_events(self):
+    self._write_log(_make_line(0, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    with processor.listen(pattern='event', max_events=3) as listener:
+      self._write_log(
+          ''.join(_make_line(i, f'event {i}') for i in range(1, 6))
+          + _make_line(6, 'other'),
+          mode='a',
+      )
+      self.assertTrue(_wait_until(lambda: listener.stats.dispatched == 6))
+
+      self.assertEqual(
+          [listener.get_next_event(timeout=1).message for _ in range(3)],
+          ['event 3', 'event 4', 'event 5'],
+      )
+      self.assertEqual(
+          listener.stats,
+          logcat_processor.LogcatListenerStats(
+              dispatched=6, matched=5, dropped=2, max_backlog=3
+          ),
+      )
+
+  def test_listener_block_policy_holds_back_events(self):
+    self._write_log(_make_line(0, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    with processor.listen(
+        pattern='event',
+        max_events=2,
+        overflow_policy=logcat_processor.OverflowPolicy.BLOCK,
+    ) as listener:
+      self._write_log(
+          ''.join(_make_line(i, f'event {i}') for i in range(1, 8)), mode='a'
+      )
+      self.assertTrue(_wait_until(lambda: listener.stats.max_backlog == 2))
+      time.sleep(0.1)
+      self.assertEqual(listener.stats.dispatched, 2)
+
+      messages = [listener.get_next_event(timeout=10).message for _ in range(7)]
+
+      self.assertEqual(messages, [f'event {i}' for i in range(1, 8)])
+      self.assertEqual(
+          listener.stats,
+          logcat_processor.LogcatListenerStats(
+              dispatched=7, matched=7, dropped=0, max_backlog=2
+          ),
+      )
+      # Once caught up, the listener receives new events from the reader.
+      self._write_log(_make_line(8, 'event 8'), mode='a')
+      self.assertEqual(listener.get_next_event(timeout=10).message, 'event 8')
+
+  @mock.patch.object(logcat_processor, '_LISTENER_RESUME_MAX_LINES', 10)
+  def test_listener_block_policy_resumes_in_bounded_steps(self):
+    self._write_log(_make_line(0, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    with processor.listen(
+        pattern='event',
+        max_events=2,
+        overflow_policy=logcat_processor.OverflowPolicy.BLOCK,
+    ) as listener:
+      self._write_log(
+          ''.join(_make_line(i, f'event {i}') for i in range(1, 4))
+          + _make_line(4, 'other') * 50
+          + _make_line(5, 'event 4'),
+          mode='a',
+      )
+      self.assertTrue(_wait_until(lambda: listener.stats.max_backlog == 2))
+      messages = [listener.get_next_event(timeout=10).message for _ in range(3)]
+      dispatched = listener.stats.dispatched
+
+      # Only held back lines that do not match are left, of which one step
+      # is read before timing out.
+      with self.assertRaises(TimeoutError):
+        listener.get_next_event(timeout=0)
+      self.assertEqual(listener.stats.dispatched, dispatched + 10)
+      messages.append(listener.get_next_event(timeout=10).message)
+
+      self.assertEqual(messages, [f'event {i}' for i in range(1, 5)])
+      self.assertEqual(listener.stats.dispatched, 54)
+
+  def test_listener_block_policy_does_not_hold_up_others(self):
+    self._write_log(_make_line(0, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    with contextlib.ExitStack() as stack:
+      blocking = stack.enter_context(
+          processor.listen(
+              max_events=1,
+              overflow_policy=logcat_processor.OverflowPolicy.BLOCK,
+          )
+      )
+      other = stack.enter_context(processor.listen())
+      self._write_log(
+          ''.join(_make_line(i, f'event {i}') for i in range(1, 6)), mode='a'
+      )
+
+      start = time.monotonic()
+      messages = [other.get_next_event(timeout=10).message for _ in range(5)]
+      processor.close()
+      elapsed = time.monotonic() - start
+
+    self.assertLess(elapsed, 2)
+    self.assertEqual(messages, [f'event {i}' for i in range(1, 6)])
+    self.assertEqual(blocking.stats.dispatched, 1)
+    self.assertEqual(blocking.stats.dropped, 0)
+
+  def test_await_for_many_patterns_concurrently(self):
+    self._write_log(_make_line(0, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    since = logcat_processor.LogcatPosition.from_file(self.log_file)
+
+    async def wait_all():
+      waits = [
+          processor.await_for([f'event {i}'], timeout_sec=10, since=since)
+          for i in range(100)
+      ]
+      threading.Timer(
+          0.1,
+          self._write_log,
+          args=(''.join(_make_line(1, f'event {i}') for i in range(100)), 'a'),
+      ).start()
+      return await asyncio.gather(*waits)
+
+    results = asyncio.run(wait_all())
+
+    self.assertEqual(
+        [lines[0].message for lines in results],
+        [f'event {i}' for i in range(100)],
+    )
+
+  def test_await_for_timeout(self):
+    self._write_log(_make_line(0, 'existing'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with self.assertRaisesRegex(TimeoutError, 'in-order pattern: .missing'):
+      asyncio.run(processor.await_for(['existing', 'missing'], timeout_sec=0.2))
+
+  def test_await_for_timeout_during_catch_up(self):
+    self._write_log(
+        ''.join(_make_line(i % 60, f'message {i}') for i in range(300000))
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    since = logcat_processor.LogcatPosition(_byte_offset=0)
+
+    start = time.monotonic()
+    with self.assertRaises(TimeoutError):
+      asyncio.run(processor.await_for(['NEVER'], timeout_sec=0.2, since=since))
+
+    self.assertLess(time.monotonic() - start, 1.5)
+    self.assertFalse(processor._reader._subscriptions)
+
+  def test_await_for_cancelled_during_catch_up(self):
+    self._write_log(
+        ''.join(_make_line(i % 60, f'message {i}') for i in range(300000))
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    since = logcat_processor.LogcatPosition(_byte_offset=0)
+    stopped = threading.Event()
+    subscribe = processor._reader.subscribe
+
+    def tracked_subscribe(*args, **kwargs):
+      try:
+        return subscribe(*args, **kwargs)
+      finally:
+        stopped.set()
+
+    async def cancel_wait():
+      task = asyncio.create_task(
+          processor.await_for(['NEVER'], timeout_sec=60, since=since)
+      )
+      await asyncio.sleep(0.1)
+      task.cancel()
+      with self.assertRaises(asyncio.CancelledError):
+        await task
+
+    start = time.monotonic()
+    with mock.patch.object(
+        processor._reader, 'subscribe', side_effect=tracked_subscribe
+    ):
+      asyncio.run(cancel_wait())
+      self.assertTrue(stopped.wait(10))
+
+    self.assertLess(time.monotonic() - start, 1.5)
+    self.assertFalse(processor._reader._subscriptions)
+
+  def test_astream_yields_new_lines(self):
+    self._write_log(_make_line(0, 'existing event'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    position = logcat_processor.LogcatPosition.from_file(self.log_file)
+    self._write_log(_make_line(1, 'event 1') + _make_line(2, 'other'), mode='a')
+
+    async def stream():
+      lines = processor.astream(pattern='event', position=position)
+      async with contextlib.aclosing(lines):
+        first = await anext(lines)
+        self._write_log(_make_line(3, 'event 3'), mode='a')
+        return [first, await anext(lines)]
+
+    lines = asyncio.run(stream())
+
+    self.assertEqual([line.message for line in lines], ['event 1', 'event 3'])
+    self.assertTrue(_wait_until(lambda: not processor._reader._subscriptions))
+
+  def test_publish_delivers_lines_without_reading_the_file(self):
+    self._write_log(_make_line(0, 'existing'))
+    offset = os.path.getsize(self.log_file)
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    with processor.listen(pattern='event') as listener:
+      # The published data is not written to the file, so it can only be
+      # delivered from memory.
+      processor.publish(offset, _make_line(1, 'event 1').encode('utf-8'))
+
+      event = listener.get_next_event(timeout=10)
+
+    self.assertEqual(event.message, 'event 1')
+    self.assertEqual(event.position._byte_offset, offset)
+
+  def test_publish_decoded_lines_without_parsing(self):
+    self._write_log(_make_line(0, 'existing'))
+    offset = os.path.getsize(self.log_file)
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    text_lines = [
+        logcat_binary.TextLine(
+            data=_make_line(1, 'event 1').encode('utf-8'),
+            raw=_make_line(1, 'event 1').rstrip('\n'),
+            timestamp_end=18,
+            pid=1000,
+            tid=1010,
+            level='I',
+            tag='TestTag',
+            message_start=len(_make_line(1, '')) - 1,
+        )
+    ]
+    with processor.listen(pattern='event') as listener:
+      with mock.patch.object(
+          logcat_processor.LogLine, 'from_string'
+      ) as from_string:
+        processor.publish(offset, text_lines[0].data, text_lines)
+        event = listener.get_next_event(timeout=10)
+
+    from_string.assert_not_called()
+    parsed = logcat_processor.LogLine.from_string(
+        text_lines[0].raw, byte_offset=offset
+    )
+    self.assertEqual(
+        dataclasses.replace(event.position, creation_time=0),
+        dataclasses.replace(parsed.position, creation_time=0),
+    )
+    self.assertEqual(
+        (event.pid, event.tid, event.level, event.tag, event.message),
+        (parsed.pid, parsed.tid, parsed.level, parsed.tag, parsed.message),
+    )
+
+  def test_publish_replays_hot_lines_to_new_subscribers(self):
+    processor = logcat_processor.LogcatProcessor(
+        self.log_file, hot_buffer_lines=2
+    )
+    self.addCleanup(processor.close)
+    data = ''.join(_make_line(i, f'event {i}') for i in range(4))
+    processor.publish(0, data[:70].encode('utf-8'))
+    processor.publish(70, data[70:].encode('utf-8'))
+    line_starts = [m.start() for m in re.finditer('08-09', data)]
+
+    lines = processor.wait_for(
+        ['event 2', 'event 3'],
+        timeout_sec=1,
+        since=logcat_processor.LogcatPosition(_byte_offset=line_starts[2]),
+    )
+
+    self.assertEqual(
+        [line.position._byte_offset for line in lines], line_starts[2:]
+    )
+    # Older lines are no longer in memory, and not in the file either.
+    with self.assertRaises(TimeoutError):
+      processor.wait_for(
+          ['event 1'],
+          timeout_sec=0.2,
+          since=logcat_processor.LogcatPosition(_byte_offset=line_starts[1]),
+      )
+
+  def test_reader_replays_existing_lines_to_late_subscriber(self):
+    self._write_log(_make_line(0, 'message 0'))
+    reader = logcat_processor._LogcatReader(self.log_file)
+    self.addCleanup(reader.close)
+    first_lines = []
+    reader.subscribe(
+        lambda _, line: first_lines.append(line.message),
+        os.path.getsize(self.log_file),
+    )
+    self._write_log(
+        ''.join(_make_line(i, f'message {i}') for i in range(1, 6)), mode='a'
+    )
+    self.assertTrue(_wait_until(lambda: len(first_lines) == 5))
+
+    late_lines = []
+    reader.subscribe(lambda _, line: late_lines.append(line.message), 0)
+    self._write_log(_make_line(6, 'message 6'), mode='a')
+
+    self.assertTrue(_wait_until(lambda: len(late_lines) == 7))
+    self.assertTrue(_wait_until(lambda: len(first_lines) == 6))
+    self.assertEqual(late_lines, [f'message {i}' for i in range(7)])
+    self.assertEqual(first_lines, [f'message {i}' for i in range(1, 7)])
+
+  def test_reader_stops_delivering_after_unsubscribe(self):
+    self._write_log('')
+    reader = logcat_processor._LogcatReader(self.log_file)
+    self.addCleanup(reader.close)
+    received = []
+    subscription = reader.subscribe(lambda _, line: received.append(line), 0)
+    reader.unsubscribe(subscription)
+    self._write_log(_make_line(1, 'ignored'), mode='a')
+    time.sleep(0.2)
+    self.assertEqual(received, [])
+
+  def test_reader_restarts_after_close(self):
+    self._write_log('')
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    with processor.listen():
+      pass
+    processor.close()
+    self.assertIsNone(processor._reader._thread)
+
+    threading.Timer(
+        0.1, self._write_log, args=(_make_line(1, 'after close'), 'a')
+    ).start()
+    lines = processor.wait_for(['after close'], timeout_sec=10)
+    self.assertEqual(lines[0].message, 'after close')
+
+  def test_concurrent_waits_share_the_reader(self):
+    self._write_log('')
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    since = logcat_processor.LogcatPosition.from_file(self.log_file)
+    results = {}
+
+    def _wait(pattern):
+      results[pattern] = processor.wait_for(
+          [pattern], since=since, timeout_sec=10
+      )[0].message
+
+    threads = [
+        threading.Thread(target=_wait, args=(f'event {i}',)) for i in range(5)
+    ]
+    for thread in threads:
+      thread.start()
+    self._write_log(
+        ''.join(_make_line(i, f'event {i}') for i in range(5)), mode='a'
+    )
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(results, {f'event {i}': f'event {i}' for i in range(5)})
+
+  def test_logcat_filter_normalizes_levels(self):
+    line = logcat_processor.LogLine.from_string(_make_line(1, 'msg', level='W'))
+    self.assertTrue(
+        logcat_processor.LogcatFilter(level='warning').matches(line)
+    )
+    self.assertTrue(
+        logcat_processor.LogcatFilter(level=['E', 'WARN']).matches(line)
+    )
+    self.assertFalse(
+        logcat_processor.LogcatFilter(level={'E', 'F'}).matches(line)
+    )
+
+  def test_logcat_filter_matches_tag_criteria(self):
+    line = logcat_processor.LogLine.from_string(
+        _make_line(1, 'msg', tag='WifiService')
+    )
+    self.assertTrue(
+        logcat_processor.LogcatFilter(tag='WifiService').matches(line)
+    )
+    self.assertTrue(
+        logcat_processor.LogcatFilter(tag=re.compile('^Wifi')).matches(line)
+    )
+    self.assertTrue(
+        logcat_processor.LogcatFilter(tag=['Bt', 'WifiService']).matches(line)
+    )
+    self.assertFalse(logcat_processor.LogcatFilter(tag='Wifi').matches(line))
+
+  def test_logcat_filter_matches_pattern_in_message_or_raw_line(self):
+    line = logcat_processor.LogLine.from_string(_make_line(1, 'Connected'))
+    self.assertTrue(
+        logcat_processor.LogcatFilter(pattern='^Connected').matches(line)
+    )
+    self.assertTrue(
+        logcat_processor.LogcatFilter(pattern='TestTag: Conn').matches(line)
+    )
+    self.assertFalse(
+        logcat_processor.LogcatFilter(pattern='Disconnected').matches(line)
+    )
+
+  def test_log_line_matches_accepts_filter(self):
+    line = logcat_processor.LogLine.from_string(_make_line(1, 'msg', level='E'))
+    self.assertTrue(line.matches(logcat_processor.LogcatFilter(level='E')))
+    with self.assertRaisesRegex(ValueError, 'LogcatFilter'):
+      line.matches(logcat_processor.LogcatFilter(level='E'), tag='TestTag')
+
+  def test_processor_queries_accept_filter(self):
+    self._write_log(
+        _make_line(1, 'boot', tag='System')
+        + _make_line(2, 'failure one', level='E')
+        + _make_line(3, 'fine')
+        + _make_line(4, 'failure two', level='E')
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    error_filter = logcat_processor.LogcatFilter(
+        'failure', tag='TestTag', level='E'
+    )
+
+    self.assertEqual(
+        [line.message for line in processor.get_lines(error_filter)],
+        ['failure one', 'failure two'],
+    )
+    self.assertEqual(
+        [line.message for line in processor.tail(1, error_filter)],
+        ['failure two'],
+    )
+    self.assertEqual(
+        [
+            line.message
+            for line in processor.wait_for(
+                [error_filter, logcat_processor.LogcatFilter(tag='System')],
+                in_order=False,
+                timeout_sec=1,
+            )
+        ],
+        ['failure one', 'boot'],
+    )
+    with processor.listen(error_filter) as listener:
+      self._write_log(
+          _make_line(5, 'failure three')
+          + _make_line(6, 'failure four', level='E'),
+          mode='a',
+      )
+      self.assertEqual(
+          listener.get_next_event(timeout=10).message, 'failure four'
+      )
+
+  def test_combine_patterns_matches_any_pattern(self):
+    combined = logcat_processor._combine_patterns(
+        [
+            logcat_processor.LogcatFilter(r'DHCP (ACK|OFFER)'),
+            logcat_processor.LogcatFilter('STATE_CONNECTED'),
+        ]
+    )
+    self.assertTrue(combined.search('DHCP OFFER received'))
+    self.assertTrue(combined.search('Network STATE_CONNECTED'))
+    self.assertFalse(combined.search('DHCP DISCOVER sent'))
+
+  def test_combine_patterns_rejects_unsafe_combinations(self):
+    self.assertIsNone(
+        logcat_processor._combine_patterns(
+            [
+                logcat_processor.LogcatFilter(r'(a)\1'),
+                logcat_processor.LogcatFilter('b'),
+            ]
+        )
+    )
+    self.assertIsNone(
+        logcat_processor._combine_patterns(
+            [
+                logcat_processor.LogcatFilter(re.compile('a', re.IGNORECASE)),
+                logcat_processor.LogcatFilter('b'),
+            ]
+        )
+    )
+    self.assertIsNone(
+        logcat_processor._combine_patterns(
+            [
+                logcat_processor.LogcatFilter('a'),
+                logcat_processor.LogcatFilter(tag='b'),
+            ]
+        )
+    )
+
+  def test_wait_for_unordered_matches_one_line_against_all_patterns(self):
+    self._write_log(
+        _make_line(1, 'DHCP OFFER') + _make_line(2, 'DHCP ACK connected')
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    lines = processor.wait_for(
+        ['connected', 'ACK', 'OFFER'], in_order=False, timeout_sec=1
+    )
+
+    self.assertEqual(
+        [line.message for line in lines],
+        ['DHCP ACK connected', 'DHCP ACK connected', 'DHCP OFFER'],
+    )
+
+  def test_split_threadtime_agrees_with_pattern(self):
+    lines = [
+        _make_line(1, 'plain message'),
+        _make_line(2, 'message: with colons: inside', year='2024'),
+        _make_line(3, 'empty tag', tag=''),
+        _make_line(4, 'tag with spaces', tag='My Tag  '),
+        _make_line(5, ''),
+        '08-09 22:00:06.000  1000  1010 I Tag:no space',
+        '08-09 22:00:07.000  1000  1010 I Tag :\tindented',
+        '--------- beginning of main',
+        '08-09 22:00:08.000  1000  1010 I no colon',
+    ]
+    for line in lines:
+      line = line.rstrip('\n')
+      match = logcat_processor.LogLine._PATTERN.match(line)
+      expected = (
+          match.group('timestamp', 'pid', 'tid', 'level', 'tag')
+          + (match.start('message'),)
+          if match
+          else None
+      )
+      self.assertEqual(logcat_processor._split_threadtime(line), expected)
+
+  def test_logcat_filter_screen_rejects_only_lines_that_can_not_match(self):
+    lines = [
+        _make_line(1, 'connected to wifi', tag='Wifi', level='I'),
+        _make_line(2, 'connected to wifi', tag='Wifi', level='D'),
+        _make_line(3, 'disconnected', tag='Wifi', level='E'),
+        _make_line(4, 'connected to bt', tag='Bluetooth', level='E'),
+        '--------- beginning of main\n',
+    ]
+    filters = [
+        logcat_processor.LogcatFilter('connected to', tag='Wifi'),
+        logcat_processor.LogcatFilter(r'\bconnected', level='I'),
+        logcat_processor.LogcatFilter(r'^connected', tag={'Wifi', 'Other'}),
+        logcat_processor.LogcatFilter(tag=re.compile('^Blue')),
+        logcat_processor.LogcatFilter(r'w.f.$', level='I'),
+    ]
+    for line_filter in filters:
+      for line in lines:
+        raw = line.rstrip('\n').encode('utf-8')
+        parsed = logcat_processor.LogLine.from_string(line)
+        text = line_filter.screen(raw)
+        if parsed is not None and line_filter.matches(parsed):
+          self.assertEqual(text, line.rstrip('\n'))
+    self.assertIsNone(
+        logcat_processor.LogcatFilter('wifi', tag='Wifi').screen(
+            lines[3].encode('utf-8')
+        )
+    )
+    self.assertIsNone(
+        logcat_processor.LogcatFilter(level='I').screen(
+            lines[2].encode('utf-8')
+        )
+    )
+    self.assertIsNone(
+        logcat_processor.LogcatFilter(r'c.nnected to w').screen(
+            lines[3].encode('utf-8')
+        )
+    )
+
+  def test_iter_lines_yields_unterminated_last_line(self):
+    first = _make_line(1, 'first \u00e9')
+    second = _make_line(2, 'second').rstrip('\n')
+    self._write_log(first + second)
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    first_size = len(first.encode('utf-8'))
+
+    lines = list(processor._iter_lines())
+
+    self.assertEqual(
+        [(offset, line.message) for offset, line in lines],
+        [
+            (first_size, 'first \u00e9'),
+            (first_size + len(second), 'second'),
+        ],
+    )
+    self.assertEqual(lines[1][1].position._byte_offset, first_size)
+
+  def test_get_lines_with_screened_filters(self):
+    self._write_log(
+        _make_line(1, 'connected', tag='Wifi', level='I')
+        + _make_line(2, 'connected', tag='Bluetooth', level='I')
+        + _make_line(3, 'dropped', tag='Wifi', level='E')
+        + _make_line(4, 'reconnected', tag='Wifi', level='D')
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    self.assertEqual(
+        [line.message for line in processor.get_lines('connected', tag='Wifi')],
+        ['connected', 'reconnected'],
+    )
+    self.assertEqual(
+        [line.message for line in processor.get_lines(r'^\w+ed$', level='I')],
+        ['connected', 'connected'],
+    )
+    self.assertEqual(
+        [line.tag for line in processor.tail(2, tag={'Wifi'}, level='E')],
+        ['Wifi'],
+    )
+
+  def test_to_bytes_pattern_only_converts_safe_patterns(self):
+    for source in [r'DHCP (ACK|OFFER)', r'a\.b+', r'(x)\1', r'a{2}']:
+      self.assertIsNotNone(
+          logcat_processor._to_bytes_pattern(re.compile(source)), source
+      )
+    for source in [r'a.b', r'[a-z]', r'\d+', r'end$', '\u00e9', r'(?i)abc']:
+      self.assertIsNone(
+          logcat_processor._to_bytes_pattern(re.compile(source)), source
+      )
+
+  def test_queries_with_mmap_match_regular_queries(self):
+    self._write_log(
+        _make_line(1, 'connected', tag='Wifi', level='I')
+        + _make_line(2, 'DHCP OFFER \u00e9', tag='Dhcp', level='D')
+        + _make_line(3, 'dropped', tag='Wifi', level='E')
+        + _make_line(4, 'DHCP ACK', tag='Dhcp', level='I')
+        + '--------- beginning of main\n'
+        + _make_line(5, 'reconnected', tag='Wifi', level='D').rstrip('\n')
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    def summarize(lines):
+      return [(line.position._byte_offset, line.raw) for line in lines]
+
+    queries = [
+        dict(pattern='connected'),
+        dict(pattern=r'DHCP (ACK|OFFER)'),
+        dict(pattern=r'^DHCP', tag='Dhcp'),
+        dict(tag={'Wifi', 'Other'}, level='D'),
+        dict(pattern='connected', max_lines=1),
+        dict(
+            pattern='DHCP',
+            since=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:03.000'
+            ),
+        ),
+    ]
+
+    for query in queries:
+      self.assertEqual(
+          summarize(processor.get_lines(use_mmap=True, **query)),
+          summarize(processor.get_lines(**query)),
+          query,
+      )
+    self.assertEqual(
+        summarize(processor.tail(2, 'connected', use_mmap=True)),
+        summarize(processor.tail(2, 'connected')),
+    )
+    self.assertEqual(
+        [line.message for line in processor.tail(1, tag='Dhcp', use_mmap=True)],
+        ['DHCP ACK'],
+    )
+
+  def test_log_line_is_compact_and_keeps_dataclass_semantics(self):
+    line = logcat_processor.LogLine.from_string(
+        _make_line(1, 'DHCP: ACK', tag='Dhcp'), byte_offset=10
+    )
+
+    self.assertFalse(hasattr(line, '__dict__'))
+    self.assertEqual(line.message, 'DHCP: ACK')
+    self.assertEqual(line.timestamp, '08-09 22:00:01.000')
+    self.assertEqual(line.position.timestamp, '08-09 22:00:01.000')
+    self.assertEqual(line.position._byte_offset, 10)
+    self.assertIs(line.tag, 'Dhcp')
+    with self.assertRaises(dataclasses.FrozenInstanceError):
+      line.message = 'other'
+    self.assertEqual(pickle.loads(pickle.dumps(line)), line)
+    self.assertIn("message='DHCP: ACK'", repr(line))
+
+  def test_log_line_constructor_keeps_given_fields(self):
+    position = logcat_processor.LogcatPosition(
+        timestamp='2024-08-09 22:00:01.000', _byte_offset=5
+    )
+    line = logcat_processor.LogLine(
+        position=position,
+        pid=1,
+        tid=2,
+        level='W',
+        tag='Tag',
+        message='not in raw',
+        raw='some raw line',
+    )
+    same_line = logcat_processor.LogLine(
+        position, 1, 2, 'W', 'Tag', 'not in raw', 'some raw line'
+    )
+
+    self.assertEqual(line.message, 'not in raw')
+    self.assertEqual(line.timestamp, '2024-08-09 22:00:01.000')
+    self.assertEqual(line.position, position)
+    self.assertEqual(line, same_line)
+    self.assertEqual(hash(line), hash(same_line))
+    self.assertNotEqual(
+        line,
+        logcat_processor.LogLine(
+            position, 1, 2, 'W', 'Tag', 'other', 'some raw line'
+        ),
+    )
+
+  def test_log_line_ordering_matches_position_ordering(self):
+    lines = [
+        logcat_processor.LogLine.from_string(line, byte_offset=offset)
+        for line, offset in [
+            (_make_line(3, 'c'), 0),
+            (_make_line(1, 'a', year='2025'), 0),
+            (_make_line(2, 'b', year='2024'), 0),
+            (_make_line(1, 'd'), 0),
+            (_make_line(1, 'e'), 100),
+            ('99-99 99:99:99.000  1 1 I T: out of range', 0),
+        ]
+    ]
+    for line in lines:
+      for other in lines:
+        self.assertEqual(line < other, line.position < other.position)
+        self.assertEqual(line <= other, line.position <= other.position)
+        self.assertEqual(line > other, line.position > other.position)
+        self.assertEqual(line >= other, line.position >= other.position)
+
+  def test_position_comparisons_match_timestamp_comparisons(self):
+    timestamps = [
+        None,
+        '',
+        '08-09 22:00:01.000',
+        '08-09 22:00:01.5',
+        '2024-08-09 22:00:01.000',
+        '2025-01-01 00:00:00.000',
+        '2025/08/09 22:00:01.000123',
+        '12-31 23:59:59.999999',
+        '99-99 99:99:99.000',
+        'not a timestamp',
+    ]
+    positions = [
+        logcat_processor.LogcatPosition(timestamp=t) for t in timestamps
+    ]
+    for position in positions:
+      for other in positions:
+        expected = logcat_processor.LogcatPosition._compare_timestamps(
+            position.timestamp, other.timestamp
+        )
+        self.assertEqual(
+            logcat_processor._compare_times(position, other),
+            expected,
+            (position.timestamp, other.timestamp),
+        )
+        self.assertEqual(position < other, expected < 0)
+        self.assertEqual(position >= other, expected >= 0)
+
+  def test_position_caches_time_key(self):
+    position = logcat_processor.LogcatPosition(timestamp='08-09 22:00:01.000')
+    other = logcat_processor.LogcatPosition(timestamp='08-09 22:00:02.000')
+
+    with mock.patch.object(
+        logcat_processor.LogcatPosition,
+        '_parse_timestamp',
+        wraps=logcat_processor.LogcatPosition._parse_timestamp,
+    ) as parse:
+      for _ in range(3):
+        self.assertLess(position, other)
+
+    self.assertEqual(parse.call_count, 2)
+    self.assertEqual(
+        position,
+        logcat_processor.LogcatPosition(
+            timestamp='08-09 22:00:01.000',
+            creation_time=position.creation_time,
+        ),
+    )
+
+  def test_split_file_splits_at_line_starts(self):
+    lines = [_make_line(i % 60, f'message {i}') for i in range(100)]
+    self._write_log(''.join(lines))
+    line_starts = {0}
+    for line in lines:
+      line_starts.add(max(line_starts) + len(line))
+
+    with mock.patch.object(logcat_processor, '_PARALLEL_MIN_CHUNK_SIZE', 100):
+      chunks = logcat_processor._split_file(self.log_file, 0, 7)
+
+    self.assertEqual(len(chunks), 7)
+    self.assertEqual(chunks[0][0], 0)
+    self.assertEqual(chunks[-1][1], os.path.getsize(self.log_file))
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+      self.assertEqual(end, start)
+      self.assertIn(start, line_starts)
+
+  @mock.patch.object(logcat_processor, '_PARALLEL_MIN_CHUNK_SIZE', 200)
+  def test_parallel_get_lines_matches_sequential_get_lines(self):
+    self._write_log(
+        ''.join(
+            _make_line(i % 60, f'message {i}', level='E' if i % 7 else 'I')
+            for i in range(200)
+        )
+        + _make_line(59, 'unterminated', level='I').rstrip('\n')
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    queries = [
+        dict(level='I'),
+        dict(pattern='message 1', max_lines=5),
+        dict(pattern='message', use_mmap=True, max_lines=150),
+        dict(
+            level='I',
+            since=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:30.000'
+            ),
+        ),
+    ]
+
+    for query in queries:
+      expected = processor.get_lines(**query)
+      lines = processor.get_lines(max_workers=3, **query)
+      self.assertEqual(
+          [(line.position._byte_offset, line.raw) for line in lines],
+          [(line.position._byte_offset, line.raw) for line in expected],
+          query,
+      )
+
+  def test_get_lines_until_position(self):
+    first = _make_line(1, 'first')
+    second = _make_line(2, 'second')
+    self._write_log(first + second + _make_line(3, 'third'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    second_end = len(first) + len(second)
+
+    def messages(**kwargs):
+      return [line.message for line in processor.get_lines(**kwargs)]
+
+    self.assertEqual(
+        messages(
+            until=logcat_processor.LogcatPosition(_byte_offset=second_end)
+        ),
+        ['first', 'second'],
+    )
+    # Lines starting before the bound are read completely.
+    self.assertEqual(
+        messages(
+            until=logcat_processor.LogcatPosition(_byte_offset=second_end - 3)
+        ),
+        ['first', 'second'],
+    )
+    self.assertEqual(
+        messages(pattern='i', until=processor.get_lines(pattern='first')[0]),
+        ['first'],
+    )
+    self.assertEqual(
+        messages(
+            until=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:02.000'
+            ),
+            use_mmap=True,
+            pattern='d',
+        ),
+        ['second'],
+    )
+
+  def test_cached_get_lines_scans_only_new_lines(self):
+    first = ''.join(_make_line(i, f'message {i}') for i in range(10))
+    self._write_log(first)
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    def messages(**kwargs):
+      lines = processor.get_lines(pattern='message', use_cache=True, **kwargs)
+      return [line.message for line in lines]
+
+    self.assertEqual(messages(), [f'message {i}' for i in range(10)])
+    self._write_log(_make_line(10, 'message 10') + '08-09 22:00:11.000', 'a')
+    with mock.patch.object(
+        logcat_processor,
+        '_query_file',
+        wraps=logcat_processor._query_file,
+    ) as query_file:
+      self.assertEqual(messages(), [f'message {i}' for i in range(11)])
+      # The new complete line is scanned and cached, the partial last line
+      # is scanned again by the next query.
+      self.assertEqual(
+          [c.args[2] for c in query_file.call_args_list],
+          [len(first), len(first) + len(_make_line(10, 'message 10'))],
+      )
+    self._write_log('  1000  1010 I TestTag: message 11\n', 'a')
+    since = processor.get_lines(pattern='message 5')[0]
+    self.assertEqual(
+        messages(since=since, max_lines=3),
+        ['message 5', 'message 6', 'message 7'],
+    )
+    self.assertEqual(messages(since=since)[-1], 'message 11')
+    self.assertEqual(
+        [line.message for line in processor.get_lines(pattern='message 1$')],
+        ['message 1'],
+    )
+
+  def test_cached_get_lines_restarts_after_truncation(self):
+    self._write_log(''.join(_make_line(i, f'old {i}') for i in range(5)))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    self.assertEqual(len(processor.get_lines(tag='TestTag', use_cache=True)), 5)
+
+    self._write_log(_make_line(9, 'new'))
+
+    self.assertEqual(
+        [
+            line.message
+            for line in processor.get_lines(tag='TestTag', use_cache=True)
+        ],
+        ['new'],
+    )
+
+  def test_query_cache_evicts_least_recently_used_entries(self):
+    self._write_log(''.join(_make_line(i, f'message {i}') for i in range(10)))
+    line_size = len(_make_line(0, 'message 0')) + 200
+    cache = logcat_processor._QueryCache(self.log_file, 5 * line_size)
+
+    def query(pattern):
+      return cache.query(
+          logcat_processor.LogcatFilter(pattern=pattern), 0, None, False
+      )
+
+    self.assertEqual(len(query('message [0-2]')), 3)
+    self.assertEqual(len(query('message [3-4]')), 2)
+    query('message [0-2]')
+    self.assertEqual(len(query('message [5-6]')), 2)
+    # The least recently used entry was evicted to stay within the bound.
+    self.assertEqual(len(cache._entries), 2)
+    self.assertIsNone(
+        cache._entries.get(
+            logcat_processor.LogcatFilter(pattern='message [3-4]')._cache_key
+        )
+    )
+    # Entries larger than the bound are not cached.
+    self.assertEqual(len(query('message')), 10)
+    self.assertEqual(len(cache._entries), 2)
+
+  def test_query_cache_scans_different_filters_concurrently(self):
+    self._write_log(''.join(_make_line(i, f'message {i}') for i in range(10)))
+    cache = logcat_processor._QueryCache(self.log_file, 1024 * 1024)
+    query_file = logcat_processor._query_file
+    slow_scan_started = threading.Event()
+    release_slow_scan = threading.Event()
+    self.addCleanup(release_slow_scan.set)
+
+    def scan(file_path, line_filter, *args):
+      if line_filter.pattern.pattern == 'slow':
+        slow_scan_started.set()
+        release_slow_scan.wait(10)
+      return query_file(file_path, line_filter, *args)
+
+    def query(pattern):
+      return cache.query(
+          logcat_processor.LogcatFilter(pattern=pattern), 0, None, False
+      )
+
+    with mock.patch.object(logcat_processor, '_query_file', side_effect=scan):
+      slow_query = threading.Thread(target=query, args=('slow',))
+      slow_query.start()
+      self.assertTrue(slow_scan_started.wait(10))
+
+      self.assertEqual(len(query('message [0-2]')), 3)
+      self.assertTrue(slow_query.is_alive())
+      release_slow_scan.set()
+      slow_query.join(10)
+
+    self.assertEqual(len(cache._entries), 2)
+    self.assertFalse(cache._key_locks)
+
+  def test_aggregator_counts_new_lines(self):
+    self._write_log(_make_line(0, 'before'))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with processor.aggregate() as aggregator:
+      self._write_log(
+          _make_line(1, 'a', tag='Spam')
+          + _make_line(1, 'b', tag='Spam', level='W')
+          + _make_line(2, 'c', tag='Spam')
+          + _make_line(1, 'd', tag='Late')
+          + _make_line(3, 'e'),
+          'a',
+      )
+      self.assertTrue(_wait_until(lambda: aggregator.stats.lines == 5))
+      stats = aggregator.stats
+
+    self.assertFalse(aggregator.is_aggregating)
+    self.assertEqual(stats.tags, {'Spam': 3, 'Late': 1, 'TestTag': 1})
+    self.assertEqual(stats.pids, {1000: 5})
+    self.assertEqual(stats.levels, {'I': 4, 'W': 1})
+    # The late line is counted in the second it was logged in.
+    self.assertEqual(stats.rate_histogram, {1: 2, 2: 1})
+    self.assertEqual(stats.peak_rate, 3)
+    self.assertEqual(stats.peak_second, '08-09 22:00:01')
+
+  def test_aggregator_rate_window_flushes_old_seconds(self):
+    self._write_log(
+        ''.join(_make_line(i, 'x') for i in range(20) for _ in range(i % 3))
+    )
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with processor.aggregate(
+        position=logcat_processor.LogcatPosition(_byte_offset=0)
+    ) as aggregator:
+      stats = aggregator.stats
+
+    self.assertEqual(len(aggregator._seconds), 8)
+    self.assertEqual(stats.lines, 19)
+    self.assertEqual(stats.rate_histogram, {1: 7, 2: 6})
+    self.assertEqual(
+        (stats.peak_rate, stats.peak_second), (2, '08-09 22:00:02')
+    )
+
+  def test_aggregator_take_stats_splits_at_position(self):
+    first = _make_line(1, 'first') + _make_line(2, 'second')
+    third = _make_line(3, 'third')
+    self._write_log(first)
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with processor.aggregate(
+        position=logcat_processor.LogcatPosition(_byte_offset=0)
+    ) as aggregator:
+      first_stats = aggregator.take_stats(
+          end=logcat_processor.LogcatPosition(_byte_offset=len(first))
+      )
+      timer = threading.Timer(
+          0.2, self._write_log, (third + _make_line(4, 'fourth'), 'a')
+      )
+      timer.start()
+      self.addCleanup(timer.cancel)
+      # Waits for the lines before the end, later lines are not counted.
+      second_stats = aggregator.take_stats(
+          end=logcat_processor.LogcatPosition(
+              _byte_offset=len(first) + len(third)
+          )
+      )
+      self.assertTrue(
+          _wait_until(
+              lambda: aggregator._offset == os.path.getsize(self.log_file)
+          )
+      )
+      third_stats = aggregator.take_stats()
+
+    self.assertEqual(first_stats.tags, {'TestTag': 2})
+    self.assertEqual(second_stats.lines, 1)
+    self.assertEqual(third_stats.lines, 1)
+    self.assertEqual(aggregator.take_stats().lines, 0)
+
+  def test_aggregator_take_stats_at_a_buffer_marker(self):
+    first = _make_line(1, 'first') + '--------- beginning of system\n'
+    self._write_log(first)
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with processor.aggregate(
+        position=logcat_processor.LogcatPosition(_byte_offset=0)
+    ) as aggregator:
+      start = time.monotonic()
+      first_stats = aggregator.take_stats(
+          end=logcat_processor.LogcatPosition(_byte_offset=len(first))
+      )
+      self._write_log(
+          _make_line(2, 'second') + '--------- beginning of main\n', 'a'
+      )
+      second_stats = aggregator.take_stats(
+          end=logcat_processor.LogcatPosition(
+              _byte_offset=os.path.getsize(self.log_file)
+          )
+      )
+      elapsed = time.monotonic() - start
+
+    self.assertLess(elapsed, 2)
+    self.assertEqual(first_stats.lines, 1)
+    self.assertEqual(second_stats.lines, 1)
+
+  def test_merge_lines_interleaves_files_by_timestamp(self):
+    other_file = os.path.join(self.tmp_dir, 'other.txt')
+    self._write_log(
+        _make_line(1, 'a1')
+        + _make_line(3, 'a3', tag='Other')
+        + _make_line(5, 'a5')
+        + _make_line(7, 'a7')
+    )
+    with open(other_file, 'w', encoding='utf-8') as f:
+      f.write(_make_line(2, 'b2') + _make_line(3, 'b3') + _make_line(6, 'b6'))
+    processors = {
+        'a': logcat_processor.LogcatProcessor(self.log_file),
+        'b': logcat_processor.LogcatProcessor(other_file),
+    }
+    for processor in processors.values():
+      self.addCleanup(processor.close)
+
+    def merged(**kwargs):
+      return [
+          (line.source, line.line.message)
+          for line in logcat_processor.merge_lines(processors, **kwargs)
+      ]
+
+    self.assertEqual(
+        merged(),
+        [
+            ('a', 'a1'),
+            ('b', 'b2'),
+            ('a', 'a3'),
+            ('b', 'b3'),
+            ('a', 'a5'),
+            ('b', 'b6'),
+            ('a', 'a7'),
+        ],
+    )
+    self.assertEqual(
+        merged(
+            tag='TestTag',
+            since=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:02.000'
+            ),
+            until=processors['b'].get_lines(pattern='b6')[0],
+        ),
+        [('b', 'b2'), ('b', 'b3'), ('a', 'a5'), ('b', 'b6')],
+    )
+    with self.assertRaisesRegex(ValueError, 'timestamp'):
+      logcat_processor.merge_lines(
+          processors, since=logcat_processor.LogcatPosition(_byte_offset=10)
+      )
+
+  def test_merge_lines_sorts_interleaved_buffers(self):
+    other_file = os.path.join(self.tmp_dir, 'other.txt')
+    # Lines of another buffer arrive after newer lines.
+    self._write_log(
+        _make_line(1, 'a1')
+        + _make_line(4, 'a4')
+        + _make_line(2, 'a2', tag='Crash')
+        + _make_line(3, 'a3', tag='Crash')
+        + _make_line(7, 'a7')
+        + _make_line(5, 'a5', tag='Crash')
+    )
+    with open(other_file, 'w', encoding='utf-8') as f:
+      f.write(_make_line(2, 'b2') + _make_line(6, 'b6'))
+    processors = {
+        'a': logcat_processor.LogcatProcessor(self.log_file),
+        'b': logcat_processor.LogcatProcessor(other_file),
+    }
+    for processor in processors.values():
+      self.addCleanup(processor.close)
+
+    def merged(**kwargs):
+      return [
+          line.line.message
+          for line in logcat_processor.merge_lines(processors, **kwargs)
+      ]
+
+    self.assertEqual(
+        merged(), ['a1', 'a2', 'b2', 'a3', 'a4', 'a5', 'b6', 'a7']
+    )
+    self.assertEqual(
+        merged(
+            until=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:03.000'
+            )
+        ),
+        ['a1', 'a2', 'b2', 'a3'],
+    )
+    self.assertEqual(
+        merged(
+            since=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:03.000'
+            ),
+            until=logcat_processor.LogcatPosition(
+                timestamp='08-09 22:00:05.000'
+            ),
+        ),
+        ['a3', 'a4', 'a5'],
+    )
+
+  def test_merge_lines_reads_files_lazily(self):
+    self._write_log(''.join(_make_line(i, f'message {i}') for i in range(50)))
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+
+    with mock.patch.object(logcat_processor, '_SCAN_READ_SIZE', 100):
+      merged = logcat_processor.merge_lines({'a': processor, 'b': processor})
+      first = [next(merged) for _ in range(4)]
+      with mock.patch.object(
+          logcat_processor.LogLine,
+          'from_string',
+          wraps=logcat_processor.LogLine.from_string,
+      ) as from_string:
+        next(merged)
+
+    self.assertEqual(
+        [(line.source, line.line.message) for line in first],
+        [
+            ('a', 'message 0'),
+            ('b', 'message 0'),
+            ('a', 'message 1'),
+            ('b', 'message 1'),
+        ],
+    )
+    self.assertLess(from_string.call_count, 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,245 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import logcat_processor
+from mobly.controllers.android_device_lib import logcat_storage
+
+
+def _make_line(second, message, tag='TestTag', level='I'):
+  """Creates a threadtime line logged at 08-09 22:00:<second>.000."""
+  return (
+      f'08-09 22:00:{second:02d}.000  1000  1010 {level} {tag}: {message}\n'
+  ).encode('utf-8')
+
+
+class LogcatStorageTest(unittest.TestCase):
+  """Unit tests for the logcat_storage module."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.log_file = os.path.join(self.tmp_dir, 'logcat.txt')
+    self.lines = [_make_line(i, f'Message {i}') for i in range(40)]
+    self.content = b''.join(self.lines)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _write_segmented(self, data, segment_size=200):
+    writer = logcat_storage.SegmentedFileWriter(self.log_file, segment_size)
+    writer.write(data)
+    writer.close()
+
+  def test_writer_seals_segments_at_line_ends(self):
+    self._write_segmented(self.content)
+
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      segments = reader.segments
+      self.assertGreater(len(segments), 1)
+      for segment in segments:
+        self.assertGreaterEqual(segment.size, 200)
+        data = reader.segment_data(segment)
+        self.assertEqual(len(data), segment.size)
+        self.assertTrue(data.endswith(b'\n'))
+        with gzip.open(segment.path, 'rb') as f:
+          self.assertEqual(f.read(), data)
+      self.assertEqual(reader.live_base, segments[-1].end)
+    with open(self.log_file, 'rb') as f:
+      live = f.read()
+    self.assertLess(len(live), 200)
+    self.assertTrue(self.content.endswith(live))
+
+  def test_reader_reads_across_segments(self):
+    self._write_segmented(self.content)
+
+    self.assertEqual(logcat_storage.file_size(self.log_file), len(self.content))
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.read(0, len(self.content) + 10), self.content)
+      self.assertEqual(reader.read(150, 300), self.content[150:450])
+      self.assertEqual(reader.read(len(self.content), 10), b'')
+
+  def test_reader_reads_plain_file(self):
+    with open(self.log_file, 'wb') as f:
+      f.write(self.content)
+
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.segments, [])
+      self.assertEqual(reader.size(), len(self.content))
+      self.assertEqual(reader.read(10, 20), self.content[10:30])
+
+  def test_missing_file_is_empty(self):
+    self.assertEqual(logcat_storage.file_size(self.log_file), 0)
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.read(0, 10), b'')
+
+  def test_writer_continues_existing_file(self):
+    self._write_segmented(self.content[:500])
+    self._write_segmented(self.content[500:])
+
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.read(0, len(self.content)), self.content)
+
+  def test_writer_completes_interrupted_rotation(self):
+    self._write_segmented(self.content[:300])
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      last = reader.segments[-1]
+      sealed = reader.segment_data(last)
+    # Simulates a crash after listing a segment, before emptying the file.
+    index = logcat_storage.index_path(self.log_file)
+    with open(index, 'rb') as f:
+      entries = f.read()
+    with open(index, 'wb') as f:
+      f.write(entries.rstrip(b'\n'))
+    with open(self.log_file, 'wb') as f:
+      f.write(sealed)
+
+    self._write_segmented(self.content[last.end :])
+
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.read(0, len(self.content)), self.content)
+
+  def test_writer_drops_partial_index_entry(self):
+    self._write_segmented(self.content[:100])
+    with open(logcat_storage.index_path(self.log_file), 'ab') as f:
+      f.write(b'{"path": "logcat.txt.00001.gz", "be')
+
+    self._write_segmented(self.content[100:])
+
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.read(0, len(self.content)), self.content)
+
+  @mock.patch.object(logcat_storage, '_ROTATION_TIMEOUT_SEC', 0.2)
+  def test_reader_gives_up_on_unreadable_index(self):
+    self._write_segmented(self.content)
+    reader = logcat_storage.SegmentedFileReader(self.log_file)
+    self.addCleanup(reader.close)
+    real_open = open
+
+    def failing_open(path, *args, **kwargs):
+      if path == logcat_storage.index_path(self.log_file):
+        raise PermissionError('denied')
+      return real_open(path, *args, **kwargs)
+
+    start = time.monotonic()
+    with mock.patch('builtins.open', side_effect=failing_open) as open_mock:
+      with self.assertRaises(PermissionError):
+        reader.size()
+
+    self.assertLess(time.monotonic() - start, 5)
+    # Retries are spaced out instead of spinning.
+    self.assertLess(open_mock.call_count, 100)
+
+  @mock.patch.object(logcat_storage, '_ROTATION_TIMEOUT_SEC', 0.2)
+  def test_reader_gives_up_on_index_that_keeps_changing(self):
+    self._write_segmented(self.content)
+    reader = logcat_storage.SegmentedFileReader(self.log_file)
+    self.addCleanup(reader.close)
+
+    with mock.patch.object(
+        reader, '_stat_index', return_value=10**6
+    ) as stat_index:
+      with self.assertRaisesRegex(OSError, 'kept changing'):
+        reader.size()
+
+    self.assertLess(stat_index.call_count, 100)
+
+  def test_collect_writes_stream_until_closed(self):
+    writer = logcat_storage.SegmentedFileWriter(self.log_file, 200)
+    thread = threading.Thread(
+        target=writer.collect,
+        args=(io.BufferedReader(io.BytesIO(self.content)),),
+    )
+    thread.start()
+    thread.join(10)
+
+    self.assertFalse(thread.is_alive())
+    with logcat_storage.SegmentedFileReader(self.log_file) as reader:
+      self.assertEqual(reader.read(0, len(self.content)), self.content)
+
+  def test_processor_queries_across_segments(self):
+    self._write_segmented(self.content)
+    processor = logcat_processor.LogcatProcessor(
+        self.log_file, index_interval_bytes=64
+    )
+    self.addCleanup(processor.close)
+
+    lines = processor.get_lines(pattern='Message 1')
+    self.assertEqual(
+        [line.message for line in lines],
+        ['Message 1'] + [f'Message {i}' for i in range(10, 20)],
+    )
+    self.assertEqual(
+        [line.raw for line in processor.get_lines(pattern=r'Message \d+$')],
+        [line.decode('utf-8').rstrip('\n') for line in self.lines],
+    )
+    for line in lines:
+      self.assertEqual(
+          self.content[line.position._byte_offset :].split(b'\n')[0],
+          line.raw.encode('utf-8'),
+      )
+    mapped = processor.get_lines(pattern='Message 1', use_mmap=True)
+    self.assertEqual(
+        [(line.position._byte_offset, line.raw) for line in mapped],
+        [(line.position._byte_offset, line.raw) for line in lines],
+    )
+    self.assertEqual(
+        [line.message for line in processor.tail(3)],
+        ['Message 37', 'Message 38', 'Message 39'],
+    )
+    self.assertEqual(
+        [line.message for line in processor.tail(2, 'Message', use_mmap=True)],
+        ['Message 38', 'Message 39'],
+    )
+    bounded = processor.get_lines(since=lines[3], until=lines[5])
+    self.assertEqual(
+        [line.message for line in bounded],
+        ['Message 12', 'Message 13', 'Message 14'],
+    )
+
+  def test_processor_waits_across_rotations(self):
+    writer = logcat_storage.SegmentedFileWriter(self.log_file, 200)
+    self.addCleanup(writer.close)
+    writer.write(self.content[:250])
+    writer.flush()
+    processor = logcat_processor.LogcatProcessor(self.log_file)
+    self.addCleanup(processor.close)
+    since = logcat_processor.LogcatPosition.from_file(self.log_file)
+
+    def write_rest():
+      writer.write(self.content[250:])
+      writer.flush()
+
+    timer = threading.Timer(0.2, write_rest)
+    timer.start()
+    self.addCleanup(timer.cancel)
+    found = processor.wait_for(
+        ['Message 10', 'Message 39'], timeout_sec=10, in_order=True, since=since
+    )
+
+    self.assertEqual(
+        [line.message for line in found], ['Message 10', 'Message 39']
+    )
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,103 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from mobly import runtime_test_info
+from mobly.controllers.android_device_lib import adb_metrics
+from mobly.controllers.android_device_lib.services import adb_metrics_service
+
+_SERIAL = 'metrics_serial'
+
+
+class AdbMetricsServiceTest(unittest.TestCase):
+  """Unit tests for the adb metrics service."""
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+    self.metrics = adb_metrics.get_metrics()
+    self.metrics.reset()
+    self.addCleanup(self.metrics.reset)
+    self.ad = mock.MagicMock(serial=_SERIAL)
+    self.ad.generate_filename.return_value = 'adb_metrics,test_xyz.yaml'
+    mock_record = mock.MagicMock(
+        test_name='test_xyz', begin_time='1234567', signature='test_xyz-1234567'
+    )
+    self.test_info = runtime_test_info.RuntimeTestInfo(
+        mock_record.test_name, self.tmp_dir, mock_record
+    )
+
+  def test_start_and_stop(self):
+    service = adb_metrics_service.AdbMetricsService(self.ad)
+    self.assertFalse(service.is_alive)
+
+    service.start()
+    self.assertTrue(service.is_alive)
+    self.assertTrue(self.metrics.is_enabled(_SERIAL))
+    service.stop()
+    self.assertFalse(service.is_alive)
+    self.assertFalse(self.metrics.is_enabled(_SERIAL))
+
+  def test_create_output_excerpts(self):
+    service = adb_metrics_service.AdbMetricsService(self.ad)
+    service.start()
+    self.addCleanup(service.stop)
+    self.metrics.record(_SERIAL, ['adb', 'shell', 'getprop', 'x'], 0.003, 0)
+    self.metrics.record(_SERIAL, ['adb', 'shell', 'getprop', 'y'], 0.2, 1, 5)
+    self.metrics.record(_SERIAL, ['adb', 'install', 'a.apk'], 0.5)
+    self.metrics.record('2', ['adb', '-s', '2', 'reboot'], 1, 0)
+
+    paths = service.create_output_excerpts(self.test_info)
+
+    self.ad.generate_filename.assert_called_once_with(
+        'adb_metrics', self.test_info, 'yaml'
+    )
+    self.assertEqual(
+        paths,
+        [
+            os.path.join(
+                self.test_info.output_path, 'adb_metrics,test_xyz.yaml'
+            )
+        ],
+    )
+    with open(paths[0], 'r') as f:
+      summary = yaml.safe_load(f)
+    self.assertEqual(summary['Calls'], 3)
+    self.assertEqual(summary['Errors'], 1)
+    self.assertEqual(summary['Timeouts'], 1)
+    self.assertEqual(summary['Total Seconds'], 0.703)
+    self.assertEqual(list(summary['Commands']), ['install', 'shell getprop'])
+    getprop = summary['Commands']['shell getprop']
+    self.assertEqual(getprop['Calls'], 2)
+    self.assertEqual(getprop['Max Seconds'], 0.2)
+    self.assertEqual(getprop['Bytes Received'], 5)
+    self.assertEqual(getprop['Calls Per Exit Code'], {0: 1, 1: 1})
+    self.assertEqual(
+        getprop['Calls Per Milliseconds'], {'2-3': 1, '128-255': 1}
+    )
+    # The counters were taken, and those of devices without the service
+    # were never recorded.
+    self.assertEqual(service.create_output_excerpts(self.test_info), [])
+    self.assertEqual(self.metrics.snapshot('2'), {})
+
+
+if __name__ == '__main__':
+  unittest.main()
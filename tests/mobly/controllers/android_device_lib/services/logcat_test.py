@@ -12,21 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import contextlib
+import io
 import logging
 import os
 import re
 import shutil
+import struct
 import tempfile
 import threading
 import time
 import unittest
 from unittest import mock
 
+import yaml
+
 from mobly import records
 from mobly import runtime_test_info
 from mobly.controllers import android_device
 from mobly.controllers.android_device_lib import adb
 from mobly.controllers.android_device_lib import logcat_processor
+from mobly.controllers.android_device_lib import logcat_storage
 from mobly.controllers.android_device_lib.services import logcat
 from tests.lib import mock_android_device
 
@@ -965,6 +972,31 @@ class LogcatServiceUserBehaviorTest(unittest.TestCase):
       self.assertEqual(event.message, 'Reconnected to wlan0')
       self.assertTrue(listener.has_events())
 
+  def test_await_for_and_astream(self):
+    async def wait_and_stream():
+      events = self.logcat_service.astream(tag='WifiService')
+      async with contextlib.aclosing(events):
+        # Starts streaming, the first event then is the appended one.
+        first_event = asyncio.ensure_future(anext(events))
+        while not self.logcat_service._get_processor()._reader._subscriptions:
+          await asyncio.sleep(0.01)
+        waited = asyncio.ensure_future(
+            self.logcat_service.await_for(
+                ['DHCP ACK', 'Async event'], timeout_sec=10
+            )
+        )
+        self._append_log(
+            '\n08-09 22:00:06.000  1000  1030 I WifiService: Async event\n'
+        )
+        return await first_event, await waited
+
+    event, lines = asyncio.run(wait_and_stream())
+
+    self.assertEqual(event.message, 'Async event')
+    self.assertEqual(
+        [line.tag for line in lines], ['DhcpClient', 'WifiService']
+    )
+
   def test_features_work_across_and_after_create_output_excerpts(self):
     # Setup mock filename generator and open logcat file for excerpt tracking
     self.ad.generate_filename.side_effect = (
@@ -1059,6 +1091,299 @@ class LogcatServiceUserBehaviorTest(unittest.TestCase):
     self.assertIn('Test2 error encountered', excerpt_2_content)
     self.assertIn('Streaming event', excerpt_2_content)
 
+  def _create_excerpt(self, test_name):
+    self.ad.generate_filename.side_effect = (
+        lambda file_type, test_info=None, extension_name=None: (
+            f'excerpt_{test_info.name}.txt'
+        )
+    )
+    record = records.TestResultRecord(test_name)
+    record.begin_time = 100
+    record.signature = f'{test_name}-100'
+    test_info = runtime_test_info.RuntimeTestInfo(
+        test_name, os.path.join(self.tmp_dir, test_name), record
+    )
+    return self.logcat_service.create_output_excerpts(test_info)[0]
+
+  def test_last_excerpt_range_bounds_queries_to_the_excerpt(self):
+    self.assertIsNone(self.logcat_service.last_excerpt_range)
+    self.logcat_service._open_logcat_file()
+    self._append_log(
+        '\n08-09 22:00:06.000  1000  1030 E WifiService: In excerpt\n'
+        '08-09 22:00:06.500  1000  1030 I WifiService: Also in excerpt\n'
+    )
+    self._create_excerpt('test_1')
+    self._append_log(
+        '08-09 22:00:07.000  1000  1030 E WifiService: After excerpt\n'
+    )
+
+    begin, end = self.logcat_service.last_excerpt_range
+    lines = self.logcat_service.get_lines(
+        tag='WifiService', since=begin, until=end
+    )
+
+    self.assertEqual(
+        [line.message for line in lines], ['In excerpt', 'Also in excerpt']
+    )
+    self.assertEqual(
+        [
+            line.message
+            for line in self.logcat_service.get_lines(until=lines[0])
+        ][-1],
+        'In excerpt',
+    )
+
+  def test_create_output_excerpts_copies_bytes_without_kernel_copy(self):
+    self.logcat_service._open_logcat_file()
+    content = b'Some log.\r\nInvalid \xff byte.\nPartial line'
+    with open(self.log_file, 'ab') as f:
+      f.write(content)
+
+    with (
+        mock.patch.object(logcat, '_EXCERPT_COPY_BUFFER_SIZE', 7),
+        mock.patch.object(
+            os, 'copy_file_range', side_effect=OSError, create=True
+        ),
+        mock.patch.object(os, 'sendfile', side_effect=OSError, create=True),
+    ):
+      excerpt_path = self._create_excerpt('test_1')
+
+    with open(excerpt_path, 'rb') as f:
+      self.assertEqual(f.read(), content)
+    self._append_log(' continued\n')
+    with open(self._create_excerpt('test_2'), 'rb') as f:
+      self.assertEqual(f.read(), b' continued\n')
+
+  def test_create_output_excerpts_saves_listener_stats(self):
+    self.logcat_service._open_logcat_file()
+    with self.logcat_service.listen(
+        tag='WifiService', max_events=1
+    ) as listener:
+      self._append_log(
+          '\n08-09 22:00:06.000  1000  1030 I WifiService: First\n'
+          '08-09 22:00:06.500  1000  1030 I WifiService: Second\n'
+      )
+      deadline = time.perf_counter() + 10
+      while listener.stats.matched < 2 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    excerpt_path = self._create_excerpt('test_1')
+
+    with open(
+        excerpt_path[: -len('.txt')] + '.listener_stats.yaml',
+        encoding='utf-8',
+    ) as f:
+      stats = yaml.safe_load(f)
+    self.assertEqual(
+        stats,
+        [
+            {
+                'Filter': "pattern=None, tag='WifiService', level=None",
+                'Max Events': 1,
+                'Overflow Policy': 'overwrite',
+                'Dispatched': 2,
+                'Matched': 2,
+                'Dropped': 1,
+                'Max Backlog': 1,
+            }
+        ],
+    )
+    excerpt_path = self._create_excerpt('test_2')
+    self.assertFalse(
+        os.path.exists(excerpt_path[: -len('.txt')] + '.listener_stats.yaml')
+    )
+
+  def test_create_output_excerpts_saves_listener_stats_per_excerpt(self):
+    self.logcat_service._open_logcat_file()
+
+    def load_stats(excerpt_path):
+      with open(
+          excerpt_path[: -len('.txt')] + '.listener_stats.yaml',
+          encoding='utf-8',
+      ) as f:
+        return [
+            (entry['Dispatched'], entry['Matched'], entry['Dropped'])
+            for entry in yaml.safe_load(f)
+        ]
+
+    with self.logcat_service.listen(
+        tag='WifiService', max_events=1
+    ) as listener:
+      # The queue of one event is still full when the second test starts.
+      for test_name, count, matched, dropped in (
+          ('test_1', 3, 3, 2),
+          ('test_2', 2, 5, 2),
+      ):
+        self._append_log(
+            '08-09 22:00:06.000  1000  1030 I WifiService: Event\n' * count
+        )
+        deadline = time.perf_counter() + 10
+        while (
+            listener.stats.matched < matched
+            and time.perf_counter() < deadline
+        ):
+          time.sleep(0.01)
+        excerpt_path = self._create_excerpt(test_name)
+        self.assertEqual(
+            load_stats(excerpt_path), [(count, count, dropped)]
+        )
+
+  @mock.patch('mobly.utils.stop_standing_subprocess')
+  @mock.patch('mobly.utils.start_standing_subprocess')
+  def test_create_output_excerpts_saves_log_stats(self, *_):
+    self.ad.is_bootloader = False
+    self.logcat_service._config = logcat.Config(
+        clear_log=False, collect_stats=True
+    )
+    self.logcat_service.start()
+    self._append_log(
+        '\n08-09 22:00:06.000  1000  1030 I WifiService: First\n'
+        '08-09 22:00:06.500  1000  1030 W WifiService: Second\n'
+        '08-09 22:00:07.000  2000  2010 I BtGatt: Third\n'
+    )
+
+    excerpt_path = self._create_excerpt('test_1')
+
+    with open(
+        excerpt_path[: -len('.txt')] + '.stats.yaml', encoding='utf-8'
+    ) as f:
+      stats = yaml.safe_load(f)
+    self.assertEqual(
+        stats,
+        {
+            'Lines': 3,
+            'Lines Per Level': {'I': 2, 'W': 1},
+            'Tags': 2,
+            'Top Tags': [{'WifiService': 2}, {'BtGatt': 1}],
+            'Pids': 2,
+            'Top Pids': [{1000: 2}, {2000: 1}],
+            'Peak Lines Per Second': 2,
+            'Peak Second': '08-09 22:00:06',
+            'Seconds Per Rate': {'1-1': 1, '2-3': 1},
+        },
+    )
+    excerpt_path = self._create_excerpt('test_2')
+    with open(
+        excerpt_path[: -len('.txt')] + '.stats.yaml', encoding='utf-8'
+    ) as f:
+      self.assertEqual(yaml.safe_load(f)['Lines'], 0)
+
+  def test_merge_lines_of_several_devices(self):
+    other_file = os.path.join(self.tmp_dir, 'other.txt')
+    with open(other_file, 'w', encoding='utf-8') as f:
+      f.write('08-09 22:00:03.500  3000  3010 I Receiver: Message received\n')
+    other_ad = mock.MagicMock(name='AndroidDevice', serial='67890')
+    other_ad.services.logcat = logcat.Logcat(other_ad)
+    other_ad.services.logcat.adb_logcat_file_path = other_file
+    self.addCleanup(other_ad.services.logcat.stop)
+    self.ad.services.logcat = self.logcat_service
+
+    merged = logcat.merge_lines(
+        [self.ad, other_ad],
+        since=logcat_processor.LogcatPosition(timestamp='08-09 22:00:03.000'),
+        until=logcat_processor.LogcatPosition(timestamp='08-09 22:00:04.000'),
+    )
+
+    self.assertEqual(
+        [(line.source, line.line.tag) for line in merged],
+        [
+            ('12345', 'DhcpClient'),
+            ('12345', 'BtGatt'),
+            ('67890', 'Receiver'),
+            ('12345', 'DhcpClient'),
+            ('12345', 'WifiService'),
+        ],
+    )
+
+  @mock.patch('mobly.utils.stop_standing_subprocess')
+  @mock.patch('mobly.utils.start_standing_subprocess')
+  def test_direct_pipe_writes_file_and_publishes_lines(
+      self, start_proc_mock, _
+  ):
+    os.remove(self.log_file)
+    start_proc_mock.return_value = mock.Mock(
+        stdout=io.BufferedReader(
+            io.BytesIO(SAMPLE_REALISTIC_LOGCAT.encode('utf-8'))
+        )
+    )
+    self.logcat_service._config = logcat.Config(direct_pipe=True)
+
+    with mock.patch.object(
+        logcat_processor.LogcatProcessor, 'publish', autospec=True
+    ) as publish:
+      self.logcat_service._start()
+      self.logcat_service._stop()
+
+    self.assertNotIn('>>', start_proc_mock.call_args[0][0])
+    with open(self.log_file, encoding='utf-8') as f:
+      self.assertEqual(f.read(), SAMPLE_REALISTIC_LOGCAT)
+    publish.assert_called_once_with(
+        self.logcat_service._processor,
+        0,
+        SAMPLE_REALISTIC_LOGCAT.encode('utf-8'),
+    )
+
+  def test_create_output_excerpts_across_segments(self):
+    os.remove(self.log_file)
+    self.logcat_service._config = logcat.Config(segment_size_bytes=100)
+    writer = logcat_storage.SegmentedFileWriter(self.log_file, 100)
+    self.addCleanup(writer.close)
+    first = SAMPLE_REALISTIC_LOGCAT.encode('utf-8') + b'\n'
+    writer.write(first)
+    writer.flush()
+    self.logcat_service._open_logcat_file()
+    writer.write(first)
+    writer.flush()
+
+    excerpt_path = self._create_excerpt('test_1')
+
+    with open(excerpt_path, 'rb') as f:
+      self.assertEqual(f.read(), first)
+    self.assertEqual(
+        [line.message for line in self.logcat_service.tail(1)],
+        ['Fatal hardware controller error'],
+    )
+    begin, end = self.logcat_service.last_excerpt_range
+    self.assertEqual(
+        len(self.logcat_service.get_lines(since=begin, until=end)),
+        len(self.logcat_service.get_lines(until=begin)),
+    )
+
+  @mock.patch('mobly.utils.stop_standing_subprocess')
+  @mock.patch('mobly.utils.start_standing_subprocess')
+  def test_binary_format_collects_decoded_text(self, start_proc_mock, _):
+    os.remove(self.log_file)
+    # A v4 logger_entry logged at 2026-08-09 22:00:05.150 UTC.
+    payload = b'\x04WifiService\0Connected\0'
+    entry = (
+        struct.pack(
+            '<HHiIIIII',
+            len(payload),
+            28,
+            1000,
+            1010,
+            1786312805,
+            150000000,
+            0,
+            0,
+        )
+        + payload
+    )
+    start_proc_mock.return_value = mock.Mock(
+        stdout=io.BufferedReader(io.BytesIO(entry * 3))
+    )
+    self.ad.adb.shell.return_value = b'+0000\n'
+    self.logcat_service._config = logcat.Config(binary_format=True)
+
+    self.logcat_service._start()
+    self.logcat_service._stop()
+
+    cmd = start_proc_mock.call_args[0][0]
+    self.assertIn(' logcat -B -T ', cmd)
+    self.assertNotIn('>>', cmd)
+    lines = self.logcat_service.get_lines(tag='WifiService')
+    self.assertEqual([line.message for line in lines], ['Connected'] * 3)
+    self.assertEqual(lines[0].timestamp, '08-09 22:00:05.150')
+
 
 if __name__ == '__main__':
   unittest.main()
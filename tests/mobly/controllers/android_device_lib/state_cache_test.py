@@ -0,0 +1,65 @@
+# Copyright 2026 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from mobly.controllers.android_device_lib import state_cache
+
+
+class StateCacheTest(unittest.TestCase):
+  """Unit tests for the state_cache module."""
+
+  def setUp(self):
+    self.now = 100.0
+    self.cache = state_cache.StateCache(clock=lambda: self.now)
+
+  def test_get_caches_until_expired(self):
+    load = mock.Mock(side_effect=[1, 2])
+
+    self.assertEqual(self.cache.get('a', load, 10), 1)
+    self.now += 9
+    self.assertEqual(self.cache.get('a', load, 10), 1)
+    self.now += 1
+    self.assertEqual(self.cache.get('a', load, 10), 2)
+    self.assertEqual(load.call_count, 2)
+
+  def test_invalidate(self):
+    self.cache.get('a', lambda: 1, 10)
+    self.cache.get('b', lambda: 1, 10)
+
+    self.cache.invalidate('a')
+    self.assertEqual(self.cache.get('a', lambda: 2, 10), 2)
+    self.assertEqual(self.cache.get('b', lambda: 2, 10), 1)
+    self.cache.invalidate()
+    self.assertEqual(self.cache.get('b', lambda: 3, 10), 3)
+
+  def test_errors_are_not_cached(self):
+    load = mock.Mock(side_effect=[RuntimeError('offline'), 1])
+
+    with self.assertRaisesRegex(RuntimeError, 'offline'):
+      self.cache.get('a', load, 10)
+    self.assertEqual(self.cache.get('a', load, 10), 1)
+
+  def test_value_loaded_during_invalidation_is_not_stored(self):
+    def load():
+      self.cache.invalidate()
+      return 'stale'
+
+    self.assertEqual(self.cache.get('a', load, 10), 'stale')
+    self.assertEqual(self.cache.get('a', lambda: 'fresh', 10), 'fresh')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -23,6 +23,7 @@ from unittest import mock
 from mobly import runtime_test_info
 from mobly.controllers import android_device
 from mobly.controllers.android_device_lib import adb
+from mobly.controllers.android_device_lib import adb_metrics
 from mobly.controllers.android_device_lib import errors
 from mobly.controllers.android_device_lib import snippet_client_v2
 from mobly.controllers.android_device_lib.services import base_service
@@ -583,6 +584,53 @@ class AndroidDeviceTest(unittest.TestCase):
     ad = android_device.AndroidDevice(serial='1')
     self.assertFalse(ad.is_rootable)
 
+  @mock.patch(
+      'mobly.controllers.android_device_lib.adb.AdbProxy',
+      return_value=mock_android_device.MockAdbProxy('1'),
+  )
+  @mock.patch(
+      'mobly.controllers.android_device_lib.fastboot.FastbootProxy',
+      return_value=mock_android_device.MockFastbootProxy('1'),
+  )
+  @mock.patch(
+      'mobly.controllers.android_device.list_fastboot_devices',
+      return_value=[],
+  )
+  def test_AndroidDevice_state_is_cached_until_invalidated(
+      self, mock_list_fastboot_devices, MockFastboot, MockAdbProxy
+  ):
+    ad = android_device.AndroidDevice(serial='1')
+    with (
+        mock.patch.object(ad.adb, 'shell', return_value=b'2000') as mock_shell,
+        mock.patch.object(
+            ad, 'is_adb_detectable', return_value=True
+        ) as mock_is_adb_detectable,
+    ):
+      for _ in range(3):
+        self.assertFalse(ad.is_bootloader)
+        self.assertFalse(ad.is_adb_root)
+        self.assertTrue(ad.is_rootable)
+      self.assertEqual(mock_shell.call_count, 1)
+      self.assertEqual(mock_is_adb_detectable.call_count, 1)
+      fastboot_calls = mock_list_fastboot_devices.call_count
+
+      mock_shell.return_value = b'0'
+      ad.root_adb()
+      self.assertTrue(ad.is_adb_root)
+      self.assertTrue(ad.is_rootable)
+      self.assertFalse(ad.is_bootloader)
+      self.assertEqual(mock_shell.call_count, 2)
+      self.assertEqual(mock_is_adb_detectable.call_count, 2)
+      self.assertEqual(
+          mock_list_fastboot_devices.call_count, fastboot_calls + 1
+      )
+
+      with ad.handle_usb_disconnect():
+        mock_is_adb_detectable.return_value = False
+        self.assertFalse(ad.is_rootable)
+      mock_is_adb_detectable.return_value = True
+      self.assertTrue(ad.is_rootable)
+
   @mock.patch(
       'mobly.controllers.android_device_lib.adb.AdbProxy',
       return_value=mock_android_device.MockAdbProxy('1'),
@@ -863,6 +911,42 @@ class AndroidDeviceTest(unittest.TestCase):
     filename = ad.generate_filename('MagicLog', time_identifier=mock_test_info)
     self.assertEqual(filename, 'MagicLog,1,fakemodel,test_xyz-1234567')
 
+  @mock.patch(
+      'mobly.controllers.android_device_lib.adb.AdbProxy',
+      return_value=mock_android_device.MockAdbProxy('1'),
+  )
+  @mock.patch(
+      'mobly.controllers.android_device_lib.fastboot.FastbootProxy',
+      return_value=mock_android_device.MockFastbootProxy('1'),
+  )
+  def test_AndroidDevice_create_output_excerpts_saves_adb_metrics(
+      self, MockFastboot, MockAdbProxy
+  ):
+    ad = android_device.AndroidDevice(serial='1')
+    metrics = adb_metrics.get_metrics()
+    self.addCleanup(metrics.reset)
+    metrics.record('1', ['adb', '-s', '1', 'root'], 0.1, 0)
+    android_device._start_services_on_ads([ad])
+    self.addCleanup(ad.services.stop_all)
+    metrics.record('1', ['adb', '-s', '1', 'install', 'a.apk'], 0.5, 0)
+    mock_record = mock.MagicMock(
+        test_name='test_xyz', begin_time='1234567', signature='test_xyz-1234567'
+    )
+    test_info = runtime_test_info.RuntimeTestInfo(
+        mock_record.test_name, self.tmp_dir, mock_record
+    )
+
+    excerpts = ad.services.create_output_excerpts_all(test_info)
+
+    expected_path = os.path.join(
+        test_info.output_path,
+        'adb_metrics,1,fakemodel,test_xyz-1234567.yaml',
+    )
+    self.assertEqual(excerpts['adb_metrics'], [expected_path])
+    with open(expected_path, 'r') as f:
+      summary = yaml.safe_load(f)
+    self.assertEqual(list(summary['Commands']), ['install'])
+
   @mock.patch(
       'mobly.controllers.android_device_lib.adb.AdbProxy',
       return_value=mock_android_device.MockAdbProxy('1'),